@@ -0,0 +1,129 @@
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+from tqdm import tqdm
+from logic.synthetic_corpus import SyntheticCorpus
+from logic.utils import Utils
+from root import DIR_BENCHMARK
+
+
+class Benchmark(object):
+    """
+    Per-stage timings of the feature extraction pipeline.
+
+    Every stage is timed on its own for each author document and reported
+    as throughput (documents per second) and p50/p95/p99 latency in
+    milliseconds. Inputs of a stage are prepared outside of its timer, so a
+    stage never pays for the ones before it.
+    """
+    stages = ['clean_text', 'spacy_parse', 'syllabification', 'transliteration', 'embedding_pooling',
+              'lexical_features', 'senticnet_polarity', 'predict']
+
+    def __init__(self, lang: str = 'es', features=None, clf=None, type_features: list = [1, 1, 1, 1]):
+        self.lang = lang
+        self.features = features
+        self.clf = clf
+        self.type_features = type_features
+        self.timings = {stage: [] for stage in self.stages}
+
+    @staticmethod
+    def summary(times: list, n_items: int = None):
+        times = np.array(times, dtype=np.float64)
+        if len(times) == 0:
+            return {'count': 0}
+        total = float(np.sum(times))
+        n_items = len(times) if n_items is None else n_items
+        return {'count': int(len(times)),
+                'total_sec': round(total, 6),
+                'throughput': round(n_items / total, 3) if total > 0 else None,
+                'p50_ms': round(float(np.percentile(times, 50)) * 1000, 3),
+                'p95_ms': round(float(np.percentile(times, 95)) * 1000, 3),
+                'p99_ms': round(float(np.percentile(times, 99)) * 1000, 3)}
+
+    @staticmethod
+    def timed(func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        return result, time.perf_counter() - start
+
+    def pooling(self, list_phonetic):
+        model = self.features.syllable_embedding
+        vectors = [model.wv[s] for s in list_phonetic if s in model.wv.vocab]
+        if len(vectors) == 0:
+            return np.zeros(model.vector_size, dtype=np.float32)
+        return np.sum(np.array(vectors, dtype=np.float32), axis=0) / (len(vectors) + 1)
+
+    def run_document(self, raw: str):
+        ta = self.features.ta
+        timings = self.timings
+        text, t = self.timed(ta.clean_text, raw, stopwords=False)
+        timings['clean_text'].append(t)
+        if text is None:
+            return
+        # Syllables are left out of the parse, they are timed on their own below
+        doc, t = self.timed(ta.analysis_pipe, text, disable=('syllables',))
+        timings['spacy_parse'].append(t)
+        syllables_pipe = ta.nlp.get_pipe('syllables')
+        doc, t = self.timed(syllables_pipe, doc)
+        timings['syllabification'].append(t)
+        list_syllable = [s for token in doc if token._.syllables is not None for s in token._.syllables]
+        list_phonetic, t = self.timed(
+            lambda items: [self.features.epi.transliterate(s, normpunc=True) for s in items], list_syllable)
+        timings['transliteration'].append(t)
+        _, t = self.timed(self.pooling, list_phonetic)
+        timings['embedding_pooling'].append(t)
+        _, t = self.timed(self.features.get_features_lexical, text)
+        timings['lexical_features'].append(t)
+        _, t = self.timed(self.features.lsn.polarity_text, text)
+        timings['senticnet_polarity'].append(t)
+        if self.clf is not None:
+            x = [list(self.features.get_features(text, self.type_features))]
+            _, t = self.timed(self.clf.predict, x)
+            timings['predict'].append(t)
+
+    def run(self, corpus: SyntheticCorpus, name: str = None):
+        result = None
+        try:
+            self.timings = {stage: [] for stage in self.stages}
+            start = time.perf_counter()
+            for row in tqdm(corpus.get_data()):
+                self.run_document(row['content'])
+            wall = time.perf_counter() - start
+            result = {'name': name if name is not None else 'features_{0}'.format(self.lang),
+                      'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                      'python': sys.version.split()[0],
+                      'platform': platform.platform(),
+                      'corpus': {'lang': corpus.lang, 'n_authors': corpus.n_authors, 'n_tweets': corpus.n_tweets,
+                                 'tweet_length': corpus.tweet_length, 'seed': corpus.seed},
+                      'wall_sec': round(wall, 3),
+                      'stages': {stage: self.summary(times) for stage, times in self.timings.items()}}
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error Benchmark: {0}'.format(e))
+        return result
+
+    @staticmethod
+    def save(result: dict, file: str = None):
+        os.makedirs(DIR_BENCHMARK, exist_ok=True)
+        if file is None:
+            file = '{0}{1}_{2}.json'.format(DIR_BENCHMARK, result['name'],
+                                            datetime.datetime.now().strftime('%Y%m%d%H%M%S'))
+        with open(file, 'w', encoding='utf-8') as output:
+            json.dump(result, output, indent=2)
+        return file
+
+    @staticmethod
+    def report(result: dict):
+        print('-' * 78)
+        print('{0:<22}{1:>8}{2:>12}{3:>12}{4:>12}{5:>12}'.format('Stage', 'Count', 'Docs/sec',
+                                                                   'p50 ms', 'p95 ms', 'p99 ms'))
+        for stage, row in result['stages'].items():
+            if row['count'] > 0:
+                print('{0:<22}{1:>8}{2:>12}{3:>12}{4:>12}{5:>12}'.format(stage, row['count'], row['throughput'],
+                                                                           row['p50_ms'], row['p95_ms'],
+                                                                           row['p99_ms']))
+        print('-' * 78)
@@ -0,0 +1,49 @@
+from spacy.tokens import Token
+from spacy_syllables import SpacySyllables
+from logic.lru_cache import LRUCache
+
+_MISSING = object()
+
+
+class CachedSpacySyllables(SpacySyllables):
+    """
+    Drop-in replacement of the SpacySyllables pipeline component.
+
+    Hyphenation is memoized per word type in a bounded LRU cache that can be
+    warm started from (and saved to) disk. It sets the same token._.syllables
+    and token._.syllables_count attributes.
+    """
+    name = 'syllables'
+
+    def __init__(self, nlp, cache_size: int = 200000, cache_file: str = None, metrics=None):
+        super().__init__(nlp)
+        self.name = 'syllables'
+        self.cache = LRUCache(maxsize=cache_size, name='syllables')
+        self.cache_file = cache_file
+        self.metrics = metrics
+        Token.set_extension('syllables', default=None, force=True)
+        Token.set_extension('syllables_count', default=None, force=True)
+        if cache_file is not None:
+            self.cache.load(cache_file, converter=lambda value: tuple(value) if value is not None else None)
+
+    def syllables(self, word):
+        value = self.cache.get(word, _MISSING)
+        if value is _MISSING:
+            value = super().syllables(word)
+            value = self.cache.put(word, tuple(value) if value is not None else None)
+        return list(value) if value is not None else None
+
+    def __call__(self, doc):
+        hits, misses = self.cache.hits, self.cache.misses
+        for token in doc:
+            syllables = self.syllables(token.text)
+            if syllables:
+                token._.set('syllables', syllables)
+                token._.set('syllables_count', len(syllables))
+        if self.metrics is not None:
+            self.metrics.cache('syllables', hits=self.cache.hits - hits, misses=self.cache.misses - misses)
+        return doc
+
+    def save(self, file: str = None):
+        file = file if file is not None else self.cache_file
+        return self.cache.save(file) if file is not None else None
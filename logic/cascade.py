@@ -0,0 +1,134 @@
+import sys
+import numpy as np
+from scipy import sparse as sp
+from sklearn.model_selection import StratifiedKFold, cross_val_predict
+from logic.utils import Utils
+
+
+class CascadeClassifier(object):
+    """
+    Two-stage cost-aware classifier.
+
+    A first model on cheap features (lexical counts without SenticNet
+    polarity and phoneme frequency by default) labels the authors it is
+    confident about; only the rest are escalated to the model trained on
+    the full feature set. The probability thresholds (low, high) are tuned
+    on out-of-fold predictions so that the cascade loses at most
+    max_accuracy_loss accuracy against the full model alone.
+
+    The cheap stage skips the dependency parse. Escalated authors reuse
+    their cheap columns; only the missing feature groups (and the polarity
+    column) are computed, from one full parse per author.
+    """
+
+    def __init__(self, cheap_clf, full_clf, cheap_features: list = [0, 1, 0, 1], full_features: list = [1, 1, 1, 1],
+                 max_accuracy_loss: float = 0.01, cheap_polarity: bool = False):
+        self.cheap_clf = cheap_clf
+        self.full_clf = full_clf
+        self.cheap_features = cheap_features
+        self.full_features = full_features
+        self.max_accuracy_loss = max_accuracy_loss
+        self.cheap_polarity = cheap_polarity
+        self.low = 0.0
+        self.high = 1.0
+        self.training = {}
+        self.stages = {'cheap': 0, 'full': 0}
+
+    def fit(self, x_cheap, x_full, y, cv: int = 5, random_state: int = 42):
+        try:
+            folds = StratifiedKFold(n_splits=cv, shuffle=True, random_state=random_state)
+            proba = cross_val_predict(self.cheap_clf, x_cheap, y, cv=folds, method='predict_proba')[:, 1]
+            full = cross_val_predict(self.full_clf, x_full, y, cv=folds)
+            self.tune(proba, full, y)
+            self.cheap_clf.fit(x_cheap, y)
+            self.full_clf.fit(x_full, y)
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error CascadeClassifier fit: {0}'.format(e))
+            raise
+        return self
+
+    def tune(self, proba, full_predict, y):
+        # Widest pair of thresholds whose cascade accuracy stays within max_accuracy_loss of the full model
+        y = np.asarray(y)
+        accuracy_full = float(np.mean(full_predict == y))
+        candidates = np.unique(np.concatenate([[0.0, 0.5, 1.0], np.quantile(proba, np.linspace(0, 1, 101))]))
+        lows = candidates[candidates <= 0.5]
+        highs = candidates[candidates >= 0.5]
+        best = (0.0, 1.0, 0.0, accuracy_full)
+        for low in lows:
+            negative = proba <= low
+            for high in highs:
+                positive = (proba >= high) & ~negative
+                decided = negative | positive
+                cascade = np.where(negative, 0, np.where(positive, 1, full_predict))
+                accuracy = float(np.mean(cascade == y))
+                coverage = float(np.mean(decided))
+                if accuracy >= accuracy_full - self.max_accuracy_loss and coverage > best[2]:
+                    best = (float(low), float(high), coverage, accuracy)
+        self.low, self.high = best[0], best[1]
+        self.training = {'low': self.low, 'high': self.high, 'accuracy_full': round(accuracy_full, 4),
+                         'accuracy_cascade': round(best[3], 4), 'cheap_rate': round(best[2], 4),
+                         'escalation_rate': round(1 - best[2], 4)}
+        print('Cascade thresholds: {0}'.format(self.training))
+        return self
+
+    def decide(self, x_cheap):
+        # Labels of the first stage and the mask of the authors it is confident about
+        proba = self.cheap_clf.predict_proba(x_cheap)[:, 1]
+        confident = (proba <= self.low) | (proba >= self.high)
+        return (proba >= self.high).astype(int), confident
+
+    def predict_messages(self, features, list_messages: list, sparse: bool = False):
+        x_cheap = features.transform_batch(list_messages, self.cheap_features, sparse=sparse,
+                                           polarity=self.cheap_polarity)
+        labels, confident = self.decide(x_cheap)
+        escalate = np.flatnonzero(~confident)
+        if len(escalate) > 0:
+            x_full = self.escalate_features(features, [list_messages[i] for i in escalate], x_cheap[escalate],
+                                            sparse=sparse)
+            labels[escalate] = self.full_clf.predict(x_full)
+        self.stages['cheap'] += int(np.sum(confident))
+        self.stages['full'] += len(escalate)
+        return labels
+
+    def escalate_features(self, features, list_messages: list, x_cheap, sparse: bool = False):
+        # Full feature rows from the cheap rows plus the groups the cheap stage did not compute,
+        # same values and layout as transform_batch(list_messages, full_features)
+        cheap_schema = features.schema(self.cheap_features)
+        full_schema = features.schema(self.full_features)
+        missing = [0, 0, 0, 0]
+        for group in full_schema.offsets:
+            if group not in cheap_schema.offsets:
+                missing[full_schema.type_index[group]] = 1
+        polarity = full_schema.enabled('lexical') and not self.cheap_polarity
+        x_missing = None
+        if any(missing):
+            docs = [features.parse(message, count=False) for message in list_messages]
+            x_missing = features.transform_batch(list_messages, missing, sparse=sparse, docs=docs)
+        missing_schema = features.schema(missing)
+        blocks = []
+        for group in full_schema.offsets:
+            if group in cheap_schema.offsets:
+                block = x_cheap[:, cheap_schema.slice(group)]
+            else:
+                block = x_missing[:, missing_schema.slice(group)]
+            if group == 'lexical' and polarity:
+                # Rows left at zero had no tokens, get_features_lexical gives them no polarity either
+                block = block.toarray() if sp.issparse(block) else np.array(block)
+                column = full_schema.lexical_names.index('plarity')
+                for i in np.flatnonzero(np.any(block != 0, axis=1)):
+                    block[i, column] = abs(features.polarity(list_messages[i]))
+                block = sp.csr_matrix(block) if sparse else block
+            blocks.append(block)
+        if sparse:
+            return sp.hstack(blocks, format='csr', dtype=np.float32)
+        return np.ascontiguousarray(np.hstack(blocks), dtype=np.float32)
+
+    def report(self):
+        total = self.stages['cheap'] + self.stages['full']
+        rate = self.stages['full'] / total if total > 0 else 0.0
+        print('Cascade: {0} authors, {1} decided by the cheap stage, {2} escalated ({3:.2%})'.format(
+            total, self.stages['cheap'], self.stages['full'], rate))
+        return {'authors': total, 'cheap': self.stages['cheap'], 'full': self.stages['full'],
+                'escalation_rate': round(rate, 4)}
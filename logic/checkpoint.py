@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+import shutil
+import joblib
+from logic.feature_shards import FeatureShards
+from root import DIR_CHECKPOINTS
+
+
+class Checkpoint(object):
+    """
+    Resumable state of a training run.
+
+    The directory is named after the run options, so a resumed run only reuses
+    work done with the same settings. Features are kept as FeatureShards,
+    results as JSON and fitted estimators with joblib; every file is written
+    to a temporary name and moved into place.
+    """
+
+    def __init__(self, name: str, params: dict, path_dir: str = None):
+        self.params = params
+        key = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        self.path_dir = path_dir if path_dir is not None else '{0}{1}_{2}{3}'.format(DIR_CHECKPOINTS, name, key,
+                                                                                  os.sep)
+
+    def exists(self):
+        return os.path.isdir(self.path_dir)
+
+    def start(self, resume: bool = False):
+        if not resume and self.exists():
+            shutil.rmtree(self.path_dir)
+        os.makedirs(self.path_dir, exist_ok=True)
+        self.save_json('params', self.params)
+        return self
+
+    def shards(self, schema=None, sparse: bool = False):
+        path_dir = '{0}features{1}'.format(self.path_dir, os.sep)
+        if FeatureShards.exists('features', path_dir=path_dir):
+            return FeatureShards.load('features', path_dir=path_dir)
+        return FeatureShards('features', path_dir=path_dir).create(schema, sparse=sparse)
+
+    def load_json(self, name: str, default=None):
+        file = '{0}{1}.json'.format(self.path_dir, name)
+        if not os.path.isfile(file):
+            return default
+        with open(file, 'r', encoding='utf-8') as data:
+            return json.load(data)
+
+    def save_json(self, name: str, value):
+        file = '{0}{1}.json'.format(self.path_dir, name)
+        with open(file + '.tmp', 'w', encoding='utf-8') as output:
+            json.dump(value, output, indent=2)
+        os.replace(file + '.tmp', file)
+        return file
+
+    def has(self, name: str):
+        return os.path.isfile('{0}{1}.joblib'.format(self.path_dir, name))
+
+    def dump(self, value, name: str):
+        file = '{0}{1}.joblib'.format(self.path_dir, name)
+        joblib.dump(value, file + '.tmp')
+        os.replace(file + '.tmp', file)
+        return file
+
+    def load(self, name: str):
+        return joblib.load('{0}{1}.joblib'.format(self.path_dir, name))
@@ -1,10 +1,11 @@
 import multiprocessing
+import sklearn
 from sklearn.ensemble import RandomForestClassifier, BaggingClassifier, AdaBoostClassifier, GradientBoostingClassifier
 from sklearn.naive_bayes import MultinomialNB, GaussianNB
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.neural_network import MLPClassifier
 from sklearn.tree import DecisionTreeClassifier
-from sklearn.linear_model import LogisticRegression
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.svm import SVC
 
 
@@ -18,4 +19,27 @@ class Classifiers(object):
     dict_classifiers['DecisionTree'] = DecisionTreeClassifier()
     dict_classifiers['Bagging'] = BaggingClassifier(n_estimators=20, random_state=42)
     dict_classifiers['GradientBoosting'] = GradientBoostingClassifier(n_estimators=20, random_state=7)
-    dict_classifiers['AdaBoost'] = AdaBoostClassifier(n_estimators=20, random_state=7)
\ No newline at end of file
+    dict_classifiers['AdaBoost'] = AdaBoostClassifier(n_estimators=20, random_state=7)
+    # Classifiers trained directly on the scipy.sparse CSR feature matrix
+    accept_sparse = {'SVM', 'LogisticRegression', 'RandomForest', 'DecisionTree', 'Bagging', 'GradientBoosting',
+                     'AdaBoost', 'MultinomialNB', 'KNeighbors', 'MLP'}
+    # Incremental learners (partial_fit) for the out-of-core training over feature shards
+    loss_log = 'log_loss' if tuple(int(i) for i in sklearn.__version__.split('.')[:2]) >= (1, 1) else 'log'
+    dict_incremental = dict()
+    dict_incremental['SGDLogistic'] = SGDClassifier(loss=loss_log, alpha=1e-4, random_state=42)
+    dict_incremental['MultinomialNB'] = MultinomialNB()
+    dict_incremental['MLP'] = MLPClassifier(hidden_layer_sizes=(100,), batch_size=256, learning_rate_init=0.01,
+                                            random_state=42)
+    # Incremental learners trained on max-abs scaled features
+    scaled = {'SGDLogistic', 'MLP'}
+    # Parameter spaces of the successive-halving search (HyperparameterSearch)
+    param_spaces = dict()
+    param_spaces['LogisticRegression'] = {'C': [0.01, 0.1, 1, 10, 100], 'class_weight': [None, 'balanced']}
+    param_spaces['RandomForest'] = {'n_estimators': [50, 100, 200, 400], 'max_depth': [None, 10, 20],
+                                    'max_features': ['sqrt', 0.3], 'min_samples_leaf': [1, 2, 5]}
+    param_spaces['DecisionTree'] = {'max_depth': [None, 5, 10, 20], 'min_samples_leaf': [1, 2, 5, 10],
+                                    'criterion': ['gini', 'entropy']}
+    param_spaces['Bagging'] = {'n_estimators': [10, 20, 50], 'max_samples': [0.5, 1.0], 'max_features': [0.5, 1.0]}
+    param_spaces['GradientBoosting'] = {'n_estimators': [20, 50, 100, 200], 'learning_rate': [0.05, 0.1, 0.2],
+                                        'max_depth': [2, 3, 4], 'subsample': [0.8, 1.0]}
+    param_spaces['AdaBoost'] = {'n_estimators': [20, 50, 100, 200], 'learning_rate': [0.1, 0.5, 1.0]}
@@ -0,0 +1,156 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import numpy as np
+from logic.utils import Utils
+from root import DIR_CACHE
+
+
+class CorpusSnapshot(object):
+    """
+    Parsed PAN author directory kept in a memory-mapped binary file.
+
+    <path_dir>/data.bin  per author its id and its tweets joined with new lines, UTF-8 prefixed by the uint32 length
+    <path_dir>/tweets.npy  offset in data.bin where every tweet starts, authors after each other
+    <path_dir>/authors.npy  per author: offset of the id, offset of the content, first tweet, tweets, label (-1 without)
+    <path_dir>/manifest.json  size and mtime of the directory and of every xml/txt file, written last
+
+    The snapshot is valid while the manifest matches the directory, which
+    only needs a stat per file. Authors are kept in file name order; the
+    content of an author is decoded at once and its tweets are slices of it.
+    """
+    format_version = 1
+    header = struct.Struct('<I')
+
+    def __init__(self, path_input: str, path_dir: str = None):
+        self.path_input = path_input
+        if path_dir is None:
+            parts = os.path.normpath(path_input).split(os.sep)
+            path_dir = '{0}corpus{1}{2}_{3}{1}'.format(DIR_CACHE, os.sep, parts[-2], parts[-1])
+        self.path_dir = path_dir
+        self.authors = None
+        self.tweets = None
+        self.users = None
+        self._file = None
+        self._data = None
+
+    def file(self, name: str):
+        return self.path_dir + name
+
+    def stamp(self):
+        stat = os.stat(self.path_input)
+        files = {}
+        for entry in os.scandir(self.path_input):
+            if entry.name.endswith('.xml') or entry.name.endswith('.txt'):
+                stat_file = entry.stat()
+                files[entry.name] = [stat_file.st_size, stat_file.st_mtime_ns]
+        return {'format_version': self.format_version, 'path': os.path.abspath(self.path_input),
+                'mtime_ns': stat.st_mtime_ns, 'files': files}
+
+    def valid(self, stamp: dict = None):
+        try:
+            with open(self.file('manifest.json'), 'r', encoding='utf-8') as data:
+                manifest = json.load(data)
+            return manifest == (stamp if stamp is not None else self.stamp())
+        except (OSError, ValueError):
+            return False
+
+    def build(self, authors, stamp: dict):
+        # authors: (user, list of tweets, label or None) in the order to keep
+        os.makedirs(self.path_dir, exist_ok=True)
+        if os.path.isfile(self.file('manifest.json')):
+            os.remove(self.file('manifest.json'))
+        tmp = '.{0}.tmp'.format(os.getpid())
+        offsets_tweets = []
+        rows = []
+        offset = 0
+        with open(self.file('data.bin' + tmp), 'wb') as output:
+            def write(data):
+                nonlocal offset
+                output.write(self.header.pack(len(data)))
+                output.write(data)
+                start = offset
+                offset += self.header.size + len(data)
+                return start
+            for user, tweets, label in authors:
+                tweets = [(tweet if tweet is not None else '').encode('utf-8') for tweet in tweets]
+                row = [write(user.encode('utf-8')), write(b'\n'.join(tweets)), len(offsets_tweets), len(tweets),
+                       -1 if label is None else int(label)]
+                start = row[1] + self.header.size
+                for tweet in tweets:
+                    offsets_tweets.append(start)
+                    start += len(tweet) + 1
+                rows.append(row)
+        with open(self.file('tweets.npy' + tmp), 'wb') as output:
+            np.save(output, np.array(offsets_tweets, dtype=np.int64), allow_pickle=False)
+        with open(self.file('authors.npy' + tmp), 'wb') as output:
+            np.save(output, np.array(rows, dtype=np.int64).reshape(-1, 5), allow_pickle=False)
+        for name in ['data.bin', 'tweets.npy', 'authors.npy']:
+            os.replace(self.file(name + tmp), self.file(name))
+        with open(self.file('manifest.json' + tmp), 'w', encoding='utf-8') as output:
+            json.dump(stamp, output)
+        os.replace(self.file('manifest.json' + tmp), self.file('manifest.json'))
+        return self
+
+    def open(self):
+        self.close()
+        self.authors = np.load(self.file('authors.npy'), allow_pickle=False).tolist()
+        self.tweets = np.load(self.file('tweets.npy'), mmap_mode='r', allow_pickle=False)
+        self._file = open(self.file('data.bin'), 'rb')
+        # mmap of an empty file is not allowed
+        empty = os.path.getsize(self.file('data.bin')) == 0
+        self._data = b'' if empty else mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.users = {self.text(row[0]): i for i, row in enumerate(self.authors)}
+        return self
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._data = None
+
+    def text(self, offset: int):
+        size, = self.header.unpack_from(self._data, offset)
+        start = offset + self.header.size
+        return self._data[start:start + size].decode('utf-8')
+
+    def __len__(self):
+        return len(self.authors)
+
+    def author(self, i: int):
+        # (user, content, label or None)
+        user_offset, content_offset, _, _, label = self.authors[i]
+        return self.text(user_offset), self.text(content_offset), None if label < 0 else label
+
+    def author_tweets(self, i: int):
+        # (user, list of tweets, label or None)
+        user_offset, content_offset, first, count, label = self.authors[i]
+        size, = self.header.unpack_from(self._data, content_offset)
+        starts = self.tweets[first:first + count].tolist()
+        ends = [start - 1 for start in starts[1:]] + [content_offset + self.header.size + size]
+        tweets = [self._data[start:end].decode('utf-8') for start, end in zip(starts, ends)]
+        return self.text(user_offset), tweets, None if label < 0 else label
+
+    def __iter__(self):
+        for i in range(len(self.authors)):
+            yield self.author(i)
+
+    @classmethod
+    def load(cls, path_input: str, parse, path_dir: str = None):
+        # Opens a valid snapshot, otherwise parses the directory with parse() and writes it first
+        snapshot = cls(path_input, path_dir)
+        try:
+            stamp = snapshot.stamp()
+            if not snapshot.valid(stamp):
+                print('Building corpus snapshot in {0}'.format(snapshot.path_dir))
+                snapshot.build(parse(), stamp)
+            return snapshot.open()
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error CorpusSnapshot load: {0}'.format(e))
+            snapshot.close()
+            return None
@@ -0,0 +1,255 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import zlib
+from collections import OrderedDict
+from root import DIR_CACHE
+
+
+class ChunkedReader(object):
+    """
+    Streaming reader of tweet level files with the interface of DataTransformation.
+
+    The file holds one row per tweet (author id, text, optional label and
+    language) and is read in chunks of chunk_size rows. Rows are grouped by
+    author without loading the whole file: while the authors seen so far hold
+    less than memory_rows tweets they are grouped in memory, beyond that the
+    tweets are spilled to bucket files by a hash of the author id and every
+    bucket is grouped on its own. With grouped=True the file is assumed to
+    keep the tweets of an author contiguous and is read in a single pass.
+
+    iter_data yields {'user', 'content'} per author, plus 'value' for
+    training data and 'lang' when lang_field is set; content joins the tweets
+    with new lines as the PAN XML reader does. iter_tweets yields the list of
+    tweets in 'tweets' instead of 'content'. Authors come out in order of
+    first appearance within a bucket.
+    """
+    extension = None
+
+    def __init__(self, file: str, type_data: str = 'train', user_field: str = 'author_id', text_field: str = 'text',
+                 label_field: str = 'label', lang_field: str = None, truth: dict = None, chunk_size: int = 50000,
+                 memory_rows: int = 1000000, buckets: int = 64, grouped: bool = False, tmp_dir: str = None):
+        self.file = file
+        self.type_data = type_data
+        self.user_field = user_field
+        self.text_field = text_field
+        self.label_field = label_field
+        self.lang_field = lang_field
+        self.truth = truth
+        self.chunk_size = chunk_size
+        self.memory_rows = memory_rows
+        self.buckets = buckets
+        self.grouped = grouped
+        self.tmp_dir = tmp_dir if tmp_dir is not None else DIR_CACHE
+
+    @property
+    def source(self):
+        # Identifies the input in checkpoints
+        stat = os.stat(self.file)
+        return '{0}:{1}:{2}'.format(os.path.abspath(self.file), stat.st_size, stat.st_mtime_ns)
+
+    @property
+    def columns(self):
+        columns = [self.user_field, self.text_field]
+        if self.type_data == 'train' and self.truth is None:
+            columns.append(self.label_field)
+        if self.lang_field is not None:
+            columns.append(self.lang_field)
+        return columns
+
+    def chunks(self):
+        # Lists of row dicts with at least the columns above
+        raise NotImplementedError
+
+    def tweets(self):
+        for chunk in self.chunks():
+            for row in chunk:
+                user = row.get(self.user_field)
+                text = row.get(self.text_field)
+                if user is None or text is None:
+                    continue
+                tweet = [str(user), str(text), None, None]
+                if self.type_data == 'train' and self.truth is None:
+                    tweet[2] = row.get(self.label_field)
+                if self.lang_field is not None:
+                    tweet[3] = row.get(self.lang_field)
+                yield tweet
+
+    def author(self, user: str, tweets: list, split: bool = False):
+        if split:
+            row = {'user': user, 'tweets': [tweet[1] for tweet in tweets]}
+        else:
+            row = {'user': user, 'content': '\n'.join(tweet[1] for tweet in tweets)}
+        if self.type_data == 'train':
+            value = self.truth.get(user) if self.truth is not None else next(
+                (tweet[2] for tweet in tweets if tweet[2] is not None and tweet[2] != ''), None)
+            if value is None:
+                return None
+            row['value'] = 1 if int(float(value)) == 1 else 0
+        if self.lang_field is not None:
+            row['lang'] = tweets[0][3]
+        return row
+
+    def iter_data(self, files: list = None, split: bool = False):
+        # files restricts the output to those authors, xml file names as in DataTransformation
+        users = {i.replace('.xml', '') for i in files} if files is not None else None
+        groups = self.iter_contiguous() if self.grouped else self.iter_grouped()
+        for user, tweets in groups:
+            if users is not None and user not in users:
+                continue
+            row = self.author(user, tweets, split=split)
+            if row is not None:
+                yield row
+
+    def iter_tweets(self, files: list = None):
+        return self.iter_data(files, split=True)
+
+    def iter_contiguous(self):
+        user, tweets = None, []
+        for tweet in self.tweets():
+            if tweet[0] != user and tweets:
+                yield user, tweets
+                tweets = []
+            user = tweet[0]
+            tweets.append(tweet)
+        if tweets:
+            yield user, tweets
+
+    def iter_grouped(self):
+        groups = OrderedDict()
+        count = 0
+        spill = None
+        try:
+            for tweet in self.tweets():
+                if spill is not None:
+                    spill.write(tweet)
+                    continue
+                groups.setdefault(tweet[0], []).append(tweet)
+                count += 1
+                if count >= self.memory_rows:
+                    spill = BucketSpill(self.buckets, self.tmp_dir)
+                    for tweets in groups.values():
+                        for item in tweets:
+                            spill.write(item)
+                    groups = None
+            if spill is None:
+                for user, tweets in groups.items():
+                    yield user, tweets
+                return
+            spill.close()
+            for bucket in range(self.buckets):
+                for user, tweets in spill.read(bucket).items():
+                    yield user, tweets
+        finally:
+            if spill is not None:
+                spill.remove()
+
+    def get_data(self):
+        # Same result as DataTransformation.get_data: a list of rows for training, user -> content otherwise
+        if self.type_data == 'train':
+            return list(self.iter_data())
+        return {row['user']: row['content'] for row in self.iter_data()}
+
+
+class BucketSpill(object):
+    """
+    Tweets partitioned on disk by a stable hash of the author id, one JSONL file per bucket.
+    """
+
+    def __init__(self, buckets: int, tmp_dir: str):
+        os.makedirs(tmp_dir, exist_ok=True)
+        self.path_dir = tempfile.mkdtemp(prefix='reader_', dir=tmp_dir)
+        self.buckets = buckets
+        self.handles = [open(self.file(i), 'w', encoding='utf-8') for i in range(buckets)]
+
+    def file(self, bucket: int):
+        return os.path.join(self.path_dir, 'bucket_{0:05d}.jsonl'.format(bucket))
+
+    def write(self, tweet: list):
+        bucket = zlib.crc32(tweet[0].encode('utf-8')) % self.buckets
+        self.handles[bucket].write(json.dumps(tweet, ensure_ascii=False) + '\n')
+
+    def close(self):
+        for handle in self.handles:
+            handle.close()
+        self.handles = []
+
+    def read(self, bucket: int):
+        groups = OrderedDict()
+        with open(self.file(bucket), 'r', encoding='utf-8') as data:
+            for line in data:
+                tweet = json.loads(line)
+                groups.setdefault(tweet[0], []).append(tweet)
+        return groups
+
+    def remove(self):
+        self.close()
+        shutil.rmtree(self.path_dir, ignore_errors=True)
+
+
+class JsonlReader(ChunkedReader):
+    extension = '.jsonl'
+
+    def chunks(self):
+        chunk = []
+        with open(self.file, 'r', encoding='utf-8') as data:
+            for number, line in enumerate(data):
+                if not line.strip():
+                    continue
+                try:
+                    chunk.append(json.loads(line))
+                except ValueError as e:
+                    print('Error JsonlReader {0} line {1}: {2}'.format(self.file, number + 1, e))
+                    continue
+                if len(chunk) == self.chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+
+class CsvReader(ChunkedReader):
+    extension = '.csv'
+
+    def __init__(self, file: str, delimiter: str = ',', **kwargs):
+        super().__init__(file, **kwargs)
+        self.delimiter = delimiter
+
+    def chunks(self):
+        chunk = []
+        csv.field_size_limit(2 ** 31 - 1)
+        with open(self.file, 'r', encoding='utf-8', newline='') as data:
+            for row in csv.DictReader(data, delimiter=self.delimiter):
+                chunk.append(row)
+                if len(chunk) == self.chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+
+class ParquetReader(ChunkedReader):
+    extension = '.parquet'
+
+    def chunks(self):
+        # pyarrow is only needed for Parquet input
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('ParquetReader requires pyarrow: pip install pyarrow')
+        parquet = pq.ParquetFile(self.file)
+        columns = [i for i in self.columns if i in parquet.schema_arrow.names]
+        for batch in parquet.iter_batches(batch_size=self.chunk_size, columns=columns):
+            yield batch.to_pylist()
+
+
+def open_reader(file: str, **kwargs):
+    # Reader by file extension
+    for reader in [JsonlReader, CsvReader, ParquetReader]:
+        if file.endswith(reader.extension):
+            return reader(file, **kwargs)
+    if file.endswith('.json'):
+        return JsonlReader(file, **kwargs)
+    raise ValueError('Input format not supported: {0}'.format(file))
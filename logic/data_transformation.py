@@ -1,36 +1,45 @@
+import hashlib
+import json
 import os
 from os import listdir
 from os.path import isfile
 from os import scandir
 import xml.etree.ElementTree as ET
 from sys import path
+from logic.corpus_snapshot import CorpusSnapshot
 from root import DIR_INPUT
 
 
 class DataTransformation(object):
 
     def __init__(self, dataset: str = 'pan21-author-profiling-training-2021-03-14',
-                 lang: str = 'es', type_data: str = 'train'):
+                 lang: str = 'es', type_data: str = 'train', snapshot: bool = True, snapshot_dir: str = None):
         self.dataset = dataset
         self.type_data = type_data
         self.path_dir = '{0}{1}{2}{1}{3}{1}'.format(DIR_INPUT, os.sep, dataset, lang)
+        # Parsed authors are kept in a CorpusSnapshot, rebuilt when the directory changes
+        # snapshot_dir: where the snapshot is kept, DIR_CACHE/corpus/<dataset>_<lang>/ by default
+        self.snapshot = snapshot
+        self.snapshot_dir = snapshot_dir
+        self._snapshot = None
+
+    @property
+    def source(self):
+        # Identifies the corpus content in checkpoints: digest of the size and mtime of every author and truth file
+        stamp = CorpusSnapshot(self.path_dir).stamp()
+        digest = hashlib.sha1(json.dumps(stamp, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        return '{0}:{1}'.format(os.path.abspath(self.path_dir), digest)
 
     def get_data(self):
         out_put = []
         # Get all the names of the files in the path
         user_tweets = {}
         truth_file = ''
-        # r=root, d=directories, f = files
-        for r, d, f in os.walk(self.path_dir):
-            for file in f:
-                if file.endswith(".xml"):
-                    tree = ET.parse('{0}{1}'.format(self.path_dir, file))
-                    root = tree.getroot()
-                    list_content = [i.text for i in root.iter('document')]
-                    content = '\n'.join(list_content)
-                    user_tweets[file.replace('.xml', '')] = content
-                elif file.endswith(".txt"):
-                    truth_file = file
+        for user, content, _ in self.authors():
+            user_tweets[user] = content
+        for file in os.listdir(self.path_dir):
+            if file.endswith(".txt"):
+                truth_file = file
 
         if self.type_data == 'train':
             with open(self.path_dir + truth_file, 'r+', encoding="utf-8") as file:
@@ -48,6 +57,70 @@ class DataTransformation(object):
         else:
             return user_tweets
 
+    def iter_data(self, files: list = None):
+        # One author at a time, in file name order, without keeping the corpus in memory.
+        # Training rows also carry their label, authors missing from the truth file are skipped.
+        # files restricts the authors to the given xml file names (a scoring shard).
+        for user, content, label in self.authors(files):
+            if self.type_data == 'train' and label is None:
+                continue
+            row = {'user': user, 'content': content}
+            if self.type_data == 'train':
+                row['value'] = 1 if label == 1 else 0
+            yield row
+
+    def iter_tweets(self, files: list = None):
+        # Like iter_data with the tweets of every author kept apart in 'tweets'
+        if self.snapshot and self._snapshot is None:
+            self._snapshot = CorpusSnapshot.load(self.path_dir, self.parse_authors, self.snapshot_dir)
+        snapshot = self._snapshot if self.snapshot else None
+        if snapshot is not None:
+            index = range(len(snapshot)) if files is None else (
+                snapshot.users.get(file.replace('.xml', '')) for file in sorted(files))
+            authors = (snapshot.author_tweets(i) for i in index if i is not None)
+        else:
+            authors = self.parse_authors(files)
+        for user, tweets, label in authors:
+            if self.type_data == 'train' and label is None:
+                continue
+            row = {'user': user, 'tweets': [tweet if tweet is not None else '' for tweet in tweets]}
+            if self.type_data == 'train':
+                row['value'] = 1 if label == 1 else 0
+            yield row
+
+    def authors(self, files: list = None):
+        # (user, content, label or None) in file name order, from the snapshot when enabled
+        if self.snapshot:
+            if self._snapshot is None:
+                self._snapshot = CorpusSnapshot.load(self.path_dir, self.parse_authors, self.snapshot_dir)
+            if self._snapshot is not None:
+                if files is None:
+                    return iter(self._snapshot)
+                users = self._snapshot.users
+                index = (users.get(file.replace('.xml', '')) for file in sorted(files))
+                return (self._snapshot.author(i) for i in index if i is not None)
+        return ((user, '\n'.join(tweets), label) for user, tweets, label in self.parse_authors(files))
+
+    def parse_authors(self, files: list = None):
+        # (user, tweets, label or None) read from the xml files
+        truth = self.get_truth()
+        for file in sorted(files if files is not None else os.listdir(self.path_dir)):
+            if file.endswith(".xml"):
+                user = file.replace('.xml', '')
+                tree = ET.parse('{0}{1}'.format(self.path_dir, file))
+                yield user, [i.text for i in tree.getroot().iter('document')], truth.get(user)
+
+    def get_truth(self):
+        truth = {}
+        for file in os.listdir(self.path_dir):
+            if file.endswith(".txt"):
+                with open(self.path_dir + file, 'r+', encoding="utf-8") as data:
+                    for line in data:
+                        entry = line.split(':::')
+                        if len(entry) > 1:
+                            truth[entry[0]] = int(entry[1])
+        return truth
+
 
 if __name__ == '__main__':
     dt = DataTransformation(dataset='pan21-author-profiling-training-2021-03-14',
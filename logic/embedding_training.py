@@ -0,0 +1,168 @@
+import os
+import sys
+from itertools import islice
+from multiprocessing import Pool
+from gensim.models import Word2Vec
+from logic.data_transformation import DataTransformation
+from logic.text_analysis import TextAnalysis
+from logic.utils import Utils
+from root import DIR_EMBEDDING
+
+_worker = None
+
+
+def _init_worker(lang):
+    global _worker
+    _worker = SentenceTokenizer(TextAnalysis(lang=lang))
+
+
+def _tokenize(text):
+    return _worker(text)
+
+
+class SentenceTokenizer(object):
+    """
+    Turns the tweets of an author into the token sentences of both embeddings:
+    transliterated syllables (syllable embedding) and phonemes (phoneme embedding).
+    """
+    skip = {'', ' ', '\ufeff', '1'}
+
+    def __init__(self, text_analysis: TextAnalysis, batch_size: int = 256):
+        self.ta = text_analysis
+        self.batch_size = batch_size
+
+    def __call__(self, text):
+        syllables, phonemes = [], []
+        tweets = [TextAnalysis.clean_text(i) for i in str(text).split('\n')]
+        for doc in self.ta.nlp.pipe([i for i in tweets if i is not None], batch_size=self.batch_size):
+            for sentence in doc.sents:
+                list_syllable = [self.ta.epi.transliterate(s, normpunc=True)
+                                 for token in sentence if token._.syllables is not None for s in token._.syllables]
+                list_syllable = [i for i in list_syllable if i.strip() not in self.skip]
+                list_phonemes = [i for i in self.ta.epi.trans_list(sentence.text, normpunc=True)
+                                 if i.strip() not in self.skip]
+                if list_syllable:
+                    syllables.append(list_syllable)
+                if list_phonemes:
+                    phonemes.append(list_phonemes)
+        return syllables, phonemes
+
+
+class TokenFile(object):
+    """
+    Restartable iterable over a token file (one sentence per line, tokens separated by spaces),
+    so gensim can make several passes without the corpus in memory.
+    """
+
+    def __init__(self, file: str):
+        self.file = file
+
+    def __iter__(self):
+        with open(self.file, 'r', encoding='utf-8') as data:
+            for line in data:
+                tokens = line.split()
+                if tokens:
+                    yield tokens
+
+
+class EmbeddingTraining(object):
+    """
+    Streaming pipeline for the syllable and phoneme Word2Vec embeddings.
+
+    prepare() reads the corpus one author at a time, tokenizes it in a process pool
+    (each worker loads its own TextAnalysis) and writes the token files in corpus
+    order; train() runs gensim with several workers over those files and can update
+    the vocabulary of an existing model. Defaults are the settings of the shipped models.
+    """
+    kinds = ['syllable', 'phoneme']
+
+    def __init__(self, lang: str = 'es', dataset: str = 'pan21-author-profiling-training-2021-03-14',
+                 processes: int = None, chunksize: int = 4, size: int = 150, window: int = 5, min_count: int = 10,
+                 sg: int = 0, negative: int = 20, sample: float = 6e-5, alpha: float = 0.03,
+                 min_alpha: float = 0.0007, epochs: int = 10, workers: int = None, seed: int = 1):
+        self.lang = lang
+        self.dataset = dataset
+        self.processes = processes if processes is not None else os.cpu_count() or 1
+        self.chunksize = chunksize
+        self.params = {'size': size, 'window': window, 'min_count': min_count, 'sg': sg, 'negative': negative,
+                       'sample': sample, 'alpha': alpha, 'min_alpha': min_alpha, 'iter': epochs, 'seed': seed,
+                       'workers': workers if workers is not None else os.cpu_count() or 1}
+        self.path_dir = '{0}corpus{1}'.format(DIR_EMBEDDING, os.sep)
+
+    def file_corpus(self, kind: str):
+        return '{0}{1}_{2}.txt'.format(self.path_dir, kind, self.lang)
+
+    def file_model(self, kind: str):
+        return '{0}{1}_embedding_{2}.model'.format(DIR_EMBEDDING, kind, self.lang)
+
+    def texts(self):
+        for row in DataTransformation(dataset=self.dataset, lang=self.lang).iter_data():
+            yield row['content']
+
+    def tokenize(self, texts):
+        # Bounded batches keep the pool from reading the whole corpus ahead; imap keeps the order
+        if self.processes <= 1:
+            tokenizer = SentenceTokenizer(TextAnalysis(lang=self.lang))
+            for text in texts:
+                yield tokenizer(text)
+            return
+        batch = self.processes * self.chunksize * 4
+        with Pool(self.processes, initializer=_init_worker, initargs=(self.lang,)) as pool:
+            while True:
+                chunk = list(islice(texts, batch))
+                if not chunk:
+                    break
+                for result in pool.imap(_tokenize, chunk, chunksize=self.chunksize):
+                    yield result
+
+    def prepare(self, texts=None):
+        count = {'authors': 0, 'syllable': 0, 'phoneme': 0}
+        try:
+            texts = iter(texts) if texts is not None else self.texts()
+            os.makedirs(self.path_dir, exist_ok=True)
+            files = {kind: open(self.file_corpus(kind) + '.tmp', 'w', encoding='utf-8') for kind in self.kinds}
+            try:
+                for syllables, phonemes in self.tokenize(texts):
+                    count['authors'] += 1
+                    for kind, sentences in zip(self.kinds, [syllables, phonemes]):
+                        for sentence in sentences:
+                            files[kind].write(' '.join(sentence) + '\n')
+                        count[kind] += len(sentences)
+            finally:
+                for output in files.values():
+                    output.close()
+            for kind in self.kinds:
+                os.replace(self.file_corpus(kind) + '.tmp', self.file_corpus(kind))
+            print('Embedding corpus: {0}'.format(count))
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error prepare: {0}'.format(e))
+        return count
+
+    def train(self, kind: str, update: bool = False):
+        model = None
+        try:
+            corpus = TokenFile(self.file_corpus(kind))
+            if update and os.path.isfile(self.file_model(kind)):
+                model = Word2Vec.load(self.file_model(kind))
+                model.workers = self.params['workers']
+                size_before = len(model.wv.vocab)
+                model.build_vocab(corpus, update=True)
+                print('Vocabulary {0}: {1} -> {2}'.format(kind, size_before, len(model.wv.vocab)))
+            else:
+                model = Word2Vec(**self.params)
+                model.build_vocab(corpus)
+                print('Vocabulary {0}: {1}'.format(kind, len(model.wv.vocab)))
+            model.train(corpus, total_examples=model.corpus_count, epochs=model.epochs)
+            model.save(self.file_model(kind))
+            os.makedirs('{0}frequency{1}'.format(DIR_EMBEDDING, os.sep), exist_ok=True)
+            TextAnalysis.token_frequency('{0}_{1}'.format(kind, self.lang), corpus)
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error train: {0}'.format(e))
+        return model
+
+    def run(self, update: bool = False, prepare: bool = True):
+        if prepare:
+            self.prepare()
+        return {kind: self.train(kind, update=update) for kind in self.kinds}
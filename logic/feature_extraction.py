@@ -1,3 +1,4 @@
+import os
 import re
 import sys
 import epitran
@@ -5,10 +6,16 @@ from nltk import TweetTokenizer
 from scipy.stats import kurtosis, skew
 from tqdm import tqdm
 import numpy as np
+from scipy import sparse as sp
 from gensim.models import Word2Vec
 from sklearn.base import BaseEstimator, TransformerMixin
 
+from logic.feature_schema import FeatureSchema
+from logic.instrumentation import Instrumentation, timed
 from logic.linguistic_senticnet import LinguisticSenticNet
+from logic.lru_cache import LRUCache
+from logic.quantized_embedding import QuantizedEmbedding
+from logic.syllable_table import SyllableTable
 from logic.text_analysis import TextAnalysis
 from logic.utils import Utils
 from logic.lexical_features import lexical_es, lexical_en
@@ -16,15 +23,20 @@ from root import DIR_EMBEDDING
 
 
 class FeatureExtraction(BaseEstimator, TransformerMixin):
+    re_words = re.compile(r'(\s+)')
+    # Word level phoneme memoization, only where it was checked to match the whole string call
+    word_phonemes = False
 
-    def __init__(self, lang='es', text_analysis=None):
+    def __init__(self, lang='es', text_analysis=None, instrumentation: Instrumentation = None,
+                 cache_size: int = 100000, quantized: str = None):
         try:
             ta = None
             if text_analysis is None:
-                ta = TextAnalysis(lang=lang)
+                ta = TextAnalysis(lang=lang, instrumentation=instrumentation)
             else:
                 ta = text_analysis
             self.ta = ta
+            self.metrics = instrumentation if instrumentation is not None else ta.metrics
             file_syllable_embedding_en = DIR_EMBEDDING + 'syllable_embedding_en.model'
             file_syllable_embedding_es = DIR_EMBEDDING + 'syllable_embedding_es.model'
             file_phoneme_embedding_en = DIR_EMBEDDING + 'phoneme_embedding_en.model'
@@ -32,67 +44,187 @@ class FeatureExtraction(BaseEstimator, TransformerMixin):
             print('Loading Lexicons and Embedding.....')
             if lang == 'es':
                 epi = epitran.Epitran('spa-Latn')
-                syllable_embedding = Word2Vec.load(file_syllable_embedding_es)
-                phoneme_embedding = Word2Vec.load(file_phoneme_embedding_es)
+                file_syllable_embedding = file_syllable_embedding_es
+                syllable_embedding = self.load_embedding(file_syllable_embedding_es, quantized)
+                phoneme_embedding = self.load_embedding(file_phoneme_embedding_es, quantized)
             else:
                 epi = epitran.Epitran('eng-Latn')
-                syllable_embedding = Word2Vec.load(file_syllable_embedding_en)
-                phoneme_embedding = Word2Vec.load(file_phoneme_embedding_en)
+                file_syllable_embedding = file_syllable_embedding_en
+                syllable_embedding = self.load_embedding(file_syllable_embedding_en, quantized)
+                phoneme_embedding = self.load_embedding(file_phoneme_embedding_en, quantized)
 
             self.epi = epi
             self.syllable_embedding = syllable_embedding
+            self.syllable_vocabulary = {w: i for i, w in enumerate(syllable_embedding.wv.index2word)}
+            self.syllable_table = SyllableTable.load(DIR_EMBEDDING + 'syllable_table_{0}.json'.format(lang),
+                                                     self.syllable_vocabulary, epi, file_syllable_embedding)
             self.phoneme_embedding = phoneme_embedding
             self.lexical = lexical_es if lang == 'es' else lexical_en
             self.lsn = LinguisticSenticNet(text_analysis=self.ta)
+            self.phoneme_cache = LRUCache(maxsize=cache_size, name='phoneme_words')
+            self.word_phonemes = lang == 'es'
         except Exception as e:
             Utils.standard_error(sys.exc_info())
             print('Error FeatureExtraction: {0}'.format(e))
 
+    @staticmethod
+    def load_embedding(file: str, quantized: str = None):
+        # With quantized ('float16' or 'int8') the compact export next to the model is used, built on first use
+        if quantized is None:
+            return Word2Vec.load(file)
+        file_quantized = QuantizedEmbedding.file_name(file, quantized)
+        if os.path.isfile(file_quantized):
+            return QuantizedEmbedding.load(file_quantized)
+        embedding = QuantizedEmbedding.from_model(Word2Vec.load(file), dtype=quantized)
+        embedding.save(file_quantized)
+        return embedding
+
+    def save_caches(self):
+        self.ta.save_caches()
+        self.syllable_table.save()
+        print('Syllable table: {0} syllables, {1} hits, {2} misses'.format(
+            len(self.syllable_table), self.syllable_table.hits, self.syllable_table.misses))
+
     def fit(self, x, y=None):
         return self
 
     def transform(self, list_messages):
         try:
-            result = self.get_features(list_messages)
+            result = self.transform_batch(list_messages)
             return result
         except Exception as e:
             Utils.standard_error(sys.exc_info())
             print('Error transform: {0}'.format(e))
 
-    def get_features(self, messages: str, type_features: list = [1, 1, 1, 1]):
+    @timed('get_features')
+    def get_features(self, messages: str, type_features: list = [1, 1, 1, 1], sparse: bool = False):
         try:
             # L: Lexical, S:Syllable, F: Frequency Phoneme, P: All Phoneme
-            syllable_features = list(abs(self.get_feature_syllable(messages))) if type_features[0] else []
-            phoneme_frequency = list(abs(self.get_frequency_phoneme(messages))) if type_features[1] else []
+            doc = self.parse(messages) if type_features[0] or type_features[1] or type_features[3] else None
+            syllable_features = list(abs(self.get_feature_syllable(messages, doc=doc))) if type_features[0] else []
             all_phoneme = list(abs(self.get_feature_phoneme(messages))) if type_features[2] else []
-            lexical_features = list(abs(self.get_features_lexical(messages))) if type_features[3] else []
-            features = lexical_features + syllable_features + all_phoneme + phoneme_frequency
-            result = np.array(features, dtype=np.float32)
+            lexical_features = list(abs(self.get_features_lexical(messages, doc=doc))) if type_features[3] else []
+            features = lexical_features + syllable_features + all_phoneme
+            if sparse:
+                # The frequency block is vocabulary sized and almost empty, it is kept as CSR
+                dense = sp.csr_matrix(np.array([features], dtype=np.float32))
+                if type_features[1]:
+                    phoneme_frequency = abs(self.get_frequency_phoneme(messages, sparse=True, doc=doc))
+                    result = sp.hstack([dense, phoneme_frequency], format='csr', dtype=np.float32)
+                else:
+                    result = dense
+            else:
+                phoneme_frequency = list(abs(self.get_frequency_phoneme(messages, doc=doc))) if type_features[1] else []
+                result = np.array(features + phoneme_frequency, dtype=np.float32)
             return result
         except Exception as e:
             Utils.standard_error(sys.exc_info())
             print('Error get_features: {0}'.format(e))
             return None
 
-    def get_feature_syllable(self, messages):
+    def schema(self, type_features: list = [1, 1, 1, 1]):
+        return FeatureSchema.from_features(self, type_features)
+
+    @timed('transform_batch')
+    def transform_batch(self, list_messages: list, type_features: list = [1, 1, 1, 1], sparse: bool = False,
+                        progress: bool = False, polarity: bool = True, docs: list = None):
+        # Every document is written in place into one row of a preallocated C-contiguous float32 matrix.
+        # docs: the documents already parsed (parse), one per message
+        schema = self.schema(type_features)
+        x = schema.allocate(len(list_messages), dense_only=sparse)
+        rows, cols, values = [], [], []
+        for i, messages in enumerate(tqdm(list_messages) if progress else list_messages):
+            frequency = self.get_features_into(messages, x[i], schema, dense_only=sparse, polarity=polarity,
+                                               doc=docs[i] if docs is not None else None)
+            if frequency is not None:
+                indices, freq = frequency
+                rows.append(np.full(len(indices), i, dtype=np.int32))
+                cols.append(indices)
+                values.append(freq)
+        if sparse:
+            result = sp.csr_matrix(x)
+            if schema.enabled('frequency'):
+                size = schema.sizes['frequency']
+                frequency = sp.csr_matrix((np.concatenate(values) if values else np.zeros(0, dtype=np.float32),
+                                           (np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32),
+                                            np.concatenate(cols) if cols else np.zeros(0, dtype=np.int32))),
+                                          shape=(len(list_messages), size), dtype=np.float32)
+                result = sp.hstack([result, frequency], format='csr', dtype=np.float32)
+            return result
+        return x
+
+    def get_features_into(self, messages: str, row, schema: FeatureSchema, dense_only: bool = False,
+                          polarity: bool = True, doc=None):
+        # Fills one matrix row following the schema layout. With dense_only the frequency block is not
+        # written and its (indices, values) are returned for the caller to build the sparse block.
+        result = None
+        try:
+            if messages is None:
+                return result
+            if doc is None and (schema.enabled('lexical') or schema.enabled('syllable') or schema.enabled('frequency')):
+                doc = self.parse(messages)
+            if schema.enabled('lexical'):
+                lexical_features = self.get_features_lexical(messages, polarity=polarity, doc=doc)
+                if lexical_features is not None:
+                    row[schema.slice('lexical')] = abs(lexical_features)
+            if schema.enabled('syllable'):
+                row[schema.slice('syllable')] = abs(self.get_feature_syllable(messages, doc=doc))
+            if schema.enabled('phoneme'):
+                row[schema.slice('phoneme')] = abs(self.get_feature_phoneme(messages))
+            if schema.enabled('frequency'):
+                indices, counts, total_freq = self.frequency_counts(messages, doc=doc)
+                values = counts.astype(np.float32) / np.float32(total_freq)
+                if dense_only:
+                    result = (indices, values)
+                else:
+                    row[schema.offsets['frequency'][0] + indices] = values
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error get_features_into: {0}'.format(e))
+        return result
+
+    def parse(self, messages, count: bool = True):
+        # One spaCy parse of a document for the POS tags and syllables of all its feature groups. The
+        # dependency parse is skipped: the polarity parses the sentences itself (syntax_patterns).
+        # count=False for a document parsed again (cascade escalation), its tokens are already counted.
+        doc = self.ta.analysis_pipe(messages.lower(), disable=TextAnalysis.light_pipes)
+        if count and doc is not None:
+            self.metrics.add('tokens', len(doc))
+        return doc
+
+    def polarity(self, message):
+        # SenticNet polarity column of get_features_lexical
+        return float(self.lsn.polarity_text(text=message)['polarity_value'])
+
+    @timed('get_feature_syllable')
+    def get_feature_syllable(self, messages, doc=None):
         try:
-            messages_phonetic = []
             model = self.syllable_embedding
-            num_features = model.vector_size
-            index2phoneme_set = set(model.wv.index2word)
+            index2word = model.wv.index2word
+            table = self.syllable_table
+            hits, misses = table.hits, table.misses
             num_phonemes = 1
+            num_syllables = 0
             feature_vec = []
-            list_syllable = [token['syllables'] for token in self.ta.tagger(messages) if token['syllables'] is not None]
+            list_syllable = [token['syllables'] for token in self.ta.tagger(messages, doc=doc)
+                             if token['syllables'] is not None]
+            rows = []
             for syllable in list_syllable:
                 for s in syllable:
-                    syllable_phonetic = self.epi.transliterate(s, normpunc=True)
-                    messages_phonetic.append(syllable_phonetic)
-                    if syllable_phonetic in index2phoneme_set:
-                        vec = model.wv[syllable_phonetic]
-                        feature_vec.append(vec)
-                        num_phonemes += 1
-            feature_vec = np.array(feature_vec, dtype="float32")
-            feature_vec = np.sum(feature_vec, axis=0)
+                    index = table.row(s)
+                    num_syllables += 1
+                    if index != SyllableTable.OOV:
+                        rows.append(index)
+            num_phonemes += len(rows)
+            self.metrics.add('syllables', num_syllables)
+            self.metrics.cache('syllable_table', hits=table.hits - hits, misses=table.misses - misses)
+            self.metrics.oov('syllable_embedding', num_syllables, num_syllables - len(rows))
+            if isinstance(model, QuantizedEmbedding):
+                # The rows of the table are the rows of the embedding, summed without dequantizing each one
+                feature_vec = model.pool_rows(rows)[0]
+            else:
+                feature_vec = np.array([model.wv[index2word[index]] for index in rows], dtype="float32")
+                feature_vec = np.sum(feature_vec, axis=0)
             feature_vec = np.divide(feature_vec, num_phonemes)
             # print('Phonetic text: {0}'.format(messages_phonetic))
             # print('Embedding: {0}'.format(feature_vec))
@@ -102,32 +234,48 @@ class FeatureExtraction(BaseEstimator, TransformerMixin):
             print('Error get_feature_syllable: {0}'.format(e))
             return None
 
-    def get_frequency_phoneme(self, messages):
+    @timed('get_frequency_phoneme')
+    def get_frequency_phoneme(self, messages, sparse: bool = False, doc=None):
         try:
-            messages_phonetic = []
-            total_freq = 1
-            model = self.syllable_embedding
-            index2phoneme = list(model.wv.index2word)
-            num_features = len(index2phoneme)
+            num_features = len(self.syllable_vocabulary)
+            indices, counts, total_freq = self.frequency_counts(messages, doc=doc)
+            values = counts.astype(np.float32) / np.float32(total_freq)
+            if sparse:
+                return sp.csr_matrix((values, (np.zeros(len(indices), dtype=np.int32), indices)),
+                                     shape=(1, num_features), dtype=np.float32)
             feature_vec = np.zeros(num_features, dtype="float32")
-            list_syllable = [token['syllables'] for token in self.ta.tagger(messages) if token['syllables'] is not None]
-            for syllable in list_syllable:
-                for s in syllable:
-                    syllable_phonetic = self.epi.transliterate(s, normpunc=True)
-                    messages_phonetic.append(syllable_phonetic)
-                    if syllable_phonetic in index2phoneme:
-                        index = index2phoneme.index(syllable_phonetic)
-                        value = feature_vec[index]
-                        feature_vec[index] = value + 1
-                        total_freq += feature_vec[index]
-            # print('Phonetic text: {0}'.format(messages_phonetic))
+            feature_vec[indices] = values
             # print('Frequency: {0}'.format(feature_vec))
-            return feature_vec / total_freq
+            return feature_vec
         except Exception as e:
             Utils.standard_error(sys.exc_info())
             print('Error get_frequency_phoneme: {0}'.format(e))
             return None
 
+    @timed('frequency_counts')
+    def frequency_counts(self, messages, doc=None):
+        # Sorted vocabulary indices, their counts and the normalizer of get_frequency_phoneme,
+        # where each occurrence adds the running count of its syllable.
+        num_syllables = 0
+        dict_count = {}
+        table = self.syllable_table
+        hits, misses = table.hits, table.misses
+        list_syllable = [token['syllables'] for token in self.ta.tagger(messages, doc=doc)
+                         if token['syllables'] is not None]
+        for syllable in list_syllable:
+            for s in syllable:
+                index = table.row(s)
+                num_syllables += 1
+                if index != SyllableTable.OOV:
+                    dict_count[index] = dict_count.get(index, 0) + 1
+        self.metrics.add('syllables', num_syllables)
+        self.metrics.cache('syllable_table', hits=table.hits - hits, misses=table.misses - misses)
+        indices = np.array(sorted(dict_count), dtype=np.int32)
+        counts = np.array([dict_count[i] for i in indices], dtype=np.int64)
+        total_freq = 1 + int(np.sum(counts * (counts + 1) // 2))
+        return indices, counts, total_freq
+
+    @timed('get_feature_phoneme')
     def get_feature_phoneme(self, messages, one=False):
         try:
             messages_phonetic = None
@@ -136,9 +284,10 @@ class FeatureExtraction(BaseEstimator, TransformerMixin):
             index2phoneme_set = set(model.wv.index2word)
             size = 1
             feature_vec = []
-            list_syllable = [token['syllables'] for token in self.ta.tagger(messages) if token['syllables'] is not None]
             if one:
                 try:
+                    list_syllable = [token['syllables'] for token in self.ta.tagger(messages)
+                                     if token['syllables'] is not None]
                     first_syllable = str(list_syllable[0][0])
                     first_syllable = first_syllable[0] if (first_syllable is not None) and (len(first_syllable) > 0) else ''
                     syllable_phonetic = self.epi.transliterate(first_syllable)
@@ -152,15 +301,24 @@ class FeatureExtraction(BaseEstimator, TransformerMixin):
                     print('Error transliterate: {0}'.format(e_epi))
                     pass
             else:
-                list_phoneme = self.epi.trans_list(messages)
+                list_phoneme = self.trans_list(messages)
                 messages_phonetic = list_phoneme
                 size = len(list_phoneme)
-                for phoneme in list_phoneme:
-                    if phoneme in index2phoneme_set:
-                        vec = model.wv[phoneme]
-                        feature_vec.append(vec)
-                    else:
-                        feature_vec.append(np.zeros(num_features, dtype="float32"))
+                if isinstance(model, QuantizedEmbedding):
+                    total, known = model.pool(list_phoneme)
+                    feature_vec.append(total)
+                    missing = size - known
+                else:
+                    missing = 0
+                    for phoneme in list_phoneme:
+                        if phoneme in index2phoneme_set:
+                            vec = model.wv[phoneme]
+                            feature_vec.append(vec)
+                        else:
+                            missing += 1
+                            feature_vec.append(np.zeros(num_features, dtype="float32"))
+                self.metrics.add('phonemes', size)
+                self.metrics.oov('phoneme_embedding', size, missing)
 
             feature_vec = np.array(feature_vec, dtype="float32")
             feature_vec = np.sum(feature_vec, axis=0)
@@ -173,14 +331,35 @@ class FeatureExtraction(BaseEstimator, TransformerMixin):
             print('Error get_feature_phoneme: {0}'.format(e))
             return None
 
-    def get_features_lexical(self, message):
+    def trans_list(self, messages):
+        # Word level memoization of epi.trans_list for spa-Latn. Its rules map every whitespace separated
+        # piece on its own (no grapheme or rule crosses a space), so the concatenation equals the whole
+        # string call. eng-Latn goes through flite, which is not checked to behave the same, and is not memoized.
+        if not self.word_phonemes:
+            return self.epi.trans_list(messages)
+        result = []
+        cache = self.phoneme_cache
+        hits, misses = cache.hits, cache.misses
+        for piece in self.re_words.split(messages):
+            if piece == '':
+                continue
+            phonemes = cache.get(piece)
+            if phonemes is None:
+                phonemes = cache.put(piece, self.epi.trans_list(piece))
+            result.extend(phonemes)
+        self.metrics.cache('phoneme_words', hits=cache.hits - hits, misses=cache.misses - misses)
+        return result
+
+    @timed('get_features_lexical')
+    def get_features_lexical(self, message, polarity: bool = True, doc=None):
         result = None
         try:
             lexical = self.lexical
             text_tokenizer = TweetTokenizer()
             tags = ('mention', 'url', 'hashtag', 'emoji', 'rt')
             vector = dict()
-            vector['plarity'] = float(self.lsn.polarity_text(text=message)['polarity_value'])
+            # Without polarity the SenticNet column is left at 0.0, the layout does not change
+            vector['plarity'] = self.polarity(message) if polarity else 0.0
             tokens_text = text_tokenizer.tokenize(message)
             if len(tokens_text) > 0:
                 vector['weighted_position'], vector['weighted_normalized'] = self.weighted_position(tokens_text)
@@ -259,10 +438,11 @@ class FeatureExtraction(BaseEstimator, TransformerMixin):
                 vector['hate'] = sum(1 for word in tokens_text if word in lexical['hate'])
                 vector['hate'] = float(vector['hate'])
 
-                vector['noun'] = self.pos_frequency(message)['NOUN'] * 0.8
-                vector['verb'] = self.pos_frequency(message)['VERB'] * 0.5
-                vector['adj'] = self.pos_frequency(message)['ADJ'] * 0.4
-                vector['pos_others'] = self.pos_frequency(message)['ANOTHER'] * 0.1
+                pos = self.pos_frequency(message, doc=doc)
+                vector['noun'] = pos['NOUN'] * 0.8
+                vector['verb'] = pos['VERB'] * 0.5
+                vector['adj'] = pos['ADJ'] * 0.4
+                vector['pos_others'] = pos['ANOTHER'] * 0.1
 
                 result = np.array(list(vector.values()))
         except Exception as e:
@@ -274,38 +454,49 @@ class FeatureExtraction(BaseEstimator, TransformerMixin):
     def lexical_diversity(text):
         result = None
         try:
-            text_out = re.sub(r"[\U00010000-\U0010ffff]", '', text)
-            text_out = re.sub(
-                r'(?i)\b((?:https?://|www\d{0,3}[.]|[a-z0-9.\-]+[.][a-z]{2,4}/)(?:[^\s()<>]+|\(([^\s()<>]+'
-                r'|(\([^\s()<>]+\)))*\))+(?:\(([^\s()<>]+|(\([^\s()<>]+\)))*\)|[^\s`!()\[\]{};:\'".,<>?«»“”‘’]))',
-                '', text_out)
-            text_out = text_out.lower()
+            text_out = FeatureExtraction.diversity_text(text)
             result = round((len(set(text_out)) / len(text_out)), 4)
         except Exception as e:
             Utils.standard_error(sys.exc_info())
             print('Error lexical_diversity: {0}'.format(e))
         return result
 
+    @staticmethod
+    def diversity_text(text):
+        # Characters measured by lexical_diversity: without emojis and urls, lower case
+        text_out = re.sub(r"[\U00010000-\U0010ffff]", '', text)
+        text_out = re.sub(
+            r'(?i)\b((?:https?://|www\d{0,3}[.]|[a-z0-9.\-]+[.][a-z]{2,4}/)(?:[^\s()<>]+|\(([^\s()<>]+'
+            r'|(\([^\s()<>]+\)))*\))+(?:\(([^\s()<>]+|(\([^\s()<>]+\)))*\)|[^\s`!()\[\]{};:\'".,<>?«»“”‘’]))',
+            '', text_out)
+        return text_out.lower()
+
     @staticmethod
     def weighted_position(tokens_text):
+        # Each token weighs by the position of the first occurrence of its word, found once per word
+        # instead of with tokens_text.index (quadratic on a whole timeline); the sums are the same.
         result = None
         try:
             size = len(tokens_text)
             weighted_words = 0.0
             weighted_normalized = 0.0
+            first = {}
+            for i, w in enumerate(tokens_text):
+                first.setdefault(w, i)
             for w in tokens_text:
-                weighted_words += 1 / (1 + tokens_text.index(w))
-                weighted_normalized += (1 + tokens_text.index(w)) / size
+                weighted_words += 1 / (1 + first[w])
+                weighted_normalized += (1 + first[w]) / size
             result = (weighted_words, weighted_normalized)
         except Exception as e:
             Utils.standard_error(sys.exc_info())
             print('Error weighted_position: {0}'.format(e))
         return result
 
-    def pos_frequency(self, text):
+    @timed('pos_frequency')
+    def pos_frequency(self, text, doc=None):
         dict_token = {'NOUN': 0, 'VERB': 0, 'ADJ': 0, 'ANOTHER': 0}
         try:
-            doc = self.ta.tagger(text)
+            doc = self.ta.tagger(text, doc=doc)
             for token in doc:
                 if token['pos'] == 'NOUN':
                     value = dict_token['NOUN']
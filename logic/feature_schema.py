@@ -0,0 +1,97 @@
+import numpy as np
+
+
+class FeatureSchema(object):
+    """
+    Fixed column layout of the feature matrix.
+
+    Groups keep the order of FeatureExtraction.get_features (lexical,
+    syllable, phoneme, frequency) and every enabled group owns a contiguous
+    range of columns. type_features keeps its historical positions:
+    [syllable, frequency, phoneme, lexical].
+    """
+    groups = ['lexical', 'syllable', 'phoneme', 'frequency']
+    type_index = {'syllable': 0, 'frequency': 1, 'phoneme': 2, 'lexical': 3}
+    lexical_names = ['plarity', 'weighted_position', 'weighted_normalized', 'label_mention', 'label_url',
+                     'label_hashtag', 'label_emoji', 'label_retweets', 'lexical_diversity', 'label_word',
+                     'first_person_singular', 'second_person_singular', 'third_person_singular',
+                     'first_person_plurar', 'second_person_plurar', 'third_person_plurar', 'avg_word', 'kur_word',
+                     'skew_word', 'adverb_neg', 'adverb_time', 'adverb_place', 'adverb_mode', 'adverb_cant',
+                     'adverb_all', 'adjetives_neg', 'adjetives_pos', 'who_general', 'who_male', 'who_female',
+                     'hate', 'noun', 'verb', 'adj', 'pos_others']
+
+    def __init__(self, type_features: list = [1, 1, 1, 1], sizes: dict = None):
+        self.type_features = list(type_features)
+        self.sizes = dict(sizes) if sizes is not None else {}
+        self.offsets = {}
+        start = 0
+        for group in self.groups:
+            if self.enabled(group):
+                end = start + int(self.sizes[group])
+                self.offsets[group] = (start, end)
+                start = end
+        self.size = start
+
+    @classmethod
+    def from_features(cls, features, type_features: list = [1, 1, 1, 1]):
+        sizes = {'lexical': len(cls.lexical_names),
+                 'syllable': features.syllable_embedding.vector_size,
+                 'phoneme': features.phoneme_embedding.vector_size,
+                 'frequency': len(features.syllable_vocabulary)}
+        return cls(type_features=type_features, sizes=sizes)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(type_features=data['type_features'], sizes=data['sizes'])
+
+    def to_dict(self):
+        return {'type_features': self.type_features, 'sizes': self.sizes,
+                'offsets': {k: list(v) for k, v in self.offsets.items()}, 'size': self.size}
+
+    def enabled(self, group: str):
+        return bool(self.type_features[self.type_index[group]])
+
+    def slice(self, group: str):
+        start, end = self.offsets[group]
+        return slice(start, end)
+
+    @property
+    def dense_size(self):
+        # Columns before the frequency block, the part kept dense in sparse mode
+        return self.offsets['frequency'][0] if 'frequency' in self.offsets else self.size
+
+    def names(self):
+        result = []
+        for group in self.offsets:
+            start, end = self.offsets[group]
+            if group == 'lexical':
+                result.extend('lexical_{0}'.format(name) for name in self.lexical_names)
+            else:
+                result.extend('{0}_{1}'.format(group, i) for i in range(end - start))
+        return result
+
+    def subset(self, columns):
+        # Smallest schema computing the given columns of this one, and their positions in it
+        columns = np.asarray(columns, dtype=np.intp)
+        type_features = [0, 0, 0, 0]
+        for group, (start, end) in self.offsets.items():
+            if np.any((columns >= start) & (columns < end)):
+                type_features[self.type_index[group]] = 1
+        reduced = FeatureSchema(type_features=type_features, sizes=self.sizes)
+        positions = np.empty(len(columns), dtype=np.intp)
+        for group, (start, end) in self.offsets.items():
+            mask = (columns >= start) & (columns < end)
+            if np.any(mask):
+                positions[mask] = columns[mask] - start + reduced.offsets[group][0]
+        return reduced, positions
+
+    def allocate(self, n_rows: int, dense_only: bool = False):
+        columns = self.dense_size if dense_only else self.size
+        return np.zeros((n_rows, columns), dtype=np.float32, order='C')
+
+    def __eq__(self, other):
+        return isinstance(other, FeatureSchema) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return 'FeatureSchema({0})'.format(', '.join('{0}={1}:{2}'.format(k, v[0], v[1])
+                                                     for k, v in self.offsets.items()))
@@ -0,0 +1,63 @@
+import sys
+import numpy as np
+from scipy import sparse as sp
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_selection import SelectKBest, chi2, mutual_info_classif
+from sklearn.utils.validation import check_is_fitted
+from mlxtend.feature_selection import SequentialFeatureSelector as SFS
+from logic.utils import Utils
+
+
+class FeatureSelection(BaseEstimator, TransformerMixin):
+    """
+    Optional selection stage of TrainModels.
+
+    Used as the first step of a Pipeline so that it is fitted on the
+    training folds only. dense=True returns the selected columns of a
+    sparse matrix as an array, for classifiers without sparse input.
+    The chosen columns are stored in the model bundle; at scoring time
+    FeatureSchema.subset turns them into the feature groups that still
+    have to be extracted.
+    """
+    methods = ['chi2', 'mutual_info', 'sfs']
+
+    def __init__(self, method: str = 'chi2', k_features: int = 100, estimator=None, cv: int = 3,
+                 dense: bool = False):
+        # Parameters only, as sklearn clone expects; checked and fitted in fit (columns_, scores_)
+        self.method = method
+        self.k_features = k_features
+        self.estimator = estimator
+        self.cv = cv
+        self.dense = dense
+
+    def fit(self, x, y):
+        if self.method not in self.methods:
+            raise ValueError('Feature selection not supported: {0}'.format(self.method))
+        try:
+            k = min(self.k_features, x.shape[1])
+            if self.method == 'sfs':
+                x_dense = x.toarray() if sp.issparse(x) else x
+                selector = SFS(self.estimator, k_features=k, forward=True, floating=False, scoring='accuracy',
+                               cv=self.cv, n_jobs=-1)
+                selector.fit(x_dense, y)
+                self.columns_ = np.array(sorted(selector.k_feature_idx_), dtype=np.intp)
+                self.scores_ = None
+            else:
+                score_func = chi2 if self.method == 'chi2' else mutual_info_classif
+                selector = SelectKBest(score_func=score_func, k=k).fit(x, y)
+                self.scores_ = selector.scores_
+                self.columns_ = np.flatnonzero(selector.get_support()).astype(np.intp)
+            print('Feature selection {0}: {1} of {2} columns'.format(self.method, len(self.columns_), x.shape[1]))
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error FeatureSelection: {0}'.format(e))
+            raise
+        return self
+
+    def transform(self, x):
+        check_is_fitted(self, 'columns_')
+        x = x[:, self.columns_]
+        return x.toarray() if self.dense and sp.issparse(x) else x
+
+    def fit_transform(self, x, y):
+        return self.fit(x, y).transform(x)
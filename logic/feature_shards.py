@@ -0,0 +1,131 @@
+import json
+import os
+import numpy as np
+from scipy import sparse as sp
+from sklearn.model_selection import StratifiedShuffleSplit
+from logic.feature_schema import FeatureSchema
+from root import DIR_SHARDS
+
+
+class FeatureShards(object):
+    """
+    Labeled feature matrix stored on disk as a sequence of shards.
+
+    <DIR_SHARDS>/<name>/manifest.json  schema, sparse flag and rows/positives of every shard
+    <DIR_SHARDS>/<name>/shard_00000.npz  x (dense, or CSR as data/indices/indptr/shape) and y
+
+    Only one shard is in memory at a time when iterating.
+    """
+    file_manifest = 'manifest.json'
+
+    def __init__(self, name: str, path_dir: str = None):
+        self.name = name
+        self.path_dir = path_dir if path_dir is not None else '{0}{1}{2}'.format(DIR_SHARDS, name, os.sep)
+        self.manifest = {'name': name, 'schema': None, 'sparse': False, 'shards': []}
+
+    def __len__(self):
+        return len(self.manifest['shards'])
+
+    @property
+    def n_rows(self):
+        return sum(i['rows'] for i in self.manifest['shards'])
+
+    @property
+    def schema(self):
+        return FeatureSchema.from_dict(self.manifest['schema'])
+
+    @staticmethod
+    def exists(name: str, path_dir: str = None):
+        path_dir = path_dir if path_dir is not None else '{0}{1}{2}'.format(DIR_SHARDS, name, os.sep)
+        return os.path.isfile(path_dir + FeatureShards.file_manifest)
+
+    @classmethod
+    def load(cls, name: str, path_dir: str = None):
+        shards = cls(name, path_dir=path_dir)
+        with open(shards.path_dir + cls.file_manifest, 'r', encoding='utf-8') as data:
+            shards.manifest = json.load(data)
+        return shards
+
+    def create(self, schema: FeatureSchema, sparse: bool = False):
+        os.makedirs(self.path_dir, exist_ok=True)
+        self.manifest = {'name': self.name, 'schema': schema.to_dict(), 'sparse': sparse, 'shards': []}
+        return self
+
+    def append(self, x, y):
+        # Shard files are complete before the manifest lists them
+        file = 'shard_{0:05d}.npz'.format(len(self.manifest['shards']))
+        y = np.asarray(y, dtype=np.int8)
+        with open(self.path_dir + file + '.tmp', 'wb') as output:
+            if sp.issparse(x):
+                x = x.tocsr()
+                np.savez(output, data=x.data, indices=x.indices, indptr=x.indptr, shape=np.array(x.shape), y=y)
+            else:
+                np.savez(output, x=x, y=y)
+        os.replace(self.path_dir + file + '.tmp', self.path_dir + file)
+        self.manifest['shards'].append({'file': file, 'rows': int(len(y)), 'positives': int(np.sum(y == 1))})
+        self.save()
+        return file
+
+    def save(self):
+        with open(self.path_dir + self.file_manifest + '.tmp', 'w', encoding='utf-8') as output:
+            json.dump(self.manifest, output, indent=2)
+        os.replace(self.path_dir + self.file_manifest + '.tmp', self.path_dir + self.file_manifest)
+
+    def read(self, i: int):
+        with np.load(self.path_dir + self.manifest['shards'][i]['file'], allow_pickle=False) as data:
+            if 'x' in data:
+                return data['x'], data['y']
+            x = sp.csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+            return x, data['y']
+
+    def read_y(self, i: int):
+        with np.load(self.path_dir + self.manifest['shards'][i]['file'], allow_pickle=False) as data:
+            return data['y']
+
+    def split(self, test_size: float = 0.2, random_state: int = 42):
+        # Rows are held out inside every shard (stratified when both classes allow it), so a corpus that
+        # fits in one shard still gets a test set. Both parts are lists of (shard, row indices).
+        train, test = [], []
+        for i in range(len(self)):
+            y = self.read_y(i)
+            n_test = int(round(len(y) * test_size))
+            if len(y) < 2 or n_test == 0:
+                train.append((i, np.arange(len(y))))
+                continue
+            n_test = min(n_test, len(y) - 1)
+            classes, counts = np.unique(y, return_counts=True)
+            if len(classes) > 1 and counts.min() >= 2 and len(classes) <= n_test <= len(y) - len(classes):
+                splitter = StratifiedShuffleSplit(n_splits=1, test_size=n_test, random_state=random_state + i)
+                rows_train, rows_test = next(splitter.split(np.zeros(len(y)), y))
+            else:
+                order = np.random.RandomState(random_state + i).permutation(len(y))
+                rows_train, rows_test = order[n_test:], order[:n_test]
+            train.append((i, np.sort(rows_train)))
+            test.append((i, np.sort(rows_test)))
+        return train, test
+
+    def iterate(self, shards: list = None, shuffle: bool = False, random_state: int = None):
+        # shards: shard indices, or (shard, row indices) pairs as returned by split
+        shards = list(range(len(self))) if shards is None else list(shards)
+        rnd = np.random.RandomState(random_state)
+        if shuffle:
+            rnd.shuffle(shards)
+        for shard in shards:
+            i, rows = shard if isinstance(shard, tuple) else (shard, None)
+            x, y = self.read(i)
+            if rows is not None:
+                x, y = x[rows], y[rows]
+            if shuffle:
+                order = rnd.permutation(len(y))
+                x, y = x[order], y[order]
+            yield x, y
+
+    def to_matrix(self, shards: list = None):
+        # Stacks the shards back into one matrix and its labels
+        blocks = list(self.iterate(shards))
+        if len(blocks) == 0:
+            return None, np.zeros(0, dtype=np.int8)
+        y = np.concatenate([y for _, y in blocks])
+        if self.manifest['sparse']:
+            return sp.vstack([x for x, _ in blocks], format='csr'), y
+        return np.vstack([x for x, _ in blocks]), y
@@ -1,60 +1,335 @@
 import os
 import pickle
+import sys
+import queue
+import threading
+from collections import deque
+from multiprocessing import Pool
+from multiprocessing.util import Finalize
 from sklearn import preprocessing
 from tqdm import tqdm
 from logic.data_transformation import DataTransformation
 from logic.feature_extraction import FeatureExtraction
+from logic.cascade import CascadeClassifier
+from logic.instrumentation import Instrumentation
+from logic.model_bundle import ModelBundle
+from logic.result_writer import ResultWriter
 from logic.text_analysis import TextAnalysis
-from root import DIR_OUTPUT, DIR_MODELS
+from logic.tree_compiler import CompiledForest
+from logic.tweet_features import TweetFeatures
+from logic.utils import Utils
+from root import DIR_MODELS
+
+_featurizer = None
+
+
+def _init_featurizer(lang, type_features, sparse, selection, quantized, cascade, instrumentation=False,
+                     schema_size=None, granularity='document'):
+    global _featurizer
+    metrics = Instrumentation(enabled=instrumentation, name='featurizer_{0}'.format(lang))
+    ta = TextAnalysis(lang=lang, instrumentation=metrics)
+    features = FeatureExtraction(lang=lang, text_analysis=ta, quantized=quantized)
+    if schema_size is not None and features.schema(type_features).size != schema_size:
+        print('Warning featurizer: schema has {0} columns, model expects {1}'.format(
+            features.schema(type_features).size, schema_size))
+    _featurizer = {'ta': ta, 'features': features, 'metrics': metrics,
+                   'tweets': TweetFeatures(features) if granularity == 'tweet' else None,
+                   'type_features': type_features, 'sparse': sparse, 'selection': selection, 'cascade': cascade}
+    # The caches of the worker are saved when the pool is closed and the worker exits
+    Finalize(None, features.save_caches, exitpriority=10)
+
+
+def _featurize(batch):
+    # Featurization stage, runs in the pool workers. A cascade is decided here as its
+    # second stage only featurizes the escalated authors. The metrics and cascade stages
+    # of the batch are returned to be merged in the parent. With tweet granularity the batch holds
+    # the list of tweets of every author instead of its content.
+    users = [user for user, _ in batch]
+    features, sparse, cascade = _featurizer['features'], _featurizer['sparse'], _featurizer['cascade']
+    x, labels = None, None
+    if _featurizer['tweets'] is not None:
+        type_features = _featurizer['type_features']
+        if _featurizer['selection'] is not None:
+            type_features = _featurizer['selection'][0].type_features
+        x = _featurizer['tweets'].transform([tweets for _, tweets in batch], type_features, sparse=sparse)
+        if _featurizer['selection'] is not None:
+            x = x[:, _featurizer['selection'][1]]
+        return users, x, labels, _worker_stats()
+    list_messages = []
+    for _, content in batch:
+        with _featurizer['ta'].metrics.timer('clean_text'):
+            list_messages.append(_featurizer['ta'].clean_text(content, stopwords=False))
+    if cascade is not None:
+        labels = cascade.predict_messages(features, list_messages, sparse=sparse)
+    elif _featurizer['selection'] is not None:
+        schema, positions = _featurizer['selection']
+        x = features.transform_batch(list_messages, schema.type_features, sparse=sparse)[:, positions]
+    else:
+        x = features.transform_batch(list_messages, _featurizer['type_features'], sparse=sparse)
+    return users, x, labels, _worker_stats()
+
+
+def _worker_stats():
+    # Metrics and cascade stages since the last batch of this worker
+    stats = {'metrics': _featurizer['metrics'].state(reset=True) if _featurizer['metrics'].enabled else None,
+             'stages': None}
+    cascade = _featurizer['cascade']
+    if cascade is not None:
+        stats['stages'] = dict(cascade.stages)
+        cascade.stages = {k: 0 for k in cascade.stages}
+    return stats
 
 
 class HateModels(object):
 
     def __init__(self, lang: str = 'es', name_model: str = None,
-                 dataset: str = 'pan21-author-profiling-test-without-gold'):
+                 dataset: str = 'pan21-author-profiling-test-without-gold', instrumentation: bool = False,
+                 sparse: bool = False, compiled: bool = False, quantized: str = None, reader=None,
+                 granularity: str = None):
         self.lang = lang
-        self.ta = TextAnalysis(lang=lang)
-        self.features = FeatureExtraction(lang=lang, text_analysis=self.ta)
-        self.test = DataTransformation(dataset=dataset, lang=lang, type_data='test').get_data()
-        file_model = '{0}{1}.pkl'.format(DIR_MODELS, name_model)
-        self.clf = pickle.load(open(file_model, 'rb'))
+        self.sparse = sparse
+        self.type_features = [1, 1, 1, 1]
+        self.metrics = Instrumentation(enabled=instrumentation, name='hate_models_{0}'.format(lang))
+        # Text analysis and embeddings are loaded on first use: run_pipeline only needs them in the workers
+        self._ta = None
+        self._features = None
+        self._tweet_features = None
+        self.dataset = dataset
+        # Any reader with iter_data/get_data (logic.data_readers, type_data='test'), the PAN XML directory by default
+        self.reader = reader if reader is not None else DataTransformation(dataset=dataset, lang=lang,
+                                                                           type_data='test')
+        if getattr(self.reader, 'type_data', 'test') != 'test':
+            # A training reader returns a list of rows instead of user -> content and drops unlabelled authors
+            raise ValueError("The reader must be created with type_data='test', not {0!r}".format(
+                self.reader.type_data))
+        self.quantized = quantized
+        self._test = None
+        self.bundle = None
+        self.selection = None
+        if ModelBundle.exists(name_model):
+            self.bundle = ModelBundle.load(name_model)
+            for problem in self.bundle.validate():
+                print('Warning model bundle {0}: {1}'.format(name_model, problem))
+            self.type_features = self.bundle.type_features
+            self.sparse = self.bundle.sparse or sparse
+            self.clf = self.bundle.estimator
+            granularity = granularity if granularity is not None else self.bundle.extra.get('granularity')
+            if self.bundle.selected_columns is not None:
+                # Only the feature groups holding a selected column are extracted
+                self.selection = self.bundle.schema.subset(self.bundle.selected_columns)
+                print('Feature selection: {0} columns from {1}'.format(len(self.bundle.selected_columns),
+                                                                      self.selection[0]))
+        else:
+            file_model = '{0}{1}.pkl'.format(DIR_MODELS, name_model)
+            with open(file_model, 'rb') as file:
+                self.clf = pickle.load(file)
+        # 'tweet' featurizes every tweet on its own and pools per author, as the model was trained (TweetFeatures)
+        self.granularity = granularity if granularity is not None else 'document'
+        if self.granularity not in ['document', 'tweet']:
+            raise ValueError('Granularity not supported: {0}'.format(self.granularity))
+        if self.granularity == 'tweet' and isinstance(self.clf, CascadeClassifier):
+            raise ValueError('The cascade featurizes whole documents, granularity must be document')
+        if compiled:
+            try:
+                self.clf = CompiledForest.from_estimator(self.clf, max_batch=256)
+            except ValueError as e:
+                print('Warning compiled model: {0}'.format(e))
+
+    @property
+    def ta(self):
+        if self._ta is None:
+            self._ta = TextAnalysis(lang=self.lang, instrumentation=self.metrics)
+        return self._ta
+
+    @property
+    def features(self):
+        if self._features is None:
+            self._features = FeatureExtraction(lang=self.lang, text_analysis=self.ta, quantized=self.quantized)
+            if self.bundle is not None:
+                schema = self._features.schema(self.bundle.type_features)
+                if schema.size != self.bundle.schema.size:
+                    print('Warning model bundle: schema has {0} columns, model expects {1}'.format(
+                        schema.size, self.bundle.schema.size))
+        return self._features
 
-    def run(self, type_features: list = [1, 1, 1, 1]):
+    @property
+    def tweet_features(self):
+        if self._tweet_features is None:
+            self._tweet_features = TweetFeatures(self.features)
+        return self._tweet_features
+
+    @property
+    def test(self):
+        # The whole test set is only loaded by the sequential run
+        if self._test is None:
+            self._test = self.reader.get_data()
+        return self._test
+
+    def run(self, type_features: list = None, consolidated: str = None, processes: int = 0, files: list = None,
+            path_dir: str = None):
+        # files restricts the run to those xml files of the dataset, path_dir overrides the output directory.
+        # Returns the number of authors written, None on error.
+        if processes > 0:
+            return self.run_pipeline(type_features=type_features, consolidated=consolidated, processes=processes,
+                                     files=files, path_dir=path_dir)
         try:
-            out = []
+            type_features = self.type_features if type_features is None else type_features
             print('Predicting users ...')
             count_one = 0
             count_zero = 0
-            for user, cont in tqdm(self.test.items()):
-                x_test = self.ta.clean_text(cont, stopwords=False)
-                x_test = [list(self.features.get_features(x_test, type_features))]
-                # x_test = preprocessing.normalize(x_test, norm='l2')
-                predict = int(self.clf.predict(x_test)[0])
-                if predict == 1:
-                    count_one += 1
-                else:
-                    count_zero += 1
-                out.append({'id': user, 'lang': self.lang, 'type': predict})
+            if self.granularity == 'tweet':
+                authors = ((row['user'], row['tweets']) for row in self.reader.iter_tweets(files))
+            elif files is None:
+                authors = self.test.items()
+            else:
+                authors = ((row['user'], row['content']) for row in self.reader.iter_data(files))
+            with ResultWriter(lang=self.lang, path_dir=path_dir, consolidated=consolidated) as writer:
+                for user, cont in tqdm(authors):
+                    if self.granularity == 'tweet':
+                        predict = int(self.predict_tweets([cont], type_features)[0])
+                    else:
+                        with self.metrics.timer('clean_text'):
+                            x_test = self.ta.clean_text(cont, stopwords=False)
+                        predict = int(self.predict([x_test], type_features)[0])
+                    if predict == 1:
+                        count_one += 1
+                    else:
+                        count_zero += 1
+                    writer.write({'id': user, 'lang': self.lang, 'type': predict})
+            self.features.save_caches()
             print('Statistical result:\n# Ones: {0}\n# Zeros: {1}'.format(count_one, count_zero))
-            # make files
-            print('Generating files ...')
-            path = '{0}{1}{2}'.format(DIR_OUTPUT, self.lang, os.sep)
-            for row in tqdm(out):
-                path_file = '{0}{1}{2}'.format(path, row['id'], '.xml')
-                file = open(path_file, "w")
-                text = '<author id="{0}" lang="{1}" type="{2}"/>'.format(row['id'], row['lang'], row['type'])
-                file.writelines(text)
-                file.close()
+            print('Files generated in {0}'.format(writer.path_dir))
+            if isinstance(self.clf, CascadeClassifier):
+                self.clf.report()
+            if self.metrics.enabled:
+                self.metrics.report()
+                self.metrics.to_json()
+                self.metrics.to_prometheus()
+            return count_one + count_zero
         except Exception as e:
             print('Error baseline: {0}'.format(e))
 
-    def testing_model(self, cont: str = '', type_features: list = [1, 1, 1, 1]):
+    def run_pipeline(self, type_features: list = None, consolidated: str = None, processes: int = None,
+                     batch_size: int = 16, queue_size: int = 8, files: list = None, path_dir: str = None):
+        # reader thread -> bounded queue -> featurization pool -> batched prediction -> writer thread.
+        # At most queue_size batches wait to be read and queue_size batches are in the pool at once,
+        # so memory stays flat and the throughput follows the slowest stage.
+        try:
+            type_features = self.type_features if type_features is None else type_features
+            processes = processes if processes is not None else max(1, (os.cpu_count() or 2) - 1)
+            cascade = self.clf if isinstance(self.clf, CascadeClassifier) else None
+            read = queue.Queue(maxsize=queue_size)
+            reader = threading.Thread(target=self._read_stage, args=(read, batch_size, files), name='test-reader',
+                                      daemon=True)
+            print('Predicting users with {0} processes ...'.format(processes))
+            count = {0: 0, 1: 0}
+            reader.start()
+            initargs = (self.lang, type_features, self.sparse, self.selection, self.quantized, cascade,
+                        self.metrics.enabled, self.bundle.schema.size if self.bundle is not None else None,
+                        self.granularity)
+            pool = Pool(processes, initializer=_init_featurizer, initargs=initargs)
+            try:
+                with ResultWriter(lang=self.lang, path_dir=path_dir, consolidated=consolidated) as writer, \
+                        tqdm() as progress:
+                    # Batches are submitted from this thread and at most queue_size are in the pool; they are
+                    # collected in submission order, so an error in a worker is raised here.
+                    window = deque()
+                    while True:
+                        batch = read.get()
+                        if batch is not None:
+                            window.append(pool.apply_async(_featurize, (batch,)))
+                        while window and (batch is None or len(window) >= queue_size):
+                            users, x, labels, stats = window.popleft().get()
+                            self.merge_stats(stats)
+                            if labels is None:
+                                with self.metrics.timer('predict'):
+                                    labels = self.clf.predict(x)
+                            for user, predict in zip(users, labels):
+                                predict = int(predict)
+                                count[1 if predict == 1 else 0] += 1
+                                writer.write({'id': user, 'lang': self.lang, 'type': predict})
+                            progress.update(len(users))
+                        if batch is None:
+                            break
+                # Workers save their caches on exit
+                pool.close()
+                pool.join()
+            finally:
+                pool.terminate()
+            reader.join()
+            print('Statistical result:\n# Ones: {0}\n# Zeros: {1}'.format(count[1], count[0]))
+            print('Files generated in {0}'.format(writer.path_dir))
+            if cascade is not None:
+                cascade.report()
+            if self.metrics.enabled:
+                self.metrics.report()
+                self.metrics.to_json()
+                self.metrics.to_prometheus()
+            return count[0] + count[1]
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error run_pipeline: {0}'.format(e))
+
+    def merge_stats(self, stats: dict):
+        # Metrics and cascade stages of a batch featurized in a worker
+        self.metrics.merge(stats['metrics'])
+        if stats['stages'] is not None and isinstance(self.clf, CascadeClassifier):
+            for k, v in stats['stages'].items():
+                self.clf.stages[k] = self.clf.stages.get(k, 0) + v
+
+    def _read_stage(self, read: queue.Queue, batch_size: int, files: list = None):
+        batch = []
+        try:
+            if self.granularity == 'tweet':
+                rows = ((row['user'], row['tweets']) for row in self.reader.iter_tweets(files))
+            else:
+                rows = ((row['user'], row['content']) for row in self.reader.iter_data(files))
+            for row in rows:
+                batch.append(row)
+                if len(batch) == batch_size:
+                    read.put(batch)
+                    batch = []
+            if batch:
+                read.put(batch)
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error read_stage: {0}'.format(e))
+        finally:
+            read.put(None)
+
+    def testing_model(self, cont: str = '', type_features: list = None):
+        type_features = self.type_features if type_features is None else type_features
         x_test = self.ta.clean_text(cont, stopwords=False)
-        x_test = [list(self.features.get_features(x_test, type_features))]
-        # x_test = preprocessing.normalize(x_test, norm='l2')
-        predict = int(self.clf.predict(x_test)[0])
+        predict = int(self.predict([x_test], type_features)[0])
         print('Predict: {0}'.format(predict))
 
+    def predict(self, list_messages: list, type_features: list = None):
+        if isinstance(self.clf, CascadeClassifier):
+            return self.clf.predict_messages(self.features, list_messages, sparse=self.sparse)
+        x_test = self.featurize(list_messages, type_features)
+        # x_test = preprocessing.normalize(x_test, norm='l2')
+        with self.metrics.timer('predict'):
+            return self.clf.predict(x_test)
+
+    def predict_tweets(self, list_tweets: list, type_features: list = None):
+        # list_tweets: per author the list of its raw tweets
+        type_features = self.type_features if type_features is None else type_features
+        if self.selection is not None:
+            schema, positions = self.selection
+            x = self.tweet_features.transform(list_tweets, schema.type_features, sparse=self.sparse)[:, positions]
+        else:
+            x = self.tweet_features.transform(list_tweets, type_features, sparse=self.sparse)
+        with self.metrics.timer('predict'):
+            return self.clf.predict(x)
+
+    def featurize(self, list_messages: list, type_features: list = None):
+        type_features = self.type_features if type_features is None else type_features
+        if self.selection is not None:
+            schema, positions = self.selection
+            x = self.features.transform_batch(list_messages, schema.type_features, sparse=self.sparse)
+            return x[:, positions]
+        return self.features.transform_batch(list_messages, type_features, sparse=self.sparse)
+
 
 if __name__ == "__main__":
     tm = HateModels(lang='es', name_model='hate_randomforest_es',
@@ -0,0 +1,141 @@
+import math
+import sys
+import time
+import numpy as np
+from joblib import Parallel, delayed, effective_n_jobs
+from scipy import sparse as sp
+from sklearn.base import clone
+from sklearn.model_selection import ParameterGrid, ParameterSampler, StratifiedShuffleSplit, cross_val_score
+from logic.classifiers import Classifiers
+from logic.utils import Utils
+
+
+def _evaluate(clf, x, y, n_splits, random_state):
+    cv = StratifiedShuffleSplit(n_splits=n_splits, test_size=0.30, random_state=random_state)
+    start = time.perf_counter()
+    scores = cross_val_score(clf, x, y, cv=cv)
+    return float(np.mean(scores)), float(np.std(scores)), time.perf_counter() - start
+
+
+class HyperparameterSearch(object):
+    """
+    Successive halving over the Classifiers registry.
+
+    Every (classifier, parameters) candidate is scored on a small stratified
+    subset with few folds; the best 1/factor are promoted to factor times
+    more rows, until the last round scores the survivors on all the rows
+    with max_folds. Candidates of a round run in parallel with joblib, in
+    batches of one candidate per worker, and no new batch starts once
+    time_budget (seconds) is spent: the budget is exceeded by one batch at
+    most. The best candidate of the latest round is returned then.
+    """
+
+    def __init__(self, classifiers: dict = None, spaces: dict = None, n_candidates: int = 10, factor: int = 3,
+                 min_resources: int = 100, min_folds: int = 3, max_folds: int = 10, time_budget: float = None,
+                 n_jobs: int = -1, random_state: int = 42):
+        self.classifiers = classifiers if classifiers is not None else Classifiers.dict_classifiers
+        self.spaces = spaces if spaces is not None else Classifiers.param_spaces
+        self.n_candidates = n_candidates
+        self.factor = factor
+        self.min_resources = min_resources
+        self.min_folds = min_folds
+        self.max_folds = max_folds
+        self.time_budget = time_budget
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.rounds = []
+        self.best = None
+
+    def candidates(self):
+        # Up to n_candidates parameter sets per classifier, the whole grid when it is smaller
+        result = []
+        for name, clf in self.classifiers.items():
+            space = self.spaces.get(name, {})
+            grid = ParameterGrid(space)
+            if len(grid) <= self.n_candidates:
+                params = list(grid)
+            else:
+                params = list(ParameterSampler(space, n_iter=self.n_candidates, random_state=self.random_state))
+            result.extend((name, p) for p in params)
+        return result
+
+    def estimator(self, name: str, params: dict):
+        clf = clone(self.classifiers[name]).set_params(**params)
+        if 'n_jobs' in clf.get_params():
+            # Parallelism is across candidates
+            clf.set_params(n_jobs=1)
+        return clf
+
+    def fit(self, x, y):
+        try:
+            start = time.time()
+            y = np.asarray(y)
+            dense = {}
+            candidates = self.candidates()
+            if len(candidates) == 0:
+                raise ValueError('No candidates to search, the classifiers or their parameter spaces are empty')
+            # One candidate per worker between two checks of the time budget
+            batch = effective_n_jobs(self.n_jobs)
+            n_rounds = max(1, int(math.ceil(math.log(len(candidates), self.factor))))
+            first = max(self.min_resources, len(y) // self.factor ** (n_rounds - 1))
+            print('Hyperparameter search: {0} candidates, {1} rounds'.format(len(candidates), n_rounds))
+            parallel = Parallel(n_jobs=self.n_jobs)
+            for i in range(n_rounds):
+                last = i == n_rounds - 1 or len(candidates) == 1
+                n_rows = len(y) if last else min(len(y), first * self.factor ** i)
+                n_splits = self.max_folds if last else self.min_folds
+                rows = self.subset(y, n_rows)
+                scored = []
+                for b in range(0, len(candidates), batch):
+                    if self.time_budget is not None and time.time() - start > self.time_budget:
+                        print('Time budget of {0} seconds spent'.format(self.time_budget))
+                        break
+                    chunk = candidates[b:b + batch]
+                    results = parallel(
+                        delayed(_evaluate)(self.estimator(name, params), self.rows(x, name, rows, dense), y[rows],
+                                           n_splits, self.random_state) for name, params in chunk)
+                    scored.extend((c, r) for c, r in zip(chunk, results))
+                if len(scored) == 0:
+                    break
+                scored.sort(key=lambda item: -item[1][0])
+                self.rounds.append({'round': i + 1, 'rows': n_rows, 'folds': n_splits,
+                                    'results': [{'classifier': name, 'params': params, 'accuracy': mean,
+                                                 'std': std, 'seconds': round(seconds, 3)}
+                                                for (name, params), (mean, std, seconds) in scored]})
+                self.best = self.rounds[-1]['results'][0]
+                print('Round {0}: {1} candidates on {2} rows and {3} folds, best {4} {5} accuracy {6:.4f}'.format(
+                    i + 1, len(scored), n_rows, n_splits, self.best['classifier'], self.best['params'],
+                    self.best['accuracy']))
+                if last or len(scored) < len(candidates):
+                    break
+                candidates = [c for c, _ in scored[:max(1, len(scored) // self.factor)]]
+            print('Search time: {0:.1f} seconds'.format(time.time() - start))
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error HyperparameterSearch fit: {0}'.format(e))
+            raise
+        return self
+
+    def subset(self, y, n_rows: int):
+        # Sorted rows of a stratified sample of n_rows, all of them when there is no room for a split
+        n_classes = len(np.unique(y))
+        if n_rows > len(y) - n_classes:
+            return np.arange(len(y))
+        if n_rows < n_classes:
+            return np.sort(np.random.RandomState(self.random_state).permutation(len(y))[:n_rows])
+        split = StratifiedShuffleSplit(n_splits=1, train_size=n_rows, random_state=self.random_state)
+        rows, _ = next(split.split(np.zeros((len(y), 1)), y))
+        return np.sort(rows)
+
+    @staticmethod
+    def rows(x, name: str, rows, dense: dict):
+        if sp.issparse(x) and name not in Classifiers.accept_sparse:
+            if 'x' not in dense:
+                dense['x'] = x.toarray()
+            return dense['x'][rows]
+        return x[rows]
+
+    def best_estimator(self):
+        if self.best is None:
+            raise ValueError('No candidate was scored within the time budget')
+        return clone(self.classifiers[self.best['classifier']]).set_params(**self.best['params'])
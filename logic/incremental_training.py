@@ -0,0 +1,77 @@
+import sys
+import numpy as np
+from sklearn.base import clone
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import MaxAbsScaler
+from logic.classifiers import Classifiers
+from logic.feature_shards import FeatureShards
+from logic.utils import Utils
+
+
+class IncrementalTraining(object):
+    """
+    Out-of-core training of partial_fit learners over FeatureShards.
+
+    A first pass over the training shards fits a MaxAbsScaler (it keeps CSR
+    sparse and features non-negative). Each epoch then streams the training
+    shards in a new order and updates every learner shard by shard. The
+    held-out shards are evaluated the same way, accumulating the confusion
+    counts, so neither side ever needs the full matrix in memory.
+    """
+    classes = np.array([0, 1])
+
+    def __init__(self, learners: dict = None, epochs: int = 5, random_state: int = 42):
+        learners = learners if learners is not None else Classifiers.dict_incremental
+        self.learners = {k: clone(v) for k, v in learners.items()}
+        self.epochs = epochs
+        self.random_state = random_state
+        self.scaler = MaxAbsScaler()
+        self.history = []
+
+    def scale(self, name: str, x):
+        return self.scaler.transform(x) if name in Classifiers.scaled else x
+
+    def fit(self, shards: FeatureShards, train: list, test: list):
+        try:
+            for x, _ in shards.iterate(train):
+                self.scaler.partial_fit(x)
+            for epoch in range(1, self.epochs + 1):
+                for x, y in shards.iterate(train, shuffle=True, random_state=self.random_state + epoch):
+                    for name, clf in self.learners.items():
+                        clf.partial_fit(self.scale(name, x), y, classes=self.classes)
+                scores = self.evaluate(shards, test)
+                self.history.append({'epoch': epoch, 'scores': scores})
+                print('Epoch {0}: {1}'.format(epoch, ', '.join('{0} acc {1:.3f} f1 {2:.3f}'.format(
+                    k, v['accuracy'], v['f1']) for k, v in scores.items())))
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error IncrementalTraining fit: {0}'.format(e))
+            raise
+        return self
+
+    def evaluate(self, shards: FeatureShards, test: list):
+        counts = {name: np.zeros((2, 2), dtype=np.int64) for name in self.learners}
+        for x, y in shards.iterate(test):
+            for name, clf in self.learners.items():
+                predict = clf.predict(self.scale(name, x))
+                np.add.at(counts[name], (np.asarray(y, dtype=np.intp), np.asarray(predict, dtype=np.intp)), 1)
+        return {name: self.scores(matrix) for name, matrix in counts.items()}
+
+    @staticmethod
+    def scores(matrix):
+        tn, fp, fn, tp = matrix.ravel()
+        total = matrix.sum()
+        precision = tp / (tp + fp) if tp + fp > 0 else 0.0
+        recall = tp / (tp + fn) if tp + fn > 0 else 0.0
+        return {'accuracy': float((tp + tn) / total) if total > 0 else 0.0, 'precision': float(precision),
+                'recall': float(recall),
+                'f1': float(2 * precision * recall / (precision + recall)) if precision + recall > 0 else 0.0}
+
+    def best(self):
+        # Learner with the best held-out accuracy in the last epoch, with its scaler when it uses one
+        scores = self.history[-1]['scores']
+        name = max(scores, key=lambda k: scores[k]['accuracy'])
+        clf = self.learners[name]
+        if name in Classifiers.scaled:
+            clf = Pipeline([('scaler', self.scaler), ('clf', clf)])
+        return name, clf, scores[name]
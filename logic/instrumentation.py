@@ -0,0 +1,206 @@
+import functools
+import json
+import os
+import threading
+import time
+from root import DIR_METRICS
+
+
+class Instrumentation(object):
+    """
+    Opt-in timers and counters for the feature extraction hot path.
+
+    A disabled instance (the default everywhere) turns every call into a
+    no-op, so the pipeline only pays for the metrics when they are asked for.
+    Values are aggregated for the life of the instance and can be exported
+    as JSON or as a Prometheus text file.
+    """
+    prefix = 'phonetic_hate_speech'
+
+    def __init__(self, enabled: bool = True, name: str = 'run'):
+        self.enabled = enabled
+        self.name = name
+        self.lock = threading.Lock()
+        self.timers = {}
+        self.counters = {}
+        self.caches = {}
+
+    def reset(self):
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+            self.caches = {}
+
+    def state(self, reset: bool = False):
+        # Raw values, to be merged into another instance (e.g. from a worker process)
+        with self.lock:
+            result = {'timers': {k: dict(v) for k, v in self.timers.items()}, 'counters': dict(self.counters),
+                      'caches': {k: dict(v) for k, v in self.caches.items()}}
+            if reset:
+                self.timers, self.counters, self.caches = {}, {}, {}
+        return result
+
+    def merge(self, state: dict):
+        if not self.enabled or not state:
+            return self
+        with self.lock:
+            for k, v in state['timers'].items():
+                item = self.timers.setdefault(k, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+                item['calls'] += v['calls']
+                item['seconds'] += v['seconds']
+                item['max_seconds'] = max(item['max_seconds'], v['max_seconds'])
+            for k, v in state['counters'].items():
+                self.counters[k] = self.counters.get(k, 0) + v
+            for k, v in state['caches'].items():
+                item = self.caches.setdefault(k, {'hits': 0, 'misses': 0})
+                item['hits'] += v['hits']
+                item['misses'] += v['misses']
+        return self
+
+    def timer(self, name: str):
+        return _Timer(self, name) if self.enabled else _NULL_TIMER
+
+    def record(self, name: str, seconds: float):
+        with self.lock:
+            item = self.timers.setdefault(name, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            item['calls'] += 1
+            item['seconds'] += seconds
+            item['max_seconds'] = max(item['max_seconds'], seconds)
+
+    def add(self, name: str, value: float = 1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def oov(self, vocabulary: str, total: int, missing: int):
+        if self.enabled:
+            with self.lock:
+                self.counters['{0}_lookups'.format(vocabulary)] = \
+                    self.counters.get('{0}_lookups'.format(vocabulary), 0) + total
+                self.counters['{0}_oov'.format(vocabulary)] = \
+                    self.counters.get('{0}_oov'.format(vocabulary), 0) + missing
+
+    def cache(self, name: str, hits: int = 0, misses: int = 0):
+        if self.enabled:
+            with self.lock:
+                item = self.caches.setdefault(name, {'hits': 0, 'misses': 0})
+                item['hits'] += hits
+                item['misses'] += misses
+
+    def to_dict(self):
+        with self.lock:
+            timers = {k: {'calls': v['calls'], 'seconds': round(v['seconds'], 6),
+                          'mean_ms': round(v['seconds'] * 1000 / v['calls'], 4) if v['calls'] else 0.0,
+                          'max_ms': round(v['max_seconds'] * 1000, 4)} for k, v in self.timers.items()}
+            counters = dict(self.counters)
+            oov_rates = {}
+            for k, v in self.counters.items():
+                if k.endswith('_lookups') and v > 0:
+                    vocabulary = k[:-len('_lookups')]
+                    oov_rates[vocabulary] = round(self.counters.get(vocabulary + '_oov', 0) / v, 6)
+            caches = {}
+            for k, v in self.caches.items():
+                total = v['hits'] + v['misses']
+                caches[k] = {'hits': v['hits'], 'misses': v['misses'],
+                             'hit_rate': round(v['hits'] / total, 6) if total > 0 else 0.0}
+        return {'name': self.name, 'timers': timers, 'counters': counters, 'oov_rates': oov_rates,
+                'caches': caches}
+
+    def to_json(self, file: str = None):
+        file = self._file(file, 'json')
+        with open(file, 'w', encoding='utf-8') as output:
+            json.dump(self.to_dict(), output, indent=2)
+        return file
+
+    def to_prometheus(self, file: str = None):
+        file = self._file(file, 'prom')
+        data = self.to_dict()
+        p = self.prefix
+        lines = ['# HELP {0}_stage_seconds_total Time spent in each instrumented method.'.format(p),
+                 '# TYPE {0}_stage_seconds_total counter'.format(p)]
+        lines += ['{0}_stage_seconds_total{{stage="{1}"}} {2}'.format(p, k, v['seconds'])
+                  for k, v in data['timers'].items()]
+        lines += ['# HELP {0}_stage_calls_total Calls of each instrumented method.'.format(p),
+                  '# TYPE {0}_stage_calls_total counter'.format(p)]
+        lines += ['{0}_stage_calls_total{{stage="{1}"}} {2}'.format(p, k, v['calls'])
+                  for k, v in data['timers'].items()]
+        lines += ['# HELP {0}_items_total Items processed (tokens, syllables, phonemes, lookups).'.format(p),
+                  '# TYPE {0}_items_total counter'.format(p)]
+        lines += ['{0}_items_total{{item="{1}"}} {2}'.format(p, k, v) for k, v in data['counters'].items()]
+        lines += ['# HELP {0}_oov_ratio Out of vocabulary rate against the embeddings.'.format(p),
+                  '# TYPE {0}_oov_ratio gauge'.format(p)]
+        lines += ['{0}_oov_ratio{{vocabulary="{1}"}} {2}'.format(p, k, v) for k, v in data['oov_rates'].items()]
+        lines += ['# HELP {0}_cache_requests_total Cache lookups by result.'.format(p),
+                  '# TYPE {0}_cache_requests_total counter'.format(p)]
+        for k, v in data['caches'].items():
+            lines.append('{0}_cache_requests_total{{cache="{1}",result="hit"}} {2}'.format(p, k, v['hits']))
+            lines.append('{0}_cache_requests_total{{cache="{1}",result="miss"}} {2}'.format(p, k, v['misses']))
+        with open(file, 'w', encoding='utf-8') as output:
+            output.write('\n'.join(lines) + '\n')
+        return file
+
+    def report(self):
+        data = self.to_dict()
+        print('-' * 40)
+        print('Instrumentation: {0}'.format(self.name))
+        for k, v in sorted(data['timers'].items(), key=lambda item: -item[1]['seconds']):
+            print('{0:<28}{1:>8} calls {2:>10.3f} sec {3:>10.3f} ms/call'.format(k, v['calls'], v['seconds'],
+                                                                             v['mean_ms']))
+        for k, v in data['oov_rates'].items():
+            print('OOV {0}: {1:.2%}'.format(k, v))
+        for k, v in data['caches'].items():
+            print('Cache {0}: {1:.2%} hits'.format(k, v['hit_rate']))
+        print('-' * 40)
+
+    def _file(self, file, extension):
+        if file is None:
+            os.makedirs(DIR_METRICS, exist_ok=True)
+            file = '{0}{1}.{2}'.format(DIR_METRICS, self.name, extension)
+        return file
+
+
+class _Timer(object):
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.metrics.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(name: str):
+    """
+    Method decorator timing the call against ``self.metrics`` when enabled.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            metrics = getattr(self, 'metrics', None)
+            if metrics is None or not metrics.enabled:
+                return func(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                metrics.record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
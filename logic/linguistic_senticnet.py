@@ -1,4 +1,6 @@
 import importlib
+from logic.instrumentation import timed
+from logic.lru_cache import LRUCache
 from logic.text_analysis import TextAnalysis
 from logic.triggers import rules
 from root import DATA_BABEL
@@ -15,7 +17,7 @@ class LinguisticSenticNet:
     This class offers dependency analysis task to be performed.
 
     """
-    def __init__(self, lang='es', text_analysis=None):
+    def __init__(self, lang='es', text_analysis=None, cache_size: int = 100000):
         try:
             data_module = importlib.import_module(DATA_BABEL + lang)
             self.data = data_module.senticnet
@@ -24,6 +26,9 @@ class LinguisticSenticNet:
                 self.ta = TextAnalysis(lang=lang)
             else:
                 self.ta = text_analysis
+            self.metrics = self.ta.metrics
+            # Raw chunk -> (concept, trace, polarity, inversion), chunks recur across many tweets
+            self.chunk_cache = LRUCache(maxsize=cache_size, name='polarity_chunks')
         except Exception as e:
             print('Error __init__: {0}'.format(e))
 
@@ -214,6 +219,27 @@ class LinguisticSenticNet:
             print('Error moodtags: {0}'.format(e))
         return val
 
+    def resolve_chunk(self, chunk):
+        """
+        Return (concept, trace, polarity, inversion) of a raw chunk. The concept is the chunk itself when
+        SenticNet knows it, otherwise its cleaned text; trace is None when the concept is unknown.
+        """
+        result = self.chunk_cache.get(chunk)
+        if result is None:
+            concept = chunk
+            if self.sentics(concept) is None:
+                concept = self.ta.clean_text(chunk)
+            if concept is not None and self.sentics(concept) is not None:
+                trace = self.concept(concept)
+                polarity = float(self.polarity_value(concept))
+            else:
+                trace = None
+                polarity = 0.0
+            inversion = self.polarity_inversion(concept) if concept is not None else False
+            result = self.chunk_cache.put(chunk, (concept, trace, polarity, inversion))
+        return result
+
+    @timed('polarity_text')
     def polarity_text(self, text):
         result = None
         try:
@@ -223,40 +249,34 @@ class LinguisticSenticNet:
             polarity_VERB = 0.0
             polarity = 0.0
             trace = []
-            chunks = []
+            chunks = set()
             count_chunks = 1
+            cache = self.chunk_cache
+            hits, misses = cache.hits, cache.misses
             dict_chunks = self.ta.syntax_patterns(text)
             for type_chunk, list_chunk in dict_chunks.items():
                 if len(list_chunk) > 0:
                     for chunk in list_chunk:
                         polarity_value = 0.0
-                        if self.sentics(chunk) is None:
-                            chunk = self.ta.clean_text(chunk)
-                            if self.sentics(chunk) is not None and chunk not in chunks:
-                                chunks.append(chunk)
-                                dict_trace = {'text': chunk}
-                                dict_trace.update(self.concept(chunk))
-                                trace.append(dict_trace)
-                                polarity_value = float(self.polarity_value(chunk)) 
-                                count_chunks += 1
-                        else:
-                            if chunk not in chunks:
-                                chunks.append(chunk)
-                                dict_trace = {'text': chunk}
-                                dict_trace.update(self.concept(chunk))
-                                trace.append(dict_trace)
-                                polarity_value = float(self.polarity_value(chunk))
-                                count_chunks += 1
-                                
+                        concept, concept_trace, concept_polarity, inversion = self.resolve_chunk(chunk)
+                        if concept_trace is not None and concept not in chunks:
+                            chunks.add(concept)
+                            dict_trace = {'text': concept}
+                            dict_trace.update(concept_trace)
+                            trace.append(dict_trace)
+                            polarity_value = concept_polarity
+                            count_chunks += 1
+
                         if type_chunk == 'NOUN':
                             polarity_NOUN += polarity_value
                         elif type_chunk == 'VERB':
                             polarity_VERB += (1 * polarity_value)
                         elif type_chunk == 'ADV':
-                            if self.polarity_inversion(chunk):
+                            if inversion:
                                 polarity_ADV += (-2 * polarity_value)
                             else:
                                 polarity_ADV += (2 * polarity_value)
+            self.metrics.cache('polarity_chunks', hits=cache.hits - hits, misses=cache.misses - misses)
 
             polarity = (polarity_NOUN + polarity_VERB + polarity_ADV)
             polarity = round((polarity / count_chunks ), 3)
@@ -266,7 +286,9 @@ class LinguisticSenticNet:
                 status_msg = 'NEGATIVE'
             else:
                 status_msg = 'NEUTRAL'
-            result = {'msg': text, 'polarity_label': status_msg, 'polarity_value': polarity, 'trace': trace}
+            # polarity_sum and concepts let tweet level polarities be pooled per author
+            result = {'msg': text, 'polarity_label': status_msg, 'polarity_value': polarity, 'trace': trace,
+                      'polarity_sum': polarity_NOUN + polarity_VERB + polarity_ADV, 'concepts': count_chunks - 1}
         except Exception as e:
             print('Error polarity_text: {0}'.format(e))
         return result
@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Bounded least-recently-used cache with hit/miss counters.
+
+    Values must be JSON serializable to use save/load (warm start from disk).
+    """
+
+    def __init__(self, maxsize: int = 100000, name: str = 'cache'):
+        self.maxsize = maxsize
+        self.name = name
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def stats(self):
+        return {'name': self.name, 'size': len(self.data), 'maxsize': self.maxsize, 'hits': self.hits,
+                'misses': self.misses, 'hit_rate': round(self.hit_rate, 6)}
+
+    def save(self, file: str):
+        # Unique temporary file in the same directory: processes saving the same cache do not clash
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(file) + '.', suffix='.tmp', dir=os.path.dirname(file))
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as output:
+                json.dump([[k, v] for k, v in self.data.items()], output, ensure_ascii=False)
+            os.replace(tmp, file)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return file
+
+    def load(self, file: str, converter=None):
+        # Entries are loaded oldest first so the most recent ones survive when maxsize is smaller.
+        # An unreadable or corrupt file is a cold start, not an error.
+        try:
+            with open(file, 'r', encoding='utf-8') as data:
+                entries = [(key, converter(value) if converter is not None else value)
+                           for key, value in json.load(data)]
+        except FileNotFoundError:
+            return self
+        except (OSError, ValueError, TypeError) as e:
+            print('Warning cache {0}: {1} ignored, {2}'.format(self.name, file, e))
+            return self
+        for key, value in entries:
+            self.put(key, value)
+        return self
@@ -0,0 +1,150 @@
+import datetime
+import hashlib
+import json
+import os
+import sys
+import joblib
+from logic.feature_schema import FeatureSchema
+from logic.utils import Utils
+from root import DIR_MODELS, DIR_EMBEDDING, DIR_DATA
+
+
+class ModelBundle(object):
+    """
+    Versioned model directory replacing the bare hate_model_{lang}.pkl.
+
+    <DIR_MODELS>/<name>/manifest.json  feature schema, training options and resource fingerprints
+    <DIR_MODELS>/<name>/estimator.joblib  uncompressed joblib dump, loaded with mmap_mode='r'
+
+    Large NumPy arrays of the estimator are memory mapped instead of unpickled,
+    so worker processes scoring with the same bundle share the pages.
+    """
+    format_version = 1
+    file_manifest = 'manifest.json'
+    file_estimator = 'estimator.joblib'
+
+    def __init__(self, name: str, path_dir: str = None, manifest: dict = None, mmap_mode: str = 'r'):
+        self.name = name
+        self.path_dir = path_dir if path_dir is not None else '{0}{1}{2}'.format(DIR_MODELS, name, os.sep)
+        self.manifest = manifest
+        self.mmap_mode = mmap_mode
+        self._estimator = None
+
+    @staticmethod
+    def resources(lang: str):
+        return {'syllable_embedding': '{0}syllable_embedding_{1}.model'.format(DIR_EMBEDDING, lang),
+                'phoneme_embedding': '{0}phoneme_embedding_{1}.model'.format(DIR_EMBEDDING, lang),
+                'senticnet': '{0}{1}babel{1}data_{2}.py'.format(DIR_DATA, os.sep, lang)}
+
+    @staticmethod
+    def fingerprint(file: str):
+        if not os.path.isfile(file):
+            return None
+        stat = os.stat(file)
+        sha256 = hashlib.sha256()
+        with open(file, 'rb') as data:
+            for block in iter(lambda: data.read(1 << 20), b''):
+                sha256.update(block)
+        return {'file': os.path.basename(file), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                'sha256': sha256.hexdigest()}
+
+    @staticmethod
+    def exists(name: str):
+        return os.path.isfile('{0}{1}{2}{3}'.format(DIR_MODELS, name, os.sep, ModelBundle.file_manifest))
+
+    @classmethod
+    def save(cls, clf, name: str, lang: str, schema: FeatureSchema, sparse: bool = False, extra: dict = None,
+             selected_columns=None):
+        bundle = cls(name)
+        os.makedirs(bundle.path_dir, exist_ok=True)
+        file_estimator = bundle.path_dir + cls.file_estimator
+        joblib.dump(clf, file_estimator + '.tmp')
+        manifest = {'format_version': cls.format_version,
+                    'name': name,
+                    'lang': lang,
+                    'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                    'estimator': '{0}.{1}'.format(type(clf).__module__, type(clf).__name__),
+                    'estimator_file': cls.fingerprint(file_estimator + '.tmp'),
+                    'type_features': schema.type_features,
+                    'sparse': sparse,
+                    'schema': schema.to_dict(),
+                    'selected_columns': [int(i) for i in selected_columns] if selected_columns is not None else None,
+                    'resources': {k: cls.fingerprint(v) for k, v in cls.resources(lang).items()},
+                    'extra': extra if extra is not None else {}}
+        manifest['estimator_file']['file'] = cls.file_estimator
+        os.replace(file_estimator + '.tmp', file_estimator)
+        with open(bundle.path_dir + cls.file_manifest + '.tmp', 'w', encoding='utf-8') as output:
+            json.dump(manifest, output, indent=2)
+        os.replace(bundle.path_dir + cls.file_manifest + '.tmp', bundle.path_dir + cls.file_manifest)
+        bundle.manifest = manifest
+        bundle._estimator = clf
+        return bundle
+
+    @classmethod
+    def load(cls, name: str, mmap_mode: str = 'r'):
+        bundle = cls(name, mmap_mode=mmap_mode)
+        with open(bundle.path_dir + cls.file_manifest, 'r', encoding='utf-8') as data:
+            bundle.manifest = json.load(data)
+        if bundle.manifest.get('format_version', 0) > cls.format_version:
+            raise ValueError('Model bundle {0} has format {1}, supported up to {2}'.format(
+                name, bundle.manifest['format_version'], cls.format_version))
+        return bundle
+
+    @property
+    def estimator(self):
+        # Loaded on first use
+        if self._estimator is None:
+            self._estimator = joblib.load(self.path_dir + self.file_estimator, mmap_mode=self.mmap_mode)
+        return self._estimator
+
+    @property
+    def schema(self):
+        return FeatureSchema.from_dict(self.manifest['schema'])
+
+    @property
+    def type_features(self):
+        return self.manifest['type_features']
+
+    @property
+    def sparse(self):
+        return self.manifest.get('sparse', False)
+
+    @property
+    def selected_columns(self):
+        return self.manifest.get('selected_columns')
+
+    @property
+    def extra(self):
+        return self.manifest.get('extra', {})
+
+    def validate(self, deep: bool = False, features=None):
+        # Size and mtime are checked first; files are only hashed when those differ or deep=True
+        problems = []
+        try:
+            expected = dict(self.manifest['resources'])
+            expected['estimator'] = self.manifest['estimator_file']
+            files = self.resources(self.manifest['lang'])
+            files['estimator'] = self.path_dir + self.file_estimator
+            for key, stored in expected.items():
+                file = files[key]
+                if stored is None:
+                    if os.path.isfile(file):
+                        problems.append('{0}: {1} did not exist at training time'.format(key, file))
+                    continue
+                if not os.path.isfile(file):
+                    problems.append('{0}: {1} not found'.format(key, file))
+                    continue
+                stat = os.stat(file)
+                if stat.st_size != stored['size']:
+                    problems.append('{0}: size changed {1} != {2}'.format(key, stat.st_size, stored['size']))
+                elif deep or stat.st_mtime_ns != stored['mtime_ns']:
+                    if self.fingerprint(file)['sha256'] != stored['sha256']:
+                        problems.append('{0}: content changed (sha256)'.format(key))
+            if features is not None:
+                schema = features.schema(self.type_features)
+                if schema.size != self.schema.size:
+                    problems.append('schema: {0} columns, model expects {1}'.format(schema.size, self.schema.size))
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            problems.append('Error validate: {0}'.format(e))
+        return problems
@@ -0,0 +1,253 @@
+import os
+import queue
+import sys
+import threading
+import time
+from multiprocessing import Pool
+from logic.cascade import CascadeClassifier
+from logic.data_transformation import DataTransformation
+from logic.hate_models import HateModels, _init_featurizer, _featurize
+from logic.result_writer import ResultWriter
+from logic.utils import Utils
+
+
+class MultiLanguageRunner(object):
+    """
+    Scores a mixed feed of authors tagged 'es' or 'en' in one invocation.
+
+    A reader thread routes authors into bounded per-language queues of
+    batches. One scheduler (the main thread) dispatches the batches to
+    per-language featurization pools and scores the results with the model
+    of their language; the parent only loads the estimators, text analysis
+    and embeddings are loaded in the workers. Every worker is a pool of one
+    process and the processes are split between languages in proportion to
+    their backlog (queued plus not yet read authors). Every
+    rebalance_interval seconds the split is computed again and the workers
+    a language has in excess are drained and closed, their processes start
+    workers for the languages short of them. When a language runs out of
+    work all its processes go to the language with the largest backlog.
+    """
+
+    def __init__(self, langs: list = ['es', 'en'], name_model: str = 'hate_model_{0}',
+                 dataset: str = 'pan21-author-profiling-test-without-gold', processes: int = None,
+                 batch_size: int = 16, queue_size: int = 8, sparse: bool = False, compiled: bool = False,
+                 quantized: str = None, rebalance_interval: float = 30.0):
+        self.langs = list(langs)
+        self.dataset = dataset
+        self.processes = processes if processes is not None else max(len(langs), (os.cpu_count() or 2) - 1)
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.rebalance_interval = rebalance_interval
+        self.rebalanced = time.time()
+        # HateModels loads text analysis and embeddings on first use, never in this process
+        self.models = {lang: HateModels(lang=lang, name_model=name_model.format(lang), dataset=dataset,
+                                        sparse=sparse, compiled=compiled, quantized=quantized) for lang in langs}
+        self.queues = {lang: queue.Queue(maxsize=queue_size) for lang in langs}
+        self.read = {lang: 0 for lang in langs}
+        self.totals = {lang: None for lang in langs}
+        self.finished = {lang: False for lang in langs}
+        self.pools = {lang: [] for lang in langs}
+        self.stats = {lang: {'authors': 0, 'ones': 0, 'zeros': 0, 'max_processes': 0} for lang in langs}
+
+    def dataset_rows(self):
+        # Authors of every language of the dataset, interleaved
+        readers = {}
+        for lang in self.langs:
+            data = DataTransformation(dataset=self.dataset, lang=lang, type_data='test')
+            self.totals[lang] = sum(1 for i in os.listdir(data.path_dir) if i.endswith('.xml'))
+            readers[lang] = data.iter_data()
+        while readers:
+            for lang in list(readers):
+                row = next(readers[lang], None)
+                if row is None:
+                    del readers[lang]
+                else:
+                    row['lang'] = lang
+                    yield row
+
+    def _read_stage(self, rows):
+        batches = {lang: [] for lang in self.langs}
+        try:
+            for row in rows:
+                lang = row['lang']
+                if lang not in batches:
+                    print('Warning author {0} with unsupported language {1}'.format(row['user'], lang))
+                    continue
+                batches[lang].append((row['user'], row['content']))
+                self.read[lang] += 1
+                if len(batches[lang]) == self.batch_size:
+                    self.queues[lang].put(batches[lang])
+                    batches[lang] = []
+            for lang, batch in batches.items():
+                if batch:
+                    self.queues[lang].put(batch)
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error read_stage: {0}'.format(e))
+        finally:
+            for lang in self.langs:
+                self.queues[lang].put(None)
+
+    def backlog(self, lang: str):
+        if self.finished[lang]:
+            return 0
+        pending = self.queues[lang].qsize() * self.batch_size
+        if self.totals[lang] is not None:
+            pending = max(pending, self.totals[lang] - self.stats[lang]['authors'])
+        return max(pending, 1)
+
+    def allocate(self, processes: int):
+        # Largest remainder split of the processes in proportion to the backlog, at least one each
+        active = [lang for lang in self.langs if not self.finished[lang]]
+        load = {lang: self.backlog(lang) for lang in active}
+        total = sum(load.values())
+        shares = {lang: max(1, int(processes * load[lang] / total)) for lang in active}
+        while sum(shares.values()) > processes and max(shares.values()) > 1:
+            shares[max(shares, key=shares.get)] -= 1
+        order = sorted(active, key=lambda lang: processes * load[lang] / total - shares[lang], reverse=True)
+        for lang in order[:max(0, processes - sum(shares.values()))]:
+            shares[lang] += 1
+        return shares
+
+    def start_pool(self, lang: str, processes: int):
+        model = self.models[lang]
+        cascade = model.clf if isinstance(model.clf, CascadeClassifier) else None
+        initargs = (lang, model.type_features, model.sparse, model.selection, model.quantized, cascade,
+                    model.metrics.enabled, model.bundle.schema.size if model.bundle is not None else None,
+                    model.granularity)
+        for _ in range(processes):
+            pool = Pool(1, initializer=_init_featurizer, initargs=initargs)
+            self.pools[lang].append({'pool': pool, 'processes': 1, 'in_flight': 0, 'draining': False})
+        self.stats[lang]['max_processes'] = max(self.stats[lang]['max_processes'], self.capacity(lang))
+        print('Language {0}: {1} processes'.format(lang, self.capacity(lang)))
+
+    def capacity(self, lang: str):
+        # Processes taking new batches, the draining ones are not counted
+        return sum(i['processes'] for i in self.pools[lang] if not i['draining'])
+
+    def in_flight(self, lang: str):
+        return sum(i['in_flight'] for i in self.pools[lang])
+
+    def dispatch(self, lang: str, results: queue.Queue):
+        # Up to two batches per process, each one to the least loaded pool of the language
+        active = [i for i in self.pools[lang] if not i['draining']]
+        while not self.finished[lang] and active and sum(i['in_flight'] for i in active) < 2 * self.capacity(lang):
+            try:
+                batch = self.queues[lang].get_nowait()
+            except queue.Empty:
+                return
+            if batch is None:
+                self.finished[lang] = True
+                return
+            slot = min(active, key=lambda i: i['in_flight'] / i['processes'])
+            slot['in_flight'] += 1
+            slot['pool'].apply_async(_featurize, (batch,),
+                                     callback=lambda r, l=lang, s=slot: results.put((l, s, r, None)),
+                                     error_callback=lambda e, l=lang, s=slot: results.put((l, s, None, e)))
+
+    def run(self, rows=None, consolidated: str = None):
+        writers = {}
+        try:
+            rows = rows if rows is not None else self.dataset_rows()
+            results = queue.Queue()
+            reader = threading.Thread(target=self._read_stage, args=(rows,), name='mixed-reader', daemon=True)
+            reader.start()
+            for lang in self.langs:
+                writers[lang] = ResultWriter(lang=lang, consolidated=consolidated).start()
+            for lang, processes in self.allocate(self.processes).items():
+                self.start_pool(lang, processes)
+            self.rebalanced = time.time()
+            while not all(self.finished.values()) or any(self.in_flight(lang) for lang in self.langs):
+                for lang in self.langs:
+                    self.dispatch(lang, results)
+                    if self.finished[lang] and self.pools[lang] and self.in_flight(lang) == 0:
+                        self.release(lang)
+                if time.time() - self.rebalanced >= self.rebalance_interval:
+                    self.rebalance()
+                self.close_drained()
+                try:
+                    lang, slot, result, error = results.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                slot['in_flight'] -= 1
+                if error is not None:
+                    raise error
+                self.score(lang, result, writers[lang])
+            for lang in self.langs:
+                self.release(lang)
+                writers[lang].close()
+            reader.join()
+            for lang in self.langs:
+                print('Language {0}: {1} authors, # Ones: {2}, # Zeros: {3}, up to {4} processes'.format(
+                    lang, self.stats[lang]['authors'], self.stats[lang]['ones'], self.stats[lang]['zeros'],
+                    self.stats[lang]['max_processes']))
+                if isinstance(self.models[lang].clf, CascadeClassifier):
+                    self.models[lang].clf.report()
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error MultiLanguageRunner run: {0}'.format(e))
+            for lang in self.langs:
+                for slot in self.pools[lang]:
+                    slot['pool'].terminate()
+                self.pools[lang] = []
+            for lang, writer in writers.items():
+                try:
+                    writer.close()
+                except Exception as e_close:
+                    print('Error MultiLanguageRunner close {0}: {1}'.format(lang, e_close))
+        return self.stats
+
+    def release(self, lang: str):
+        # A language without work gives its processes to the one with the largest backlog
+        freed = sum(i['processes'] for i in self.pools[lang])
+        for slot in self.pools[lang]:
+            slot['pool'].close()
+            slot['pool'].join()
+        self.pools[lang] = []
+        active = [i for i in self.langs if not self.finished[i]]
+        if freed > 0 and active:
+            target = max(active, key=self.backlog)
+            self.start_pool(target, freed)
+
+    def rebalance(self):
+        # Drains the processes a language has beyond its share of the backlog, close_drained hands them over
+        self.rebalanced = time.time()
+        active = [lang for lang in self.langs if not self.finished[lang]]
+        if len(active) < 2:
+            return
+        shares = self.allocate(self.processes)
+        for lang in active:
+            surplus = self.capacity(lang) - shares[lang]
+            for slot in sorted(self.pools[lang], key=lambda i: i['in_flight']):
+                if surplus <= 0 or self.capacity(lang) <= 1:
+                    break
+                if not slot['draining']:
+                    slot['draining'] = True
+                    surplus -= slot['processes']
+                    print('Language {0}: draining 1 process'.format(lang))
+
+    def close_drained(self):
+        # Drained workers without batches are closed and started again for the language most short of processes
+        for lang in self.langs:
+            for slot in [i for i in self.pools[lang] if i['draining'] and i['in_flight'] == 0]:
+                slot['pool'].close()
+                slot['pool'].join()
+                self.pools[lang].remove(slot)
+                active = [i for i in self.langs if not self.finished[i]]
+                if active:
+                    shares = self.allocate(self.processes)
+                    target = max(active, key=lambda i: (shares[i] - self.capacity(i), self.backlog(i)))
+                    self.start_pool(target, slot['processes'])
+
+    def score(self, lang: str, result, writer: ResultWriter):
+        users, x, labels, stats = result
+        model = self.models[lang]
+        model.merge_stats(stats)
+        if labels is None:
+            with model.metrics.timer('predict'):
+                labels = model.clf.predict(x)
+        for user, predict in zip(users, labels):
+            predict = int(predict)
+            self.stats[lang]['authors'] += 1
+            self.stats[lang]['ones' if predict == 1 else 'zeros'] += 1
+            writer.write({'id': user, 'lang': lang, 'type': predict})
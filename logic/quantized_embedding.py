@@ -0,0 +1,85 @@
+import os
+import numpy as np
+
+
+class QuantizedEmbedding(object):
+    """
+    Compact read-only copy of a Word2Vec embedding.
+
+    float16 stores the vectors as is; int8 stores round(v / scale) with one
+    scale per dimension (max absolute value / 127). Only the vocabulary and
+    the compact matrix are kept, rows are dequantized when they are read.
+    It exposes the subset of the gensim API used by the feature extraction
+    (vector_size, wv.index2word, wv.vocab, wv[word]).
+    """
+    dtypes = {'float16': np.float16, 'int8': np.int8}
+
+    def __init__(self, index2word: list, data, scale=None, dtype: str = 'int8'):
+        self.index2word = list(index2word)
+        self.vocab = {w: i for i, w in enumerate(self.index2word)}
+        self.data = data
+        self.scale = scale
+        self.dtype = dtype
+        self.vector_size = int(data.shape[1])
+
+    @property
+    def wv(self):
+        return self
+
+    @classmethod
+    def from_model(cls, model, dtype: str = 'int8'):
+        vectors = np.asarray(model.wv.vectors, dtype=np.float32)
+        if dtype == 'float16':
+            return cls(model.wv.index2word, vectors.astype(np.float16), dtype=dtype)
+        if dtype != 'int8':
+            raise ValueError('Unsupported dtype {0}, use one of {1}'.format(dtype, list(cls.dtypes)))
+        scale = np.abs(vectors).max(axis=0) / 127.0
+        scale[scale == 0.0] = 1.0
+        data = np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+        return cls(model.wv.index2word, data, scale.astype(np.float32), dtype=dtype)
+
+    @staticmethod
+    def file_name(path_model: str, dtype: str = 'int8'):
+        return '{0}.{1}.npz'.format(os.path.splitext(path_model)[0], dtype)
+
+    def save(self, file: str):
+        # Vocabulary entries never contain a new line, they are stored as one utf-8 buffer
+        words = np.frombuffer('\n'.join(self.index2word).encode('utf-8'), dtype=np.uint8)
+        scale = self.scale if self.scale is not None else np.zeros(0, dtype=np.float32)
+        with open(file + '.tmp', 'wb') as output:
+            np.savez(output, words=words, data=self.data, scale=scale, dtype=np.array(self.dtype))
+        os.replace(file + '.tmp', file)
+        return file
+
+    @classmethod
+    def load(cls, file: str):
+        with np.load(file, allow_pickle=False) as data:
+            words = data['words'].tobytes().decode('utf-8')
+            scale = data['scale']
+            return cls(words.split('\n') if words else [], data['data'], scale if len(scale) > 0 else None,
+                       dtype=str(data['dtype']))
+
+    def __contains__(self, word):
+        return word in self.vocab
+
+    def __getitem__(self, word):
+        row = self.data[self.vocab[word]].astype(np.float32)
+        return row * self.scale if self.scale is not None else row
+
+    def pool(self, words: list):
+        # Sum of the known words: int8 rows are added as integers and rescaled once
+        return self.pool_rows([self.vocab[w] for w in words if w in self.vocab])
+
+    def pool_rows(self, index: list):
+        # Same as pool for row numbers already looked up
+        if len(index) == 0:
+            return np.zeros(self.vector_size, dtype=np.float32), 0
+        if self.scale is not None:
+            total = self.data[index].sum(axis=0, dtype=np.int32).astype(np.float32) * self.scale
+        else:
+            total = self.data[index].sum(axis=0, dtype=np.float32)
+        return total, len(index)
+
+    @property
+    def nbytes(self):
+        return int(self.data.nbytes + (self.scale.nbytes if self.scale is not None else 0))
@@ -0,0 +1,138 @@
+import csv
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from logic.utils import Utils
+from root import DIR_OUTPUT
+
+
+class ResultWriter(object):
+    """
+    Background writer for the PAN author files produced by HateModels.
+
+    Rows are queued as they are predicted and a single writer thread
+    flushes them in batches. Every file is written to a temporary name in
+    the same directory and moved into place with os.replace, so readers
+    never see a half-written author file. Optionally a consolidated
+    'jsonl' or 'csv' file with all the rows is written next to the XML files.
+    """
+    template = '<author id="{0}" lang="{1}" type="{2}"/>'
+    fields = ['id', 'lang', 'type']
+
+    def __init__(self, lang: str = 'es', path_dir: str = None, batch_size: int = 256,
+                 queue_size: int = 4096, consolidated: str = None, flush_interval: float = 1.0):
+        if consolidated not in [None, 'jsonl', 'csv']:
+            raise ValueError('Consolidated format not supported: {0}'.format(consolidated))
+        self.lang = lang
+        self.path_dir = path_dir if path_dir is not None else '{0}{1}{2}'.format(DIR_OUTPUT, lang, os.sep)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.consolidated = consolidated
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self.error = None
+        self.written = 0
+        self.file_consolidated = None
+        self._sentinel = object()
+        self._consolidated_tmp = None
+        self._consolidated_handle = None
+        self._csv = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def start(self):
+        os.makedirs(self.path_dir, exist_ok=True)
+        if self.consolidated is not None:
+            self.file_consolidated = '{0}results_{1}.{2}'.format(self.path_dir, self.lang, self.consolidated)
+            self._consolidated_tmp = self.file_consolidated + '.tmp'
+            self._consolidated_handle = open(self._consolidated_tmp, 'w', encoding='utf-8', newline='')
+            if self.consolidated == 'csv':
+                self._csv = csv.DictWriter(self._consolidated_handle, fieldnames=self.fields)
+                self._csv.writeheader()
+        self.thread = threading.Thread(target=self._worker, name='result-writer', daemon=True)
+        self.thread.start()
+        return self
+
+    def write(self, row: dict):
+        if self.error is not None:
+            raise self.error
+        if not self._put(row):
+            raise self.error if self.error is not None else RuntimeError('ResultWriter thread stopped')
+
+    def _put(self, item):
+        # A full queue is waited on only while the writer thread is alive, never forever
+        while self.error is None and self.thread is not None and self.thread.is_alive():
+            try:
+                self.queue.put(item, timeout=self.flush_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def close(self):
+        if self.thread is not None:
+            self._put(self._sentinel)
+            self.thread.join()
+            self.thread = None
+        if self._consolidated_handle is not None:
+            self._consolidated_handle.close()
+            self._consolidated_handle = None
+            if self.error is None:
+                os.replace(self._consolidated_tmp, self.file_consolidated)
+        if self.error is not None:
+            raise self.error
+        return self.written
+
+    def _worker(self):
+        # A batch is written when it is full or flush_interval after its first row
+        batch = []
+        deadline = None
+        running = True
+        while running:
+            timeout = self.flush_interval if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                row = self.queue.get(timeout=timeout)
+                if row is self._sentinel:
+                    running = False
+                else:
+                    batch.append(row)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+            if batch and (len(batch) >= self.batch_size or not running or time.monotonic() >= deadline):
+                try:
+                    self._flush(batch)
+                except Exception as e:
+                    Utils.standard_error(sys.exc_info())
+                    print('Error ResultWriter: {0}'.format(e))
+                    self.error = e
+                    running = False
+                batch = []
+                deadline = None
+        # Drain the queue so that producers blocked on put() are released
+        while self.error is not None and not self.queue.empty():
+            self.queue.get_nowait()
+
+    def _flush(self, batch: list):
+        for row in batch:
+            path_file = '{0}{1}.xml'.format(self.path_dir, row['id'])
+            path_tmp = '{0}{1}.xml.tmp'.format(self.path_dir, row['id'])
+            with open(path_tmp, 'w') as file:
+                file.write(self.template.format(row['id'], row['lang'], row['type']))
+            os.replace(path_tmp, path_file)
+        if self._consolidated_handle is not None:
+            if self.consolidated == 'jsonl':
+                self._consolidated_handle.writelines(json.dumps(row) + '\n' for row in batch)
+            else:
+                self._csv.writerows(batch)
+            self._consolidated_handle.flush()
+        self.written += len(batch)
@@ -0,0 +1,292 @@
+import datetime
+import heapq
+import json
+import os
+import shutil
+import socket
+import sys
+import threading
+import time
+from logic.data_transformation import DataTransformation
+from logic.model_bundle import ModelBundle
+from logic.result_writer import ResultWriter
+from logic.utils import Utils
+from root import DIR_SHARDS, DIR_MODELS
+
+
+class ScoringShards(object):
+    """
+    Batch scoring of one author directory split across processes or nodes.
+
+    <path_dir>/manifest.json  dataset, model and the xml files of every shard
+    <path_dir>/shard_00000/  output of shard 0: author xml files and results_<lang>.jsonl
+    <path_dir>/shard_00000.done.json  written last, only when the shard scored all its authors
+    <path_dir>/shard_00000.claim.json  lease of the worker (host, pid) running the shard
+
+    Shards are balanced by document size (largest file first onto the
+    lightest shard) and run independently; a failed shard is run again on
+    its own. A worker claims a shard by creating its claim file exclusively
+    and keeps touching it while it runs; a claim older than lease seconds, or
+    of a dead process on the same host, is taken over. merge checks that
+    every author was scored exactly once with the same model and writes the
+    output of a single-node run, in its order.
+    """
+    file_manifest = 'manifest.json'
+
+    def __init__(self, lang: str = 'es', dataset: str = 'pan21-author-profiling-test-without-gold',
+                 name_model: str = None, path_dir: str = None):
+        self.lang = lang
+        self.dataset = dataset
+        self.name_model = name_model if name_model is not None else 'hate_model_{0}'.format(lang)
+        self.path_dir = path_dir if path_dir is not None else '{0}scoring_{1}_{2}{3}'.format(
+            DIR_SHARDS, dataset, lang, os.sep)
+        self.manifest = None
+
+    def file(self, name: str):
+        return self.path_dir + name
+
+    def shard_dir(self, shard: int):
+        return self.file('shard_{0:05d}{1}'.format(shard, os.sep))
+
+    def shard_done(self, shard: int):
+        return self.file('shard_{0:05d}.done.json'.format(shard))
+
+    def shard_claim(self, shard: int):
+        return self.file('shard_{0:05d}.claim.json'.format(shard))
+
+    def model_fingerprint(self):
+        # Shards scored with a different model must not be merged
+        if ModelBundle.exists(self.name_model):
+            return ModelBundle.load(self.name_model).manifest['estimator_file']['sha256']
+        fingerprint = ModelBundle.fingerprint('{0}{1}.pkl'.format(DIR_MODELS, self.name_model))
+        return fingerprint['sha256'] if fingerprint is not None else None
+
+    def plan(self, n_shards: int, force: bool = False):
+        # A new plan removes the shard directory, refused while it holds finished or running shards
+        try:
+            if os.path.isdir(self.path_dir) and not force:
+                kept = [i for i in os.listdir(self.path_dir) if i.endswith('.done.json') or i.endswith('.claim.json')]
+                if kept:
+                    raise ValueError('{0} holds {1} done or claimed shards, plan again with force=True'.format(
+                        self.path_dir, len(kept)))
+            path_input = DataTransformation(dataset=self.dataset, lang=self.lang, type_data='test').path_dir
+            files = sorted(i for i in os.listdir(path_input) if i.endswith('.xml'))
+            sizes = {i: os.path.getsize(path_input + i) for i in files}
+            n_shards = max(1, min(n_shards, len(files)))
+            heap = [(0, shard) for shard in range(n_shards)]
+            shards = [[] for _ in range(n_shards)]
+            for file in sorted(files, key=lambda i: (-sizes[i], i)):
+                load, shard = heapq.heappop(heap)
+                shards[shard].append(file)
+                heapq.heappush(heap, (load + sizes[file], shard))
+            self.manifest = {'dataset': self.dataset,
+                             'lang': self.lang,
+                             'name_model': self.name_model,
+                             'model': self.model_fingerprint(),
+                             'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                             'n_authors': len(files),
+                             'files': files,
+                             'shards': [{'shard': i, 'bytes': sum(sizes[j] for j in shard), 'files': sorted(shard)}
+                                        for i, shard in enumerate(shards)]}
+            if os.path.isdir(self.path_dir):
+                shutil.rmtree(self.path_dir)
+            os.makedirs(self.path_dir)
+            self.save_json(self.file_manifest, self.manifest)
+            for shard in self.manifest['shards']:
+                print('Shard {0}: {1} authors, {2} bytes'.format(shard['shard'], len(shard['files']), shard['bytes']))
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error ScoringShards plan: {0}'.format(e))
+            return None
+        return self.manifest
+
+    def load(self):
+        with open(self.file(self.file_manifest), 'r', encoding='utf-8') as data:
+            self.manifest = json.load(data)
+        return self.manifest
+
+    def save_json(self, name: str, data: dict):
+        with open(self.file(name) + '.tmp', 'w', encoding='utf-8') as output:
+            json.dump(data, output, indent=2)
+        os.replace(self.file(name) + '.tmp', self.file(name))
+
+    def status(self):
+        manifest = self.manifest if self.manifest is not None else self.load()
+        return {shard['shard']: os.path.isfile(self.shard_done(shard['shard'])) for shard in manifest['shards']}
+
+    def pending(self):
+        return [shard for shard, done in self.status().items() if not done]
+
+    def claims(self):
+        # Shard -> claim of the workers running it now
+        manifest = self.manifest if self.manifest is not None else self.load()
+        result = {}
+        for shard in manifest['shards']:
+            claim = self.read_claim(shard['shard'])
+            if claim is not None and not self.expired(shard['shard'], claim):
+                result[shard['shard']] = claim
+        return result
+
+    def read_claim(self, shard: int):
+        try:
+            with open(self.shard_claim(shard), 'r', encoding='utf-8') as data:
+                return json.load(data)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # Being written, or left incomplete by a crash
+            return {}
+
+    def expired(self, shard: int, claim: dict, lease: float = 3600):
+        try:
+            if time.time() - os.path.getmtime(self.shard_claim(shard)) > lease:
+                return True
+        except OSError:
+            return True
+        if claim.get('host') == socket.gethostname() and claim.get('pid') is not None:
+            try:
+                os.kill(claim['pid'], 0)
+            except ProcessLookupError:
+                return True
+            except PermissionError:
+                pass
+        return False
+
+    def claim(self, shard: int, lease: float = 3600):
+        # Atomic creation of the claim file; True when this process holds the shard
+        for _ in range(2):
+            try:
+                fd = os.open(self.shard_claim(shard), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                claim = self.read_claim(shard)
+                if claim is None:
+                    continue
+                if not self.expired(shard, claim, lease):
+                    print('Shard {0} claimed by {1} pid {2}'.format(shard, claim.get('host'), claim.get('pid')))
+                    return False
+                print('Shard {0}: taking over the expired claim of {1} pid {2}'.format(
+                    shard, claim.get('host'), claim.get('pid')))
+                try:
+                    # Not when another worker took it over in the meantime
+                    if self.read_claim(shard) == claim:
+                        os.remove(self.shard_claim(shard))
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, 'w', encoding='utf-8') as output:
+                json.dump({'shard': shard, 'host': socket.gethostname(), 'pid': os.getpid(),
+                           'claimed': datetime.datetime.now().isoformat(timespec='seconds')}, output)
+            return True
+        return False
+
+    def release(self, shard: int):
+        claim = self.read_claim(shard)
+        if claim is not None and claim.get('host') == socket.gethostname() and claim.get('pid') == os.getpid():
+            os.remove(self.shard_claim(shard))
+
+    def run_shard(self, shard: int, processes: int = 0, force: bool = False, model=None, lease: float = 3600):
+        # A retry starts the shard from scratch; finished shards are skipped unless force=True.
+        # Returns True when done, False on error and None when another worker holds the shard.
+        heartbeat = None
+        try:
+            manifest = self.manifest if self.manifest is not None else self.load()
+            files = manifest['shards'][shard]['files']
+            if os.path.isfile(self.shard_done(shard)) and not force:
+                print('Shard {0} already done'.format(shard))
+                return True
+            if not self.claim(shard, lease):
+                return None
+            heartbeat = threading.Event()
+            threading.Thread(target=self.renew, args=(shard, heartbeat, lease / 3), daemon=True).start()
+            if os.path.isfile(self.shard_done(shard)) and not force:
+                # Finished by another worker between the check and the claim
+                return True
+            if os.path.isfile(self.shard_done(shard)):
+                os.remove(self.shard_done(shard))
+            if os.path.isdir(self.shard_dir(shard)):
+                shutil.rmtree(self.shard_dir(shard))
+            if self.model_fingerprint() != manifest['model']:
+                raise ValueError('Model {0} changed since the shards were planned'.format(self.name_model))
+            if model is None:
+                from logic.hate_models import HateModels
+                model = HateModels(lang=self.lang, name_model=self.name_model, dataset=self.dataset)
+            written = model.run(consolidated='jsonl', processes=processes, files=files,
+                                path_dir=self.shard_dir(shard))
+            if written != len(files):
+                raise ValueError('Shard {0} scored {1} of {2} authors'.format(shard, written, len(files)))
+            self.save_json(os.path.basename(self.shard_done(shard)),
+                           {'shard': shard, 'authors': written, 'model': manifest['model'],
+                            'host': socket.gethostname(),
+                            'finished': datetime.datetime.now().isoformat(timespec='seconds')})
+            print('Shard {0} done: {1} authors'.format(shard, written))
+            return True
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error ScoringShards run_shard {0}: {1}'.format(shard, e))
+            return False
+        finally:
+            if heartbeat is not None:
+                heartbeat.set()
+                self.release(shard)
+
+    def renew(self, shard: int, stop: threading.Event, interval: float):
+        # Keeps the lease of a running shard alive
+        while not stop.wait(interval):
+            try:
+                os.utime(self.shard_claim(shard))
+            except OSError:
+                return
+
+    def results(self, shard: int):
+        rows = []
+        with open('{0}results_{1}.jsonl'.format(self.shard_dir(shard), self.lang), 'r', encoding='utf-8') as data:
+            for line in data:
+                if line.strip():
+                    rows.append(json.loads(line))
+        return rows
+
+    def validate(self):
+        manifest = self.manifest if self.manifest is not None else self.load()
+        problems = []
+        rows = {}
+        for shard in manifest['shards']:
+            i = shard['shard']
+            if not os.path.isfile(self.shard_done(i)):
+                problems.append('shard {0}: not done'.format(i))
+                continue
+            with open(self.shard_done(i), 'r', encoding='utf-8') as data:
+                done = json.load(data)
+            if done['model'] != manifest['model']:
+                problems.append('shard {0}: scored with another model'.format(i))
+            expected = {file.replace('.xml', '') for file in shard['files']}
+            for row in self.results(i):
+                if row['id'] not in expected:
+                    problems.append('shard {0}: unexpected author {1}'.format(i, row['id']))
+                elif row['id'] in rows:
+                    problems.append('shard {0}: author {1} scored twice'.format(i, row['id']))
+                rows[row['id']] = row
+            missing = expected - set(rows)
+            if missing:
+                problems.append('shard {0}: {1} authors missing'.format(i, len(missing)))
+        return problems, rows
+
+    def merge(self, consolidated: str = None, path_output: str = None):
+        # Same files and order as a single-node run over the whole directory
+        try:
+            manifest = self.manifest if self.manifest is not None else self.load()
+            problems, rows = self.validate()
+            if problems:
+                for problem in problems:
+                    print('Error merge: {0}'.format(problem))
+                print('Retry the pending shards: {0}'.format(self.pending()))
+                return None
+            with ResultWriter(lang=self.lang, path_dir=path_output, consolidated=consolidated) as writer:
+                for file in manifest['files']:
+                    writer.write(rows[file.replace('.xml', '')])
+            print('Merged {0} shards, {1} authors in {2}'.format(len(manifest['shards']), writer.written,
+                                                               writer.path_dir))
+            return writer.written
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error ScoringShards merge: {0}'.format(e))
+            return None
@@ -0,0 +1,107 @@
+import json
+import os
+import sys
+import tempfile
+from logic.utils import Utils
+
+
+class SyllableTable(object):
+    """
+    Orthographic syllable -> row of the syllable embedding (OOV = -1).
+
+    Spelling to IPA to row is deterministic for a language and a model, so the
+    rows are precomputed over a syllable inventory and epitran only runs for
+    syllables the table has never seen (which are then added to it). The table
+    stores the size and mtime of the model it was built for and is discarded
+    when the model changes.
+    """
+    OOV = -1
+
+    def __init__(self, vocabulary: dict, epi, file_model: str = None, rows: dict = None, file: str = None):
+        self.vocabulary = vocabulary
+        self.epi = epi
+        self.file_model = file_model
+        self.rows = rows if rows is not None else {}
+        self.file = file
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def row(self, syllable: str):
+        index = self.rows.get(syllable)
+        if index is None:
+            self.misses += 1
+            index = self.vocabulary.get(self.epi.transliterate(syllable, normpunc=True), self.OOV)
+            self.rows[syllable] = index
+        else:
+            self.hits += 1
+        return index
+
+    def build(self, syllables):
+        for syllable in syllables:
+            if syllable not in self.rows:
+                self.row(syllable)
+        known = sum(1 for i in self.rows.values() if i != self.OOV)
+        print('Syllable table: {0} syllables, {1} in the embedding'.format(len(self.rows), known))
+        return self
+
+    @staticmethod
+    def inventory_cache(file: str):
+        # Syllables of every word in the warm start file of the syllable component
+        try:
+            with open(file, 'r', encoding='utf-8') as data:
+                entries = json.load(data)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print('Warning syllable cache {0} ignored: {1}'.format(file, e))
+            return
+        for entry in entries:
+            if isinstance(entry, list) and len(entry) == 2 and isinstance(entry[1], list):
+                yield from entry[1]
+
+    def model_stamp(self):
+        if self.file_model is None or not os.path.isfile(self.file_model):
+            return None
+        stat = os.stat(self.file_model)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def save(self, file: str = None):
+        file = file if file is not None else self.file
+        try:
+            # Unique temporary file in the same directory: workers saving the table do not clash
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=os.path.basename(file) + '.', suffix='.tmp',
+                                       dir=os.path.dirname(file))
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as output:
+                    json.dump({'model': self.model_stamp(), 'rows': self.rows}, output, ensure_ascii=False)
+                os.replace(tmp, file)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error SyllableTable save: {0}'.format(e))
+        return file
+
+    @classmethod
+    def load(cls, file: str, vocabulary: dict, epi, file_model: str = None):
+        # An unreadable or corrupt table starts empty and is rebuilt on use
+        table = cls(vocabulary, epi, file_model=file_model, file=file)
+        try:
+            with open(file, 'r', encoding='utf-8') as data:
+                stored = json.load(data)
+            if not isinstance(stored, dict) or not isinstance(stored.get('rows'), dict):
+                raise ValueError('no rows')
+            if stored.get('model') == table.model_stamp():
+                table.rows = stored['rows']
+            else:
+                print('Warning syllable table {0} was built for another model, ignored'.format(file))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print('Warning syllable table {0} ignored: {1}'.format(file, e))
+        return table
@@ -0,0 +1,74 @@
+import os
+import random
+import xml.etree.ElementTree as ET
+from root import DIR_INPUT
+
+
+class SyntheticCorpus(object):
+    """
+    Deterministic PAN-style corpus generator.
+
+    The same (lang, n_authors, n_tweets, tweet_length, seed) always produces
+    the same authors, tweets and labels, so benchmark runs are comparable.
+    """
+    vocabulary = {
+        'es': ['que', 'de', 'no', 'a', 'la', 'el', 'es', 'y', 'en', 'lo', 'un', 'por', 'me', 'una', 'te', 'los',
+               'se', 'con', 'para', 'mi', 'está', 'si', 'bien', 'pero', 'yo', 'eso', 'las', 'sí', 'su', 'tu', 'aquí',
+               'del', 'al', 'como', 'le', 'más', 'esto', 'ya', 'todo', 'esta', 'vamos', 'muy', 'hay', 'ahora',
+               'algo', 'estoy', 'tengo', 'nos', 'tú', 'nada', 'cuando', 'ha', 'este', 'sé', 'estás', 'así', 'puedo',
+               'gente', 'gobierno', 'país', 'mujer', 'hombre', 'amigo', 'casa', 'vida', 'tiempo', 'mundo', 'nunca',
+               'siempre', 'malo', 'bueno', 'triste', 'alegre', 'tonto', 'feo', 'grande', 'pequeño', 'odio',
+               'quiero', 'sigo', 'leyendo', 'muerto', 'apocalipsis', 'chingada', 'política', 'noticias'],
+        'en': ['the', 'to', 'and', 'a', 'of', 'i', 'you', 'is', 'in', 'that', 'it', 'for', 'on', 'my', 'this',
+               'with', 'be', 'are', 'have', 'not', 'we', 'so', 'but', 'they', 'at', 'just', 'what', 'all', 'your',
+               'do', 'was', 'like', 'if', 'me', 'can', 'he', 'she', 'about', 'people', 'get', 'no', 'now', 'one',
+               'will', 'from', 'out', 'how', 'good', 'bad', 'love', 'hate', 'never', 'always', 'today', 'time',
+               'world', 'woman', 'man', 'friend', 'home', 'life', 'government', 'country', 'news', 'stupid',
+               'happy', 'sad', 'ugly', 'great', 'small', 'want', 'reading', 'still', 'dead', 'politics'],
+    }
+    markers = ['#USER#', '#HASHTAG#', 'https://t.co/abc123', '\U0001F602', 'RT']
+
+    def __init__(self, lang: str = 'es', n_authors: int = 100, n_tweets: int = 200,
+                 tweet_length: int = 15, seed: int = 42):
+        self.lang = lang
+        self.n_authors = n_authors
+        self.n_tweets = n_tweets
+        self.tweet_length = tweet_length
+        self.seed = seed
+
+    def tweet(self, rnd):
+        words = self.vocabulary[self.lang]
+        size = max(1, int(rnd.gauss(self.tweet_length, self.tweet_length / 4.0)))
+        tokens = [rnd.choice(words) for _ in range(size)]
+        if rnd.random() < 0.3:
+            tokens.insert(rnd.randrange(len(tokens) + 1), rnd.choice(self.markers))
+        text = ' '.join(tokens)
+        return text[0].upper() + text[1:] + rnd.choice(['.', '!', '?', ''])
+
+    def authors(self):
+        rnd = random.Random('{0}-{1}'.format(self.lang, self.seed))
+        for i in range(self.n_authors):
+            user = '{0:032x}'.format(rnd.getrandbits(128))
+            value = rnd.randint(0, 1)
+            tweets = [self.tweet(rnd) for _ in range(self.n_tweets)]
+            yield user, tweets, value
+
+    def get_data(self):
+        return [{'user': user, 'content': '\n'.join(tweets), 'value': value}
+                for user, tweets, value in self.authors()]
+
+    def save(self, dataset: str = 'synthetic'):
+        path_dir = '{0}{1}{2}{1}{3}{1}'.format(DIR_INPUT, os.sep, dataset, self.lang)
+        os.makedirs(path_dir, exist_ok=True)
+        truth = []
+        for user, tweets, value in self.authors():
+            author = ET.Element('author', lang=self.lang)
+            documents = ET.SubElement(author, 'documents')
+            for tweet in tweets:
+                ET.SubElement(documents, 'document').text = tweet
+            ET.ElementTree(author).write('{0}{1}.xml'.format(path_dir, user), encoding='utf-8',
+                                         xml_declaration=True)
+            truth.append('{0}:::{1}\n'.format(user, value))
+        with open(path_dir + 'truth.txt', 'w', encoding='utf-8') as file:
+            file.writelines(truth)
+        return path_dir
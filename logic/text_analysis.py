@@ -10,25 +10,29 @@ from spacy.lang.es import Spanish
 from spacy.lang.en import English
 from nltk import SnowballStemmer
 from spacymoji import Emoji
-from spacy_syllables import SpacySyllables
 import pandas as pd
 import epitran
 from tqdm import tqdm
 from nltk.tokenize import word_tokenize
 import xml.etree.ElementTree as ET
+from logic.cached_syllables import CachedSpacySyllables
+from logic.instrumentation import Instrumentation, timed
 from logic.steaming import Steaming
 from logic.utils import Utils
-from root import DIR_EMBEDDING, DIR_INPUT
+from root import DIR_EMBEDDING, DIR_INPUT, DIR_CACHE
 
 
 class TextAnalysis(object):
     name = 'text_analysis'
     lang = 'es'
+    # Components not needed for POS tags and syllables (no noun chunks, sentences or stems)
+    light_pipes = ('parser', 'stemmer')
 
-    def __init__(self, lang):
+    def __init__(self, lang, instrumentation: Instrumentation = None):
         lang_ipa = {'es': 'spa-Latn', 'en': 'eng-Latn'}
         lang_stemm = {'es': 'spanish', 'en': 'english'}
         self.lang = lang
+        self.metrics = instrumentation if instrumentation is not None else Instrumentation(enabled=False)
         self.stemmer = SnowballStemmer(language=lang_stemm[lang])
         self.epi = epitran.Epitran(lang_ipa[lang])
         self.nlp = self.load_sapcy(lang)
@@ -41,7 +45,8 @@ class TextAnalysis(object):
             else:
                 result = spacy.load('en_core_web_md', disable=['ner'])
             stemmer_text = Steaming(lang)  # initialise component
-            syllables = SpacySyllables(result)
+            syllables = CachedSpacySyllables(result, cache_file='{0}syllables_{1}.json'.format(DIR_CACHE, lang),
+                                             metrics=self.metrics)
             emoji = Emoji(result)
             result.add_pipe(syllables, after="tagger")
             result.add_pipe(emoji, first=True)
@@ -52,10 +57,27 @@ class TextAnalysis(object):
             print('Error load_sapcy: {0}'.format(e))
         return result
 
-    def analysis_pipe(self, text):
+    def save_caches(self):
+        try:
+            syllables = self.nlp.get_pipe('syllables')
+            syllables.save()
+            print('Syllable cache: {0}'.format(syllables.cache.stats()))
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error save_caches: {0}'.format(e))
+
+    @timed('analysis_pipe')
+    def analysis_pipe(self, text, disable: tuple = None):
+        # disable: names of pipeline components to skip for this text, the pipeline itself is not changed
         doc = None
         try:
-            doc = self.nlp(text.lower())
+            if disable:
+                doc = self.nlp.make_doc(text.lower())
+                for name, component in self.nlp.pipeline:
+                    if name not in disable:
+                        doc = component(doc)
+            else:
+                doc = self.nlp(text.lower())
         except Exception as e:
             Utils.standard_error(sys.exc_info())
             print('Error analysis_pipe: {0}'.format(e))
@@ -109,11 +131,13 @@ class TextAnalysis(object):
             print('Error phonemes_vector: {0}'.format(e))
         return result
 
-    def tagger(self, text):
+    @timed('tagger')
+    def tagger(self, text, doc=None):
+        # doc: the text already parsed by analysis_pipe, shared by the feature groups of a document
         result = None
         try:
             list_tagger = []
-            doc = self.analysis_pipe(text.lower())
+            doc = self.analysis_pipe(text.lower()) if doc is None else doc
             for token in doc:
                 item = {'text': token.text, 'lemma': token.lemma_, 'stem': token._.stem, 'pos': token.pos_,
                         'tag': token.tag_, 'dep': token.dep_, 'shape': token.shape_, 'is_alpha': token.is_alpha,
@@ -355,7 +379,89 @@ class TextAnalysis(object):
             print('Error token_frequency: {0}'.format(e))
         return out
 
+    @timed('syntax_patterns')
     def syntax_patterns(self, text):
+        # Every sentence is parsed again lowercased on its own, as syntax_patterns_legacy does, and all of
+        # them are walked once into the same dicts: the output is identical to syntax_patterns_legacy
+        result = None
+        try:
+            result = {'NOUN': {}, 'VERB': {}, 'ADV': {}, 'ADJ': {}}
+            for span in self.nlp(text).sents:
+                doc = self.analysis_pipe(str(span).lower())
+                if doc is not None:
+                    self.syntax_patterns_doc(doc, result)
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error syntax_patterns: {0}'.format(e))
+        return result
+
+    @staticmethod
+    def syntax_patterns_doc(doc, result: dict = None):
+        """
+        NOUN/VERB/ADV/ADJ patterns in a single walk over the noun chunks of a Doc and the
+        dependency arcs of their roots. Same rules and insertion order as syntax_patterns_legacy.
+        """
+        result = {'NOUN': {}, 'VERB': {}, 'ADV': {}, 'ADJ': {}} if result is None else result
+        dict_noun, dict_verb, dict_adv, dict_adj = result['NOUN'], result['VERB'], result['ADV'], result['ADJ']
+        for chunk in doc.noun_chunks:
+            root = chunk.root
+            pos = root.pos_
+            if root.is_stop is True or root.is_punct is True or pos in 'PRON':
+                continue
+            text = chunk.text.lower()
+            head = root.head
+            head_pos = head.pos_
+            children = [(child.text.lower(), child.pos_) for child in root.children]
+            if pos == 'NOUN':
+                dict_noun[text] = [text, pos]
+                for child_text, child_pos in children:
+                    if child_pos == 'ADJ':
+                        chunk_value = [[child_text, child_pos], [text, pos]]
+                        dict_noun[child_text + ' ' + text] = chunk_value
+                        dict_adj[child_text + ' ' + text] = chunk_value
+                    elif child_pos == 'ADP':
+                        dict_noun[child_text + ' ' + text] = [[child_text, child_pos], [text, pos]]
+            elif pos == 'PROPN':
+                for child_text, child_pos in children:
+                    if child_pos == 'NOUN':
+                        dict_noun[text + ' ' + child_text] = [[text, pos], [child_text, child_pos]]
+            elif pos == 'ADJ':
+                dict_adj[text] = [text, pos]
+                for child_text, child_pos in children:
+                    if child_pos == 'NOUN':
+                        dict_adj[text + ' ' + child_text] = [[text, pos], [child_text, child_pos]]
+
+            head_text = head.text.lower()
+            for child_text, child_pos in children:
+                if head_pos == 'NOUN' and child_pos == 'ADP':
+                    # NOUN + ADP + NOUN
+                    dict_noun[head_text + ' ' + child_text + ' ' + text] = [[head_text, head_pos],
+                                                                           [child_text, child_pos], [text, pos]]
+                elif head_pos == 'ADJ' and child_pos == 'ADJ':
+                    # ADJ + ADJ + NOUN
+                    chunk_value = [[head_text, head_pos], [child_text, child_pos], [text, pos]]
+                    dict_noun[head_text + ' ' + child_text + ' ' + text] = chunk_value
+                    dict_adj[head_text + ' ' + child_text + ' ' + text] = chunk_value
+                elif head_pos == 'VERB' and child_pos == 'ADJ':
+                    # VERB + NOUN + ADJ
+                    dict_verb[head_text + ' ' + text + ' ' + child_text] = [[head_text, head_pos], [text, pos],
+                                                                           [child_text, child_pos]]
+                elif head_pos == 'VERB' and child_pos == 'ADP':
+                    # VERB + ADP + NOUN
+                    dict_verb[head_text + ' ' + child_text + ' ' + text] = [[head_text, head_pos],
+                                                                           [child_text, child_pos], [text, pos]]
+                elif head_pos == 'ADV' and child_pos == 'ADV':
+                    # ADV + ADV + NOUN
+                    dict_adv[head_text + ' ' + child_text + ' ' + text] = [[head_text, head_pos],
+                                                                          [child_text, child_pos], [text, pos]]
+                elif head_pos == 'ADV' and child_pos == 'ADJ':
+                    # ADV + NOUN + ADV
+                    dict_adv[head_text + ' ' + text + ' ' + child_text] = [[head_text, head_pos], [text, pos],
+                                                                          [child_text, child_pos]]
+        return result
+
+    def syntax_patterns_legacy(self, text):
+        # Reference implementation with the intermediate dependency_all items, kept for the parity test
         result = None
         try:
             doc = self.nlp(text)
@@ -1,65 +1,140 @@
 import datetime
 import pickle
+import sys
 import time
+import zlib
 from tqdm import tqdm
 import numpy as np
+from scipy import sparse as sp
 from sklearn import preprocessing
-from sklearn.feature_selection import SelectKBest, chi2, mutual_info_classif
+from sklearn.base import clone
 from sklearn.model_selection import StratifiedShuffleSplit, cross_val_score
-from mlxtend.feature_selection import SequentialFeatureSelector as SFS
+from sklearn.pipeline import Pipeline
+from logic.cascade import CascadeClassifier
+from logic.checkpoint import Checkpoint
 from logic.data_transformation import DataTransformation
 from logic.classifiers import Classifiers
 from logic.feature_extraction import FeatureExtraction
+from logic.feature_selection import FeatureSelection
+from logic.feature_shards import FeatureShards
+from logic.hyperparameter_search import HyperparameterSearch
+from logic.incremental_training import IncrementalTraining
+from logic.instrumentation import Instrumentation
+from logic.model_bundle import ModelBundle
 from logic.text_analysis import TextAnalysis
+from logic.tweet_features import TweetFeatures
+from logic.utils import Utils
 from root import DIR_MODELS
 
 
 class TrainModels(object):
 
     def __init__(self, lang: str = 'es', iteration: int = 10, fold: int = 10,
-                 dataset: str = 'pan21-author-profiling-training-2021-03-14'):
+                 dataset: str = 'pan21-author-profiling-training-2021-03-14', instrumentation: bool = False,
+                 reader=None, granularity: str = 'document'):
+        # granularity='tweet' featurizes every tweet on its own and pools the statistics per author (TweetFeatures)
+        if granularity not in ['document', 'tweet']:
+            raise ValueError('Granularity not supported: {0}'.format(granularity))
         self.lang = lang
         self.iteration = iteration
         self.fold = fold
         self.classifiers = Classifiers.dict_classifiers
-        self.ta = TextAnalysis(lang=lang)
+        self.metrics = Instrumentation(enabled=instrumentation, name='training_models_{0}'.format(lang))
+        self.ta = TextAnalysis(lang=lang, instrumentation=self.metrics)
         self.features = FeatureExtraction(lang=lang, text_analysis=self.ta)
-        self.data = DataTransformation(dataset=dataset, lang=lang).get_data()
+        self.granularity = granularity
+        self.tweet_features = TweetFeatures(self.features) if granularity == 'tweet' else None
+        # Any reader with iter_data/get_data (logic.data_readers), the PAN XML directory by default
+        self.reader = reader if reader is not None else DataTransformation(dataset=dataset, lang=lang)
+        self.dataset = dataset if reader is None else reader.source
+        self._data = None
 
-    def run(self, type_features: list = [1, 1, 1, 1]):
+    @property
+    def corpus(self):
+        # Size and mtime of the input, so checkpoints of an edited corpus are not reused
+        return getattr(self.reader, 'source', self.dataset)
+
+    @property
+    def data(self):
+        # Loaded on first use, the out-of-core training streams the corpus instead
+        if self._data is None:
+            self._data = self.reader.get_data() if self.granularity == 'document' else list(self.reader.iter_tweets())
+        return self._data
+
+    def run(self, type_features: list = [1, 1, 1, 1], sparse: bool = False, selection: str = None,
+            k_features: int = 100, resume: bool = False, shard_size: int = 500):
+        # Features and every finished iteration are checkpointed; with resume=True a run started with the
+        # same options continues where it stopped. Feature selection is fitted inside each cross-validation
+        # split as the first step of a Pipeline, so the held-out folds never take part in it.
+        checkpoint = Checkpoint('training_{0}'.format(self.lang),
+                                {'lang': self.lang, 'dataset': self.dataset, 'corpus': self.corpus,
+                                 'type_features': list(type_features),
+                                 'sparse': sparse, 'granularity': self.granularity,
+                                 'selection': selection, 'k_features': k_features,
+                                 'iteration': self.iteration, 'fold': self.fold,
+                                 'classifiers': sorted(self.classifiers)})
         try:
             date_file = datetime.datetime.now().strftime("%Y-%m-%d")
-            print('***Clean data training')
-            x = [self.ta.clean_text(row['content'], stopwords=False) for row in tqdm(self.data)]
-            y = np.array([row['value'] for row in self.data], dtype=np.int)
+            checkpoint.start(resume=resume)
+            y = np.array([row['value'] for row in self.data], dtype=int)
 
             print('***Get training features')
-            x = [self.features.get_features(msg, type_features) for msg in tqdm(x)]
+            x = self.checkpoint_features(type_features, sparse, shard_size, resume=resume)
+            if sparse:
+                print('Training matrix: {0} with {1} stored values'.format(x.shape, x.nnz))
+            if self.metrics.enabled:
+                self.metrics.report()
+                self.metrics.to_json()
+                self.metrics.to_prometheus()
 
             cv = StratifiedShuffleSplit(n_splits=self.fold, test_size=0.30, random_state=42)
 
+            results = checkpoint.load_json('results', {})
             best = 0.0
             best_clf = None
             name_best = None
             for clf_name, clf_ in self.classifiers.items():
                 classifier_name = clf_name
-                clf = clf_
-                start_time = time.time()
-                print('**Training {0} ...'.format(classifier_name))
-                scores_acc = []
-                scores_recall = []
-                scores_f1 = []
-                for i in range(1, self.iteration + 1):
-                    clf.fit(x, y)
-                    accuracy = cross_val_score(clf, x, y, cv=cv)
-                    scores_acc.append(accuracy)
-                    recall = cross_val_score(clf, x, y, cv=cv, scoring='recall')
-                    scores_recall.append(recall)
-                    f1 = cross_val_score(clf, x, y, cv=cv, scoring='f1')
-                    scores_f1.append(f1)
+                dense = sp.issparse(x) and clf_name not in Classifiers.accept_sparse
+                if selection is not None:
+                    selector = FeatureSelection(method=selection, k_features=k_features,
+                                                estimator=clone(self.classifiers['DecisionTree']), dense=dense)
+                    clf = Pipeline([('selection', selector), ('classifier', clf_)])
+                    x_clf = x
+                else:
+                    clf = clf_
+                    x_clf = x.toarray() if dense else x
+                result = results.setdefault(clf_name, {'iterations': [], 'seconds': 0.0, 'done': False})
+                start_time = time.time() - result['seconds']
+                if result['done']:
+                    print('**{0} restored from checkpoint'.format(classifier_name))
+                    clf = checkpoint.load('model_{0}'.format(clf_name))
+                else:
+                    print('**Training {0} ...'.format(classifier_name))
+                fitted = False
+                for i in range(len(result['iterations']) + 1, self.iteration + 1):
+                    clf.fit(x_clf, y)
+                    fitted = True
+                    accuracy = cross_val_score(clf, x_clf, y, cv=cv)
+                    recall = cross_val_score(clf, x_clf, y, cv=cv, scoring='recall')
+                    f1 = cross_val_score(clf, x_clf, y, cv=cv, scoring='f1')
+                    result['iterations'].append({'accuracy': accuracy.tolist(), 'recall': recall.tolist(),
+                                                 'f1': f1.tolist()})
+                    result['seconds'] = time.time() - start_time
+                    checkpoint.save_json('results', results)
+                if not result['done']:
+                    if not fitted:
+                        # Stopped after its last iteration was saved, only the final fit is missing
+                        clf.fit(x_clf, y)
+                    checkpoint.dump(clf, 'model_{0}'.format(clf_name))
+                    result['done'] = True
+                    checkpoint.save_json('results', results)
+                scores_acc = [np.array(i['accuracy']) for i in result['iterations']]
+                scores_recall = [np.array(i['recall']) for i in result['iterations']]
+                scores_f1 = [np.array(i['f1']) for i in result['iterations']]
 
                 # Calculated Time processing
-                t_sec = round(time.time() - start_time)
+                t_sec = round(result['seconds'])
                 (t_min, t_sec) = divmod(t_sec, 60)
                 (t_hour, t_min) = divmod(t_min, 60)
                 time_processing = '{} hour:{} min:{} sec'.format(t_hour, t_min, t_sec)
@@ -82,12 +157,168 @@ class TrainModels(object):
                     best = mean_score_acc
                     best_clf = clf
                     name_best = classifier_name
-            file_model = '{0}hate_model_{1}.pkl'.format(DIR_MODELS, self.lang)
-            with open(file_model, 'wb') as file:
-                pickle.dump(best_clf, file)
-                print('Best classifier is {0} with Accuracy: {1}'.format(name_best, best))
+            print('Best classifier is {0} with Accuracy: {1}'.format(name_best, best))
+            selected_columns = None
+            if selection is not None:
+                # The legacy pkl has no room for the selected columns, only the bundle is written
+                selected_columns = best_clf.named_steps['selection'].columns_
+                print('Feature selection on: the legacy hate_model_{0}.pkl is not written'.format(self.lang))
+            else:
+                file_model = '{0}hate_model_{1}.pkl'.format(DIR_MODELS, self.lang)
+                with open(file_model, 'wb') as file:
+                    pickle.dump(best_clf, file)
+            bundle = ModelBundle.save(best_clf if selection is None else best_clf.named_steps['classifier'],
+                                      name='hate_model_{0}'.format(self.lang), lang=self.lang,
+                                      schema=self.features.schema(type_features), sparse=sparse,
+                                      extra={'classifier': name_best, 'accuracy': float(best), 'date': date_file,
+                                             'selection': selection, 'granularity': self.granularity},
+                                      selected_columns=selected_columns)
+            print('Model bundle saved in {0}'.format(bundle.path_dir))
+            return best_clf
         except Exception as e:
+            Utils.standard_error(sys.exc_info())
             print('Error baseline: {0}'.format(e))
+            print('Completed work is kept in {0}, run again with resume=True to continue'.format(
+                checkpoint.path_dir))
+
+    def checkpoint_features(self, type_features: list, sparse: bool, shard_size: int = 500, resume: bool = True):
+        # Features are extracted shard by shard and each finished shard is kept on disk, shared by
+        # every run on the same corpus and feature groups
+        checkpoint = Checkpoint('features_{0}'.format(self.lang),
+                                {'lang': self.lang, 'dataset': self.dataset, 'corpus': self.corpus,
+                                 'type_features': list(type_features),
+                                 'sparse': sparse, 'granularity': self.granularity}
+                                ).start(resume=resume)
+        shards = checkpoint.shards(self.features.schema(type_features), sparse=sparse)
+        done = shards.n_rows
+        if done > 0:
+            print('Restored {0} of {1} feature rows from checkpoint'.format(done, len(self.data)))
+        for start in tqdm(range(done, len(self.data), shard_size)):
+            self.append_shard(shards, self.data[start:start + shard_size], type_features, sparse)
+        self.features.save_caches()
+        return shards.to_matrix()[0]
+
+    def search(self, type_features: list = [1, 1, 1, 1], sparse: bool = False, n_candidates: int = 10,
+               factor: int = 3, time_budget: float = None, n_jobs: int = -1):
+        # Successive-halving search over Classifiers.param_spaces on the cached training features
+        try:
+            date_file = datetime.datetime.now().strftime("%Y-%m-%d")
+            y = np.array([row['value'] for row in self.data], dtype=int)
+            print('***Get training features')
+            x = self.checkpoint_features(type_features, sparse, resume=True)
+            search = HyperparameterSearch(classifiers=self.classifiers, n_candidates=n_candidates, factor=factor,
+                                          max_folds=self.fold, time_budget=time_budget, n_jobs=n_jobs).fit(x, y)
+            best = search.best
+            best_clf = search.best_estimator()
+            x_clf = x.toarray() if sp.issparse(x) and best['classifier'] not in Classifiers.accept_sparse else x
+            best_clf.fit(x_clf, y)
+            print('Best classifier is {0} {1} with Accuracy: {2}'.format(best['classifier'], best['params'],
+                                                                          best['accuracy']))
+            bundle = ModelBundle.save(best_clf, name='hate_model_{0}'.format(self.lang), lang=self.lang,
+                                      schema=self.features.schema(type_features), sparse=sparse,
+                                      extra={'classifier': best['classifier'], 'params': best['params'],
+                                             'accuracy': best['accuracy'], 'date': date_file,
+                                             'search': search.rounds, 'granularity': self.granularity})
+            print('Model bundle saved in {0}'.format(bundle.path_dir))
+            return search
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error search: {0}'.format(e))
+
+    def run_cascade(self, cheap_features: list = [0, 1, 0, 1], full_features: list = [1, 1, 1, 1],
+                    cheap_classifier: str = 'LogisticRegression', full_classifier: str = 'RandomForest',
+                    max_accuracy_loss: float = 0.01, sparse: bool = False):
+        try:
+            if self.granularity != 'document':
+                raise ValueError('The cascade featurizes whole documents, granularity must be document')
+            date_file = datetime.datetime.now().strftime("%Y-%m-%d")
+            print('***Clean data training')
+            x = [self.ta.clean_text(row['content'], stopwords=False) for row in tqdm(self.data)]
+            y = np.array([row['value'] for row in self.data], dtype=int)
+            print('***Get cheap training features')
+            x_cheap = self.features.transform_batch(x, cheap_features, sparse=sparse, progress=True, polarity=False)
+            print('***Get full training features')
+            x_full = self.features.transform_batch(x, full_features, sparse=sparse, progress=True)
+            cascade = CascadeClassifier(clone(self.classifiers[cheap_classifier]),
+                                        clone(self.classifiers[full_classifier]),
+                                        cheap_features=cheap_features, full_features=full_features,
+                                        max_accuracy_loss=max_accuracy_loss)
+            cascade.fit(x_cheap, x_full, y)
+            bundle = ModelBundle.save(cascade, name='hate_model_cascade_{0}'.format(self.lang), lang=self.lang,
+                                      schema=self.features.schema(full_features), sparse=sparse,
+                                      extra={'classifier': 'Cascade({0}, {1})'.format(cheap_classifier,
+                                                                                       full_classifier),
+                                             'cascade': cascade.training, 'date': date_file})
+            print('Cascade model bundle saved in {0}'.format(bundle.path_dir))
+            return cascade
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error run_cascade: {0}'.format(e))
+
+    def build_shards(self, name: str, type_features: list = [1, 1, 1, 1], sparse: bool = True,
+                     shard_size: int = 1000):
+        # Streams the corpus and featurizes it shard by shard
+        shards = FeatureShards(name).create(self.features.schema(type_features), sparse=sparse)
+        rows = []
+        for row in tqdm(self.reader.iter_data() if self.granularity == 'document' else self.reader.iter_tweets()):
+            rows.append(row)
+            if len(rows) == shard_size:
+                self.append_shard(shards, rows, type_features, sparse)
+                rows = []
+        if rows:
+            self.append_shard(shards, rows, type_features, sparse)
+        self.features.save_caches()
+        print('Feature shards: {0} shards, {1} rows in {2}'.format(len(shards), shards.n_rows, shards.path_dir))
+        return shards
+
+    def append_shard(self, shards: FeatureShards, rows: list, type_features: list, sparse: bool):
+        if self.granularity == 'tweet':
+            x = self.tweet_features.transform([row['tweets'] for row in rows], type_features, sparse=sparse)
+            return shards.append(x, [row['value'] for row in rows])
+        x = []
+        for row in rows:
+            with self.metrics.timer('clean_text'):
+                x.append(self.ta.clean_text(row['content'], stopwords=False))
+        x = self.features.transform_batch(x, type_features, sparse=sparse)
+        return shards.append(x, [row['value'] for row in rows])
+
+    def run_incremental(self, type_features: list = [1, 1, 1, 1], sparse: bool = True, shard_size: int = 1000,
+                        epochs: int = 5, test_size: float = 0.2, rebuild: bool = False):
+        try:
+            date_file = datetime.datetime.now().strftime("%Y-%m-%d")
+            # Keyed on the input as well: shards built from another file or dataset are never reused
+            name = 'training_{0}_{1}{2}_{3:08x}'.format(self.lang, ''.join(str(i) for i in type_features),
+                                                       '_tweet' if self.granularity == 'tweet' else '',
+                                                       zlib.crc32(self.corpus.encode('utf-8')))
+            if rebuild or not FeatureShards.exists(name):
+                print('***Get training feature shards')
+                shards = self.build_shards(name, type_features, sparse=sparse, shard_size=shard_size)
+            else:
+                shards = FeatureShards.load(name)
+                print('Feature shards: {0} shards, {1} rows in {2}'.format(len(shards), shards.n_rows,
+                                                                           shards.path_dir))
+            train, test = shards.split(test_size=test_size)
+            n_test = sum(len(rows) for _, rows in test)
+            if n_test == 0:
+                raise ValueError('No held-out rows in {0} rows, the learners cannot be compared'.format(
+                    shards.n_rows))
+            print('***Out-of-core training: {0} training rows, {1} held-out rows in {2} shards'.format(
+                shards.n_rows - n_test, n_test, len(shards)))
+            trainer = IncrementalTraining(epochs=epochs).fit(shards, train, test)
+            name_best, best_clf, scores = trainer.best()
+            print('Best classifier is {0} with Accuracy: {1}'.format(name_best, scores['accuracy']))
+            # Kept apart from the production hate_model_{lang} bundle
+            bundle = ModelBundle.save(best_clf, name='hate_model_{0}_incremental'.format(self.lang),
+                                      lang=self.lang, schema=shards.schema, sparse=shards.manifest['sparse'],
+                                      extra={'classifier': name_best, 'accuracy': scores['accuracy'],
+                                             'date': date_file, 'granularity': self.granularity,
+                                             'out_of_core': {'epochs': epochs, 'rows': shards.n_rows,
+                                                             'shards': len(shards), 'scores': scores}})
+            print('Model bundle saved in {0}'.format(bundle.path_dir))
+            return trainer
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error run_incremental: {0}'.format(e))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,222 @@
+import numpy as np
+import sklearn
+from scipy import sparse as sp
+from scipy.special import expit, softmax
+from sklearn.ensemble import RandomForestClassifier, ExtraTreesClassifier, BaggingClassifier, \
+    GradientBoostingClassifier
+from sklearn.tree import DecisionTreeClassifier
+
+
+class CompiledForest(object):
+    """
+    Tree ensemble flattened into packed NumPy arrays.
+
+    All the nodes of all the trees live in the same arrays (feature,
+    threshold, left, right, value) and a batch is evaluated level by level:
+    every (sample, tree) pair advances one node per step. Leaves point to
+    themselves, so after max_depth steps every pair sits on its leaf.
+    Leaf outputs are accumulated tree by tree in the order sklearn uses,
+    which keeps predictions bit-identical to clf.predict (for forests scored
+    with n_jobs=1, the only order sklearn itself guarantees).
+
+    Supported: DecisionTreeClassifier, RandomForestClassifier,
+    ExtraTreesClassifier, BaggingClassifier over decision trees and
+    GradientBoostingClassifier.
+    """
+    # Before 1.4 sklearn stored class counts in classifier leaves and normalized them at predict time
+    normalize_leaves = tuple(int(i) for i in sklearn.__version__.split('.')[:2]) < (1, 4)
+
+    def __init__(self, kind, classes, feature, threshold, left, right, missing_left, value, roots, depth,
+                 n_features, columns=None, learning_rate=1.0, init_raw=None, estimator=None, max_batch=None):
+        self.kind = kind
+        self.classes_ = classes
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.has_missing = bool(np.any(missing_left))
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.n_features = n_features
+        self.columns = columns
+        self.learning_rate = learning_rate
+        self.init_raw = init_raw
+        self.estimator = estimator
+        # Larger batches go back to the sklearn estimator (when attached), whose Cython loop wins there
+        self.max_batch = max_batch
+
+    @classmethod
+    def from_estimator(cls, clf, max_batch: int = None):
+        compiled = cls._compile(clf)
+        compiled.max_batch = max_batch
+        return compiled
+
+    @classmethod
+    def _compile(cls, clf):
+        if isinstance(clf, GradientBoostingClassifier):
+            return cls._from_gradient_boosting(clf)
+        if isinstance(clf, (RandomForestClassifier, ExtraTreesClassifier)):
+            trees = [(e.tree_, None, np.arange(len(clf.classes_))) for e in clf.estimators_]
+        elif isinstance(clf, BaggingClassifier):
+            trees = []
+            for e, features in zip(clf.estimators_, clf.estimators_features_):
+                if not isinstance(e, DecisionTreeClassifier):
+                    raise ValueError('Bagging over {0} can not be compiled'.format(type(e).__name__))
+                trees.append((e.tree_, np.asarray(features), np.asarray(e.classes_, dtype=np.intp)))
+        elif isinstance(clf, DecisionTreeClassifier):
+            trees = [(clf.tree_, None, np.arange(len(clf.classes_)))]
+        else:
+            raise ValueError('{0} can not be compiled'.format(type(clf).__name__))
+        n_classes = len(clf.classes_)
+        blocks = []
+        for tree, features, classes in trees:
+            if tree.n_outputs != 1:
+                raise ValueError('Multi-output trees can not be compiled')
+            value = tree.value[:, 0, :].astype(np.float64)
+            if cls.normalize_leaves:
+                normalizer = value.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                value = value / normalizer
+            full = np.zeros((tree.node_count, n_classes), dtype=np.float64)
+            full[:, classes] = value[:, :len(classes)]
+            blocks.append((tree, features, full))
+        return cls._pack('proba_mean', clf.classes_, blocks, clf.n_features_in_, estimator=clf)
+
+    @classmethod
+    def _from_gradient_boosting(cls, clf):
+        if not (clf.init_ == 'zero' or type(clf.init_).__name__ == 'DummyClassifier'):
+            raise ValueError('Gradient boosting with init={0} can not be compiled'.format(clf.init_))
+        init_raw = clf._raw_predict_init(np.zeros((1, clf.n_features_in_), dtype=np.float32))[0]
+        blocks, columns = [], []
+        n_stages, n_k = clf.estimators_.shape
+        for i in range(n_stages):
+            for k in range(n_k):
+                tree = clf.estimators_[i, k].tree_
+                blocks.append((tree, None, tree.value[:, 0, :1].astype(np.float64)))
+                columns.append(k)
+        return cls._pack('gradient_boosting', clf.classes_, blocks, clf.n_features_in_,
+                         columns=np.array(columns, dtype=np.intp), learning_rate=clf.learning_rate,
+                         init_raw=np.asarray(init_raw, dtype=np.float64), estimator=clf)
+
+    @classmethod
+    def _pack(cls, kind, classes, blocks, n_features, **kwargs):
+        sizes = [tree.node_count for tree, _, _ in blocks]
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+        total = int(np.sum(sizes))
+        feature = np.zeros(total, dtype=np.intp)
+        threshold = np.full(total, np.inf, dtype=np.float64)
+        left = np.arange(total, dtype=np.intp)
+        right = np.arange(total, dtype=np.intp)
+        missing_left = np.zeros(total, dtype=bool)
+        value = np.concatenate([v for _, _, v in blocks], axis=0)
+        depth = 0
+        for (tree, features, _), start in zip(blocks, offsets):
+            nodes = slice(start, start + tree.node_count)
+            split = tree.children_left != -1
+            tree_feature = np.where(split, tree.feature, 0)
+            feature[nodes] = tree_feature if features is None else features[tree_feature]
+            threshold[nodes] = np.where(split, tree.threshold, np.inf)
+            left[nodes] = np.where(split, tree.children_left + start, left[nodes])
+            right[nodes] = np.where(split, tree.children_right + start, right[nodes])
+            if hasattr(tree, 'missing_go_to_left'):
+                missing_left[nodes] = np.asarray(tree.missing_go_to_left, dtype=bool) & split
+            depth = max(depth, int(tree.max_depth))
+        return cls(kind, np.asarray(classes), feature, threshold, left, right, missing_left, value,
+                   offsets, depth, n_features, **kwargs)
+
+    def apply(self, x):
+        # Leaf index of every (sample, tree) pair. Pairs are kept in flat arrays and the ones
+        # that reached a leaf are dropped after each level, so the work follows the real path lengths.
+        n_samples, n_trees = x.shape[0], len(self.roots)
+        x_flat = x.ravel()
+        node = np.tile(self.roots, n_samples)
+        base = np.repeat(np.arange(n_samples, dtype=np.intp) * x.shape[1], n_trees)
+        active = np.flatnonzero(self.left[node] != node)
+        for _ in range(self.depth):
+            if len(active) == 0:
+                break
+            current = node[active]
+            values = x_flat[base[active] + self.feature[current]]
+            go_left = values <= self.threshold[current]
+            if self.has_missing:
+                go_left |= np.isnan(values) & self.missing_left[current]
+            current = np.where(go_left, self.left[current], self.right[current])
+            node[active] = current
+            active = active[self.left[current] != current]
+        return node.reshape(n_samples, n_trees)
+
+    def _check(self, x):
+        if sp.issparse(x):
+            x = x.toarray()
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        if x.ndim == 1:
+            x = x[np.newaxis, :]
+        if x.shape[1] != self.n_features:
+            raise ValueError('X has {0} features, the model expects {1}'.format(x.shape[1], self.n_features))
+        return x
+
+    def decision_function(self, x):
+        if self.kind != 'gradient_boosting':
+            raise AttributeError('decision_function is only available for gradient boosting')
+        leaves = self.apply(self._check(x))
+        raw = np.tile(self.init_raw, (leaves.shape[0], 1))
+        for t in range(leaves.shape[1]):
+            raw[:, self.columns[t]] += self.learning_rate * self.value[leaves[:, t], 0]
+        return raw.ravel() if raw.shape[1] == 1 else raw
+
+    def predict_proba(self, x):
+        if self._delegate(x):
+            return self.estimator.predict_proba(x)
+        if self.kind == 'gradient_boosting':
+            raw = self.decision_function(x)
+            if raw.ndim == 1:
+                proba = expit(raw)
+                return np.vstack([1 - proba, proba]).T
+            return softmax(raw, axis=1)
+        leaves = self.apply(self._check(x))
+        proba = np.zeros((leaves.shape[0], self.value.shape[1]), dtype=np.float64)
+        for t in range(leaves.shape[1]):
+            proba += self.value[leaves[:, t]]
+        proba /= leaves.shape[1]
+        return proba
+
+    def _delegate(self, x):
+        size = x.shape[0] if hasattr(x, 'shape') else len(x)
+        return self.estimator is not None and self.max_batch is not None and size > self.max_batch
+
+    def predict(self, x):
+        if self._delegate(x):
+            return self.estimator.predict(x)
+        if self.kind == 'gradient_boosting':
+            raw = self.decision_function(x)
+            loss = getattr(self.estimator, 'loss_', None)
+            if loss is not None and hasattr(loss, '_raw_prediction_to_decision'):
+                encoded = loss._raw_prediction_to_decision(raw.reshape(raw.shape[0], -1))
+            elif raw.ndim == 1:
+                encoded = (raw >= 0).astype(int)
+            else:
+                encoded = np.argmax(raw, axis=1)
+            return self.classes_.take(encoded, axis=0)
+        return self.classes_.take(np.argmax(self.predict_proba(x), axis=1), axis=0)
+
+    def export(self, file: str):
+        np.savez(file, kind=np.array(self.kind), classes=self.classes_, feature=self.feature,
+                 threshold=self.threshold, left=self.left, right=self.right, missing_left=self.missing_left,
+                 value=self.value, roots=self.roots, depth=np.array(self.depth),
+                 n_features=np.array(self.n_features),
+                 columns=self.columns if self.columns is not None else np.zeros(0, dtype=np.intp),
+                 learning_rate=np.array(self.learning_rate),
+                 init_raw=self.init_raw if self.init_raw is not None else np.zeros(0))
+        return file
+
+    @classmethod
+    def load(cls, file: str, mmap_mode: str = None):
+        data = np.load(file, mmap_mode=mmap_mode, allow_pickle=False)
+        kind = str(data['kind'])
+        return cls(kind, data['classes'], data['feature'], data['threshold'], data['left'], data['right'],
+                   data['missing_left'], data['value'], data['roots'], int(data['depth']), int(data['n_features']),
+                   columns=data['columns'] if kind == 'gradient_boosting' else None,
+                   learning_rate=float(data['learning_rate']),
+                   init_raw=data['init_raw'] if kind == 'gradient_boosting' else None)
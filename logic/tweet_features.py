@@ -0,0 +1,307 @@
+import sys
+from multiprocessing import Pool
+import numpy as np
+from nltk import TweetTokenizer
+from scipy import sparse as sp
+from logic.feature_schema import FeatureSchema
+from logic.lru_cache import LRUCache
+from logic.syllable_table import SyllableTable
+from logic.utils import Utils
+
+_tweet_features = None
+
+
+def _init_tweet_features(lang, quantized):
+    global _tweet_features
+    from logic.feature_extraction import FeatureExtraction
+    from logic.text_analysis import TextAnalysis
+    _tweet_features = TweetFeatures(FeatureExtraction(lang=lang, text_analysis=TextAnalysis(lang=lang),
+                                                      quantized=quantized))
+
+
+def _tweet_stats(batch):
+    return [_tweet_features.stats(tweet) for tweet in batch]
+
+
+class TweetFeatures(object):
+    """
+    Tweet level featurization pooled into author vectors.
+
+    Every cleaned tweet is reduced on its own (and cached) to additive
+    statistics: token and lexicon counts, POS counts, word length moments,
+    the polarity sum and concept count, syllable and phoneme vector sums
+    with their counts, and the syllable counts of the frequency block. The
+    rows of an author are summed with np.add.reduceat (a segment matrix
+    product for the sparse counts), and the author features are computed
+    from the sums with the formulas of FeatureExtraction, in the same
+    FeatureSchema layout as transform_batch.
+
+    Equivalence with the whole-document features of transform_batch on the
+    cleaned tweets joined by spaces:
+    - exact up to float rounding: counts, word length mean/skew/kurtosis,
+      syllable and phoneme embeddings, phoneme frequency, weighted position
+      (computed on the concatenated tokens);
+    - approximate: polarity, since a concept repeated in several tweets
+      counts once per tweet instead of once per author and spaCy chunks
+      every tweet apart; POS counts and syllables, tagged without the
+      context of the neighbouring tweets; lexical diversity, pooled from
+      the character sets of the tweets plus the joining spaces;
+    - an author whose tweets give no phonemes gets zeros instead of NaN.
+    equivalence() measures the difference per column group.
+    """
+    tags = ('mention', 'url', 'hashtag', 'emoji', 'rt')
+    lexicon = ['first_person_singular', 'second_person_singular', 'third_person_singular', 'first_person_plurar',
+               'second_person_plurar', 'third_person_plurar', 'adverb_neg', 'adverb_time', 'adverb_place',
+               'adverb_mode', 'adverb_cant', 'adjetives_neg', 'adjetives_pos', 'who_general', 'who_male',
+               'who_female', 'hate']
+    counts = ['tokens', 'label_mention', 'label_url', 'label_hashtag', 'label_emoji', 'label_retweets'] + lexicon + \
+             ['NOUN', 'VERB', 'ADJ', 'ANOTHER', 'length_n', 'length_1', 'length_2', 'length_3', 'length_4',
+              'polarity_sum', 'concepts', 'chars', 'syllables', 'phonemes']
+
+    def __init__(self, features, cache_size: int = 200000):
+        self.features = features
+        self.tokenizer = TweetTokenizer()
+        self.index = {name: i for i, name in enumerate(self.counts)}
+        self.syllable_size = features.syllable_embedding.vector_size
+        self.phoneme_size = features.phoneme_embedding.vector_size
+        self.cache = LRUCache(maxsize=cache_size, name='tweet_stats')
+        # Featurization pool kept between transform calls, see tweet_stats
+        self.pool = None
+        self.pool_key = None
+
+    @property
+    def width(self):
+        return len(self.counts) + self.syllable_size + self.phoneme_size
+
+    def stats(self, tweet: str, polarity: bool = True):
+        # (dense statistics, syllable indices, syllable counts, character set, tokens) of one cleaned tweet
+        fe = self.features
+        row = np.zeros(self.width, dtype=np.float64)
+        index = self.index
+        tokens = self.tokenizer.tokenize(tweet)
+        row[index['tokens']] = len(tokens)
+        for tag, name in zip(self.tags, ['label_mention', 'label_url', 'label_hashtag', 'label_emoji',
+                                         'label_retweets']):
+            row[index[name]] = sum(1 for word in tokens if word == tag)
+        for name in self.lexicon:
+            row[index[name]] = sum(1 for word in tokens if word in fe.lexical[name])
+        # One parse and one token list for the POS counts, the syllables and their frequency
+        doc = fe.parse(tweet)
+        tagged = fe.ta.tagger(tweet, doc=doc) or []
+        for token in tagged:
+            row[index[token['pos'] if token['pos'] in ('NOUN', 'VERB', 'ADJ') else 'ANOTHER']] += 1
+        lengths = np.array([len(word) for word in tokens if word not in self.tags], dtype=np.float64)
+        for k in range(5):
+            row[index['length_n'] + k] = np.sum(lengths ** k)
+        if polarity:
+            result = fe.lsn.polarity_text(text=tweet)
+            if result is not None:
+                row[index['polarity_sum']] = result['polarity_sum']
+                row[index['concepts']] = result['concepts']
+        chars = fe.diversity_text(tweet)
+        row[index['chars']] = len(chars)
+        start = len(self.counts)
+        table = fe.syllable_table
+        model = fe.syllable_embedding
+        hits, misses = table.hits, table.misses
+        num_syllables = 0
+        dict_count = {}
+        for token in tagged:
+            for s in token['syllables'] or []:
+                num_syllables += 1
+                position = table.row(s)
+                if position != SyllableTable.OOV:
+                    row[start:start + self.syllable_size] += model.wv[model.wv.index2word[position]]
+                    row[index['syllables']] += 1
+                    dict_count[position] = dict_count.get(position, 0) + 1
+        fe.metrics.add('syllables', num_syllables)
+        fe.metrics.cache('syllable_table', hits=table.hits - hits, misses=table.misses - misses)
+        start += self.syllable_size
+        model = fe.phoneme_embedding
+        phonemes = fe.trans_list(tweet)
+        row[index['phonemes']] = len(phonemes)
+        for phoneme in phonemes:
+            if phoneme in model.wv.vocab:
+                row[start:start + self.phoneme_size] += model.wv[phoneme]
+        indices = np.array(sorted(dict_count), dtype=np.int32)
+        counts = np.array([dict_count[i] for i in indices], dtype=np.int64)
+        return row, indices, counts, frozenset(chars), tokens
+
+    def tweet_stats(self, tweets: list, processes: int = 0, polarity: bool = True, lang: str = 'es',
+                    quantized: str = None):
+        # Statistics of every distinct tweet, from the cache or computed (in a pool with processes > 0)
+        result = {}
+        missing = []
+        for tweet in set(tweets):
+            value = self.cache.get((tweet, polarity))
+            if value is None:
+                missing.append(tweet)
+            else:
+                result[tweet] = value
+        hits = len(result)
+        if processes > 0 and polarity and len(missing) > processes:
+            batches = [missing[i:i + 256] for i in range(0, len(missing), 256)]
+            values = [value for batch in self.start_pool(processes, lang, quantized).imap(_tweet_stats, batches)
+                      for value in batch]
+        else:
+            values = [self.stats(tweet, polarity=polarity) for tweet in missing]
+        for tweet, value in zip(missing, values):
+            result[tweet] = self.cache.put((tweet, polarity), value)
+        self.features.metrics.cache('tweet_stats', hits=hits, misses=len(missing))
+        return result
+
+    def start_pool(self, processes: int, lang: str, quantized: str = None):
+        # The workers load spaCy and the embeddings once and are reused by every transform call
+        key = (processes, lang, quantized)
+        if self.pool is None or self.pool_key != key:
+            self.close()
+            self.pool = Pool(processes, initializer=_init_tweet_features, initargs=(lang, quantized))
+            self.pool_key = key
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+        self.pool = None
+        self.pool_key = None
+
+    @staticmethod
+    def segment_sum(x, starts: np.ndarray, n_rows: int):
+        # Sum of the rows of every segment; starts holds the first row of each segment (all non empty)
+        if sp.issparse(x):
+            lengths = np.diff(np.append(starts, n_rows))
+            segments = sp.csr_matrix((np.ones(n_rows, dtype=x.dtype), (np.repeat(np.arange(len(starts)), lengths),
+                                                                       np.arange(n_rows))),
+                                     shape=(len(starts), n_rows))
+            return segments @ x
+        return np.add.reduceat(x, starts, axis=0)
+
+    @staticmethod
+    def frequency(counts):
+        # Phoneme frequency of FeatureExtraction.frequency_counts from the summed syllable counts
+        counts.sort_indices()
+        data = counts.data
+        rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+        total = 1 + np.bincount(rows, weights=data * (data + 1) / 2, minlength=counts.shape[0])
+        values = data.astype(np.float32) / total[rows].astype(np.float32)
+        return sp.csr_matrix((values, counts.indices, counts.indptr), shape=counts.shape, dtype=np.float32)
+
+    @staticmethod
+    def moments(n: float, s1: float, s2: float, s3: float, s4: float):
+        # Mean, kurtosis (Fisher) and skewness of the word lengths from their power sums, 0.0 where undefined
+        if n == 0:
+            return 0.0, 0.0, 0.0
+        mean = s1 / n
+        m2 = s2 / n - mean ** 2
+        if m2 <= 1e-12 * max(1.0, mean ** 2):
+            return round(mean, 4), 0.0, 0.0
+        m3 = s3 / n - 3 * mean * s2 / n + 2 * mean ** 3
+        m4 = s4 / n - 4 * mean * s3 / n + 6 * mean ** 2 * s2 / n - 3 * mean ** 4
+        return round(mean, 4), round(m4 / m2 ** 2 - 3.0, 4), round(m3 / m2 ** 1.5, 4)
+
+    def lexical(self, t: np.ndarray, rows: list, polarity: bool = True):
+        # Lexical block of one author from its summed statistics t and its tweet rows, in FeatureSchema order
+        index = self.index
+        if t[index['tokens']] == 0:
+            return None
+        tokens = [token for row in rows for token in row[4]]
+        weighted_words, weighted_normalized = self.features.weighted_position(tokens)
+        chars = set().union(*[row[3] for row in rows])
+        n_chars = t[index['chars']] + len(rows) - 1
+        if len(rows) > 1:
+            chars.add(' ')
+        avg_word, kur_word, skew_word = self.moments(*t[index['length_n']:index['length_n'] + 5])
+        labels = [t[index[name]] for name in ['label_mention', 'label_url', 'label_hashtag', 'label_emoji',
+                                               'label_retweets']]
+        lexicon = [t[index[name]] for name in self.lexicon]
+        adverbs = lexicon[6:11]
+        vector = [round(t[index['polarity_sum']] / (1 + t[index['concepts']]), 3) if polarity else 0.0,
+                  weighted_words, weighted_normalized] + labels + \
+                 [round(len(chars) / n_chars, 4) if n_chars > 0 else 0.0, t[index['tokens']] - sum(labels)] + \
+                 lexicon[:6] + [avg_word, kur_word, skew_word] + adverbs + [sum(adverbs)] + lexicon[11:] + \
+                 [t[index['NOUN']] * 0.8, t[index['VERB']] * 0.5, t[index['ADJ']] * 0.4, t[index['ANOTHER']] * 0.1]
+        return np.array(vector, dtype=np.float64)
+
+    def fill(self, x, schema: FeatureSchema, authors: np.ndarray, totals: np.ndarray, lengths: np.ndarray,
+             rows: list, starts: np.ndarray, polarity: bool = True):
+        index = self.index
+        if schema.enabled('lexical'):
+            for k, i in enumerate(authors):
+                vector = self.lexical(totals[k], rows[starts[k]:starts[k] + lengths[k]], polarity=polarity)
+                if vector is not None:
+                    x[i, schema.slice('lexical')] = np.abs(vector)
+        start = len(self.counts)
+        if schema.enabled('syllable'):
+            sums = totals[:, start:start + self.syllable_size]
+            x[authors, schema.slice('syllable')] = np.abs(sums / (1 + totals[:, [index['syllables']]]))
+        start += self.syllable_size
+        if schema.enabled('phoneme'):
+            sums = totals[:, start:start + self.phoneme_size]
+            # The spaces joining the tweets of the whole document are phonemes too
+            size = totals[:, [index['phonemes']]] + (lengths[:, None] - 1) * len(self.features.trans_list(' '))
+            x[authors, schema.slice('phoneme')] = np.abs(np.divide(sums, size, out=np.zeros_like(sums),
+                                                                   where=size > 0))
+        return x
+
+    def equivalence(self, list_tweets: list, type_features: list = [1, 1, 1, 1], polarity: bool = True):
+        # Largest absolute difference per column against transform_batch on the joined cleaned tweets
+        ta = self.features.ta
+        joined = [' '.join(t for t in (ta.clean_text(tweet, stopwords=False) for tweet in tweets) if t is not None)
+                  for tweets in list_tweets]
+        x_document = self.features.transform_batch([i if i else None for i in joined], type_features,
+                                                   polarity=polarity)
+        x_tweets = self.transform(list_tweets, type_features, polarity=polarity)
+        schema = self.features.schema(type_features)
+        diff = np.nanmax(np.abs(x_document.astype(np.float64) - x_tweets), axis=0)
+        names = schema.names()
+        result = {'groups': {group: float(np.max(diff[schema.slice(group)])) for group in schema.offsets},
+                  'columns': {names[i]: float(diff[i]) for i in np.argsort(-diff) if diff[i] > 1e-4}}
+        return result
+
+    def transform(self, list_tweets: list, type_features: list = [1, 1, 1, 1], sparse: bool = False,
+                  polarity: bool = True, processes: int = 0, lang: str = 'es', quantized: str = None):
+        # list_tweets: per author the list of raw tweets; same rows and layout as transform_batch
+        try:
+            ta = self.features.ta
+            cleaned = [[t for t in (ta.clean_text(tweet, stopwords=False) for tweet in tweets) if t is not None]
+                       for tweets in list_tweets]
+            schema = self.features.schema(type_features)
+            x = schema.allocate(len(list_tweets), dense_only=sparse)
+            authors = np.array([i for i, tweets in enumerate(cleaned) if tweets], dtype=np.intp)
+            frequency = None
+            if len(authors) > 0:
+                flat = [tweet for i in authors for tweet in cleaned[i]]
+                lengths = np.array([len(cleaned[i]) for i in authors], dtype=np.intp)
+                starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+                stats = self.tweet_stats(flat, processes=processes, polarity=polarity, lang=lang, quantized=quantized)
+                rows = [stats[tweet] for tweet in flat]
+                totals = self.segment_sum(np.vstack([row[0] for row in rows]), starts, len(flat))
+                self.fill(x, schema, authors, totals, lengths, rows, starts, polarity)
+                if schema.enabled('frequency'):
+                    counts = sp.csr_matrix((np.concatenate([row[2] for row in rows]).astype(np.float64),
+                                            np.concatenate([row[1] for row in rows]),
+                                            np.concatenate([[0], np.cumsum([len(row[1]) for row in rows])])),
+                                           shape=(len(flat), schema.sizes['frequency']))
+                    frequency = self.frequency(self.segment_sum(counts, starts, len(flat)).tocsr())
+            if sparse:
+                result = sp.csr_matrix(x)
+                if schema.enabled('frequency'):
+                    if frequency is not None:
+                        # Rows of the authors with tweets moved to their position among all the authors
+                        block = sp.csr_matrix((frequency.data, frequency.indices, frequency.indptr),
+                                              shape=frequency.shape, dtype=np.float32)
+                        block = sp.csr_matrix((np.ones(len(authors), dtype=np.float32),
+                                               (authors, np.arange(len(authors)))),
+                                              shape=(len(list_tweets), len(authors))) @ block
+                    else:
+                        block = sp.csr_matrix((len(list_tweets), schema.sizes['frequency']), dtype=np.float32)
+                    result = sp.hstack([result, block], format='csr', dtype=np.float32)
+                return result
+            if frequency is not None:
+                x[authors, schema.slice('frequency')] = frequency.toarray()
+            return x
+        except Exception as e:
+            Utils.standard_error(sys.exc_info())
+            print('Error TweetFeatures transform: {0}'.format(e))
+            return None
@@ -6,4 +6,9 @@ DIR_INPUT = "{0}{1}input{1}".format(DIR_DATA, os.sep)
 DIR_OUTPUT = "{0}{1}output{1}".format(DIR_DATA, os.sep)
 DIR_MODELS = "{0}{1}models{1}".format(DIR_DATA, os.sep)
 DIR_LEXICON = "{0}{1}lexicon{1}".format(DIR_DATA, os.sep)
+DIR_BENCHMARK = "{0}{1}benchmark{1}".format(DIR_DATA, os.sep)
+DIR_METRICS = "{0}{1}metrics{1}".format(DIR_DATA, os.sep)
+DIR_CACHE = "{0}{1}cache{1}".format(DIR_DATA, os.sep)
+DIR_SHARDS = "{0}{1}shards{1}".format(DIR_DATA, os.sep)
+DIR_CHECKPOINTS = "{0}{1}checkpoints{1}".format(DIR_DATA, os.sep)
 DATA_BABEL = 'data.babel.data_'
@@ -0,0 +1,18 @@
+import pickle
+from logic.benchmark import Benchmark
+from logic.feature_extraction import FeatureExtraction
+from logic.synthetic_corpus import SyntheticCorpus
+from logic.text_analysis import TextAnalysis
+from root import DIR_MODELS
+
+lang = 'es'
+corpus = SyntheticCorpus(lang=lang, n_authors=50, n_tweets=200, tweet_length=15, seed=42)
+
+ta = TextAnalysis(lang=lang)
+fe = FeatureExtraction(lang=lang, text_analysis=ta)
+clf = pickle.load(open('{0}hate_model_{1}.pkl'.format(DIR_MODELS, lang), 'rb'))
+
+bench = Benchmark(lang=lang, features=fe, clf=clf, type_features=[1, 1, 1, 1])
+result = bench.run(corpus)
+Benchmark.report(result)
+print('Saved in {0}'.format(Benchmark.save(result)))
@@ -0,0 +1,69 @@
+import time
+import numpy as np
+from gensim.models import Word2Vec
+from sklearn.base import clone
+from sklearn.model_selection import StratifiedKFold, cross_val_score
+from logic.benchmark import Benchmark
+from logic.classifiers import Classifiers
+from logic.data_transformation import DataTransformation
+from logic.feature_extraction import FeatureExtraction
+from logic.quantized_embedding import QuantizedEmbedding
+from logic.synthetic_corpus import SyntheticCorpus
+from logic.text_analysis import TextAnalysis
+from root import DIR_EMBEDDING
+
+lang = 'es'
+n_authors = 100
+dtypes = ['float16', 'int8']
+min_seconds = 1.0
+
+try:
+    data = DataTransformation(dataset='pan21-author-profiling-training-2021-03-14', lang=lang).get_data()[:n_authors]
+except Exception as e:
+    print('Training corpus not available ({0}), using a synthetic corpus'.format(e))
+    data = SyntheticCorpus(lang=lang, n_authors=n_authors, n_tweets=50).get_data()
+ta = TextAnalysis(lang=lang)
+fe = FeatureExtraction(lang=lang, text_analysis=ta)
+x_text = [ta.clean_text(row['content'], stopwords=False) for row in data]
+y = np.array([row['value'] for row in data])
+cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
+clf = Classifiers.dict_classifiers['DecisionTree']
+rnd = np.random.RandomState(7)
+
+result = {'name': 'quantized_embedding_{0}'.format(lang), 'authors': len(data), 'embeddings': {}}
+for kind in ['syllable', 'phoneme']:
+    file_model = '{0}{1}_embedding_{2}.model'.format(DIR_EMBEDDING, kind, lang)
+    model = Word2Vec.load(file_model)
+    vectors = np.asarray(model.wv.vectors, dtype=np.float32)
+    # Pooling workload: documents of 200 tokens drawn from the vocabulary
+    documents = [[model.wv.index2word[i] for i in rnd.randint(0, len(vectors), 200)] for _ in range(200)]
+    reference = QuantizedEmbedding(model.wv.index2word, vectors, dtype='float32')
+    attribute = 'syllable_embedding' if kind == 'syllable' else 'phoneme_embedding'
+    type_features = [1, 0, 0, 0] if kind == 'syllable' else [0, 0, 1, 0]
+    rows = {}
+    for dtype in ['float32'] + dtypes:
+        embedding = reference if dtype == 'float32' else QuantizedEmbedding.from_model(model, dtype=dtype)
+        if dtype != 'float32':
+            embedding.save(QuantizedEmbedding.file_name(file_model, dtype))
+        times = []
+        start = time.perf_counter()
+        while time.perf_counter() - start < min_seconds or len(times) < 3:
+            times.append(Benchmark.timed(lambda: [embedding.pool(d) for d in documents])[1])
+        pooled = np.array([embedding.pool(d)[0] for d in documents])
+        expected = np.array([reference.pool(d)[0] for d in documents])
+        setattr(fe, attribute, embedding if dtype != 'float32' else model)
+        x = fe.transform_batch(x_text, type_features)
+        scores = cross_val_score(clone(clf), x, y, cv=cv, scoring='accuracy')
+        rows[dtype] = {'bytes': embedding.nbytes,
+                       'pooling': Benchmark.summary(times, n_items=len(documents) * len(times)),
+                       'max_abs_error': float(np.max(np.abs(pooled - expected))),
+                       'accuracy': round(float(np.mean(scores)), 4)}
+        print('{0:<9} {1:<8} {2:>12} bytes  pooling p50 {3:>9} ms  max error {4:.2e}  accuracy {5}'.format(
+            kind, dtype, rows[dtype]['bytes'], rows[dtype]['pooling']['p50_ms'], rows[dtype]['max_abs_error'],
+            rows[dtype]['accuracy']))
+    setattr(fe, attribute, model)
+    for dtype in dtypes:
+        rows[dtype]['memory_saved'] = round(1 - rows[dtype]['bytes'] / rows['float32']['bytes'], 4)
+        rows[dtype]['accuracy_delta'] = round(rows[dtype]['accuracy'] - rows['float32']['accuracy'], 4)
+    result['embeddings'][kind] = rows
+print('Saved in {0}'.format(Benchmark.save(result)))
@@ -0,0 +1,50 @@
+import pickle
+import time
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from logic.benchmark import Benchmark
+from logic.model_bundle import ModelBundle
+from logic.tree_compiler import CompiledForest
+from root import DIR_MODELS
+
+lang = 'es'
+name_model = 'hate_model_{0}'.format(lang)
+batch_sizes = [1, 10, 100, 1000, 10000]
+min_seconds = 1.0
+
+if ModelBundle.exists(name_model):
+    clf = ModelBundle.load(name_model).estimator
+else:
+    with open('{0}{1}.pkl'.format(DIR_MODELS, name_model), 'rb') as file:
+        clf = pickle.load(file)
+try:
+    compiled = CompiledForest.from_estimator(clf)
+except ValueError as e:
+    print('{0}, using a RandomForest trained on random data instead'.format(e))
+    rnd = np.random.RandomState(42)
+    x_train = rnd.rand(2000, getattr(clf, 'n_features_in_', 200)).astype(np.float32)
+    clf = RandomForestClassifier(n_estimators=100, random_state=42).fit(x_train, rnd.randint(0, 2, 2000))
+    compiled = CompiledForest.from_estimator(clf)
+if hasattr(clf, 'n_jobs'):
+    clf.n_jobs = 1
+compiled.export('{0}{1}_compiled.npz'.format(DIR_MODELS, name_model))
+
+rnd = np.random.RandomState(7)
+result = {'name': 'tree_compiler_{0}'.format(lang), 'estimator': type(clf).__name__,
+          'n_nodes': int(len(compiled.feature)), 'n_trees': int(len(compiled.roots)), 'depth': compiled.depth,
+          'batches': {}}
+for size in batch_sizes:
+    x = rnd.rand(size, compiled.n_features).astype(np.float32)
+    identical = bool(np.array_equal(clf.predict(x), compiled.predict(x)))
+    row = {'identical': identical}
+    for name, predict in [('sklearn', clf.predict), ('compiled', compiled.predict)]:
+        times = []
+        start = time.perf_counter()
+        while time.perf_counter() - start < min_seconds or len(times) < 3:
+            times.append(Benchmark.timed(predict, x)[1])
+        row[name] = Benchmark.summary(times, n_items=size * len(times))
+    row['speedup_p50'] = round(row['sklearn']['p50_ms'] / row['compiled']['p50_ms'], 2)
+    result['batches'][size] = row
+    print('Batch {0:>6}: sklearn p50 {1:>10} ms  compiled p50 {2:>10} ms  speedup {3:>6}  identical {4}'.format(
+        size, row['sklearn']['p50_ms'], row['compiled']['p50_ms'], row['speedup_p50'], identical))
+print('Saved in {0}'.format(Benchmark.save(result)))
@@ -0,0 +1,27 @@
+from tqdm import tqdm
+from logic.data_transformation import DataTransformation
+from logic.feature_extraction import FeatureExtraction
+from logic.syllable_table import SyllableTable
+from logic.text_analysis import TextAnalysis
+from root import DIR_CACHE
+
+lang = 'es'
+dataset = 'pan21-author-profiling-training-2021-03-14'
+
+
+def corpus_syllables(ta, rows):
+    for row in tqdm(rows):
+        tweets = [ta.clean_text(i) for i in row['content'].split('\n')]
+        for doc in ta.nlp.pipe([i for i in tweets if i is not None]):
+            for token in doc:
+                if token._.syllables is not None:
+                    yield from token._.syllables
+
+
+ta = TextAnalysis(lang=lang)
+fe = FeatureExtraction(lang=lang, text_analysis=ta)
+table = fe.syllable_table
+table.build(SyllableTable.inventory_cache('{0}syllables_{1}.json'.format(DIR_CACHE, lang)))
+table.build(corpus_syllables(ta, DataTransformation(dataset=dataset, lang=lang).iter_data()))
+fe.save_caches()
+print('Saved in {0}'.format(table.file))
@@ -1,5 +1,6 @@
 from logic.hate_models import HateModels
 
-tm = HateModels(lang='en', name_model='hate_model_en',
-                dataset='pan21-author-profiling-test-without-gold')
-tm.run(type_features=[1, 1, 1, 1])
\ No newline at end of file
+if __name__ == '__main__':
+    tm = HateModels(lang='en', name_model='hate_model_en',
+                    dataset='pan21-author-profiling-test-without-gold')
+    tm.run(type_features=[1, 1, 1, 1], processes=4)
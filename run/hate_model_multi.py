@@ -0,0 +1,6 @@
+from logic.multi_language import MultiLanguageRunner
+
+if __name__ == '__main__':
+    runner = MultiLanguageRunner(langs=['es', 'en'], name_model='hate_model_{0}',
+                                 dataset='pan21-author-profiling-test-without-gold', processes=4)
+    runner.run()
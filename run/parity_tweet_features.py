@@ -0,0 +1,22 @@
+import json
+from itertools import islice
+from logic.data_transformation import DataTransformation
+from logic.feature_extraction import FeatureExtraction
+from logic.synthetic_corpus import SyntheticCorpus
+from logic.text_analysis import TextAnalysis
+from logic.tweet_features import TweetFeatures
+
+# Tweet level features pooled per author against the whole-document features of transform_batch.
+# Groups and columns over 1e-4 are listed; the expected differences are described in TweetFeatures.
+lang = 'es'
+n_authors = 20
+
+try:
+    data = DataTransformation(dataset='pan21-author-profiling-training-2021-03-14', lang=lang)
+    list_tweets = [row['tweets'] for row in islice(data.iter_tweets(), n_authors)]
+except Exception as e:
+    print('Training corpus not available ({0}), using a synthetic corpus'.format(e))
+    list_tweets = [tweets for _, tweets, _ in SyntheticCorpus(lang=lang, n_authors=n_authors, n_tweets=20).authors()]
+ta = TextAnalysis(lang=lang)
+features = TweetFeatures(FeatureExtraction(lang=lang, text_analysis=ta))
+print(json.dumps(features.equivalence(list_tweets, [1, 1, 1, 1]), indent=2))
@@ -0,0 +1,47 @@
+import argparse
+import sys
+from logic.scoring_shards import ScoringShards
+
+# python -m run.scoring_shards plan --lang es --shards 8
+# python -m run.scoring_shards run --lang es --shard 3 --processes 4   (one per node or process)
+# python -m run.scoring_shards status --lang es
+# python -m run.scoring_shards merge --lang es --consolidated jsonl
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sharded batch scoring')
+    parser.add_argument('command', choices=['plan', 'run', 'status', 'merge'])
+    parser.add_argument('--lang', default='es')
+    parser.add_argument('--dataset', default='pan21-author-profiling-test-without-gold')
+    parser.add_argument('--model', default=None)
+    parser.add_argument('--path', default=None, help='shard directory, on a shared filesystem for several nodes')
+    parser.add_argument('--shards', type=int, default=4, help='number of shards to plan')
+    parser.add_argument('--shard', type=int, nargs='*', default=None, help='shards to run, all pending by default')
+    parser.add_argument('--processes', type=int, default=0)
+    parser.add_argument('--force', action='store_true',
+                        help='run the shards again even if done, plan over done or claimed shards')
+    parser.add_argument('--consolidated', choices=['jsonl', 'csv'], default=None)
+    args = parser.parse_args()
+
+    shards = ScoringShards(lang=args.lang, dataset=args.dataset, name_model=args.model, path_dir=args.path)
+    if args.command == 'plan':
+        sys.exit(0 if shards.plan(args.shards, force=args.force) is not None else 1)
+    elif args.command == 'run':
+        pending = args.shard if args.shard else shards.pending()
+        model = None
+        if pending:
+            from logic.hate_models import HateModels
+            model = HateModels(lang=args.lang, name_model=shards.name_model, dataset=args.dataset)
+        done = {i: shards.run_shard(i, processes=args.processes, force=args.force, model=model) for i in pending}
+        failed = [i for i, result in done.items() if result is False]
+        claimed = [i for i, result in done.items() if result is None]
+        if claimed:
+            print('Shards run by other workers: {0}'.format(claimed))
+        if failed:
+            print('Failed shards: {0}'.format(failed))
+        sys.exit(1 if failed else 0)
+    elif args.command == 'status':
+        status = shards.status()
+        print('{0} of {1} shards done, pending: {2}, running: {3}'.format(
+            sum(status.values()), len(status), shards.pending(), shards.claims()))
+    else:
+        sys.exit(0 if shards.merge(consolidated=args.consolidated) is not None else 1)
@@ -0,0 +1,5 @@
+from logic.training_models import TrainModels
+
+# Successive-halving search over Classifiers.param_spaces with a one hour budget
+tm = TrainModels(lang='es', fold=10, dataset='pan21-author-profiling-training-2021-03-14')
+tm.search(type_features=[1, 1, 1, 1], sparse=True, n_candidates=10, factor=3, time_budget=3600)
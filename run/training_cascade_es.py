@@ -0,0 +1,6 @@
+from logic.training_models import TrainModels
+
+# Cheap stage: frequency phoneme + lexical (without SenticNet polarity), full stage: L, S, F, P
+tm = TrainModels(lang='es', iteration=10, fold=10,
+                 dataset='pan21-author-profiling-training-2021-03-14')
+tm.run_cascade(cheap_features=[0, 1, 0, 1], full_features=[1, 1, 1, 1], max_accuracy_loss=0.01, sparse=True)
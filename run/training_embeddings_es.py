@@ -0,0 +1,5 @@
+from logic.embedding_training import EmbeddingTraining
+
+if __name__ == '__main__':
+    et = EmbeddingTraining(lang='es', dataset='pan21-author-profiling-training-2021-03-14')
+    et.run(update=False)
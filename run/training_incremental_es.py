@@ -0,0 +1,5 @@
+from logic.training_models import TrainModels
+
+# Out-of-core training: feature shards on disk and partial_fit learners
+tm = TrainModels(lang='es', dataset='pan21-author-profiling-training-2021-03-14')
+tm.run_incremental(type_features=[1, 1, 1, 1], sparse=True, shard_size=1000, epochs=5)
@@ -0,0 +1,50 @@
+import unittest
+from logic.synthetic_corpus import SyntheticCorpus
+
+try:
+    from logic.text_analysis import TextAnalysis
+except ImportError as e:
+    TextAnalysis = None
+    missing = str(e)
+
+
+class SyntaxPatternsTest(unittest.TestCase):
+    """
+    syntax_patterns walks the per-sentence parses once and must give exactly the
+    dicts of syntax_patterns_legacy: same keys, values and insertion order.
+    """
+    texts = {
+        'es': ['El gobierno malo no hace nada por la gente. Los políticos corruptos roban al país pobre.',
+               'Odio a esos hombres tontos de la política. Muy muy triste la vida del pueblo!',
+               'Mi amigo Juan compró una casa grande en Madrid con su mujer alegre.'],
+        'en': ['The stupid government does nothing for the people. Corrupt politicians steal from the poor country.',
+               'I hate those ugly men of politics. Very very sad life for the town!',
+               'My friend John bought a big house in London with his happy wife.'],
+    }
+
+    def check(self, lang: str):
+        if TextAnalysis is None:
+            self.skipTest('text analysis dependencies not installed: {0}'.format(missing))
+        ta = TextAnalysis(lang=lang)
+        if ta.nlp is None:
+            self.skipTest('spaCy model for {0} not installed'.format(lang))
+        corpus = SyntheticCorpus(lang=lang, n_authors=5, n_tweets=20).get_data()
+        tweets = [ta.clean_text(tweet) for row in corpus for tweet in row['content'].split('\n')]
+        texts = self.texts[lang] + [i for i in tweets if i is not None]
+        for text in texts:
+            legacy = ta.syntax_patterns_legacy(text)
+            result = ta.syntax_patterns(text)
+            self.assertIsNotNone(result, text)
+            self.assertEqual(result, legacy, text)
+            self.assertEqual([list(v.items()) for v in result.values()],
+                             [list(v.items()) for v in legacy.values()], text)
+
+    def test_parity_es(self):
+        self.check('es')
+
+    def test_parity_en(self):
+        self.check('en')
+
+
+if __name__ == '__main__':
+    unittest.main()
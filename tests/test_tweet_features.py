@@ -0,0 +1,87 @@
+import unittest
+from logic.synthetic_corpus import SyntheticCorpus
+
+try:
+    import numpy as np
+    from logic.feature_extraction import FeatureExtraction
+    from logic.feature_schema import FeatureSchema
+    from logic.text_analysis import TextAnalysis
+    from logic.tweet_features import TweetFeatures
+except ImportError as e:
+    TweetFeatures = None
+    missing = str(e)
+
+
+class TweetFeaturesTest(unittest.TestCase):
+    """
+    TweetFeatures.transform against transform_batch on the cleaned tweets joined by spaces,
+    for the columns its docstring gives as exact up to float rounding.
+    """
+    # Polarity, lexical diversity and the POS counts are only approximate
+    approximate = ['plarity', 'lexical_diversity', 'noun', 'verb', 'adj', 'pos_others']
+    tolerance = 1e-4
+
+    @classmethod
+    def setUpClass(cls):
+        cls.features = None
+        if TweetFeatures is None:
+            return
+        ta = TextAnalysis(lang='es')
+        if ta.nlp is None:
+            return
+        features = FeatureExtraction(lang='es', text_analysis=ta)
+        if hasattr(features, 'phoneme_cache'):
+            cls.features = TweetFeatures(features)
+
+    def setUp(self):
+        if TweetFeatures is None:
+            self.skipTest('feature extraction dependencies not installed: {0}'.format(missing))
+        if self.features is None:
+            self.skipTest('spaCy model or embeddings for es not available')
+
+    def list_tweets(self):
+        authors = [tweets for _, tweets, _ in SyntheticCorpus(lang='es', n_authors=8, n_tweets=12).authors()]
+        # One tweet, repeated tweets and tweets made only of markers
+        return authors + [['El gobierno malo no hace nada por la gente'], ['odio odio odio'] * 3,
+                          ['#USER# https://t.co/abc123', 'RT #HASHTAG# la casa grande']]
+
+    def compare(self, type_features: list, sparse: bool = False):
+        list_tweets = self.list_tweets()
+        ta = self.features.features.ta
+        joined = [' '.join(t for t in (ta.clean_text(tweet, stopwords=False) for tweet in tweets) if t is not None)
+                  for tweets in list_tweets]
+        x_document = self.features.features.transform_batch([i if i else None for i in joined], type_features,
+                                                            sparse=sparse, polarity=False)
+        x_tweets = self.features.transform(list_tweets, type_features, sparse=sparse, polarity=False)
+        self.assertIsNotNone(x_tweets)
+        if sparse:
+            x_document, x_tweets = x_document.toarray(), x_tweets.toarray()
+        self.assertEqual(x_document.shape, x_tweets.shape)
+        schema = self.features.features.schema(type_features)
+        for group in schema.offsets:
+            start, end = schema.offsets[group]
+            columns = np.arange(start, end)
+            if group == 'lexical':
+                columns = [start + i for i, name in enumerate(FeatureSchema.lexical_names)
+                           if name not in self.approximate]
+            expected = x_document[:, columns].astype(np.float64)
+            result = x_tweets[:, columns].astype(np.float64)
+            # An author without phonemes gets zeros instead of NaN
+            known = ~np.isnan(expected)
+            np.testing.assert_allclose(result[known], expected[known], rtol=self.tolerance, atol=self.tolerance,
+                                       err_msg='group {0}'.format(group))
+
+    def test_all_groups(self):
+        self.compare([1, 1, 1, 1])
+
+    def test_all_groups_sparse(self):
+        self.compare([1, 1, 1, 1], sparse=True)
+
+    def test_single_groups(self):
+        for type_features in ([1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]):
+            with self.subTest(type_features=type_features):
+                self.compare(type_features)
+
+
+if __name__ == '__main__':
+    unittest.main()